@@ -0,0 +1,88 @@
+"""Batch-level reading for datasets kept on disk. Datasets read a whole batch of examples at once
+instead of one example per index, and a background thread reads batches ahead of training."""
+import queue
+import threading
+
+import numpy as np
+from arcadian.dataset import Dataset
+
+
+class BatchReadDataset(Dataset):
+    """Dataset which reads whole batches with read_batch(indices). Subclasses implement read_batch,
+    e.g. with cic.datasets.storage.read_rows, and __getitem__ and __len__ as usual."""
+
+    def read_batch(self, indices):
+        """Returns: dictionary mapping each feature name to a numpy array of the examples at indices,
+        in the order of indices."""
+        raise NotImplementedError()
+
+    def generate_batches(self, batch_size, shuffle=True, prefetch_batches=2, seed=None):
+        """Generate batches of examples, read with read_batch() by a background thread that stays up
+        to prefetch_batches batches ahead.
+
+        Arguments:
+            - batch_size: maximum number of examples per batch
+            - shuffle: if True, batch examples in a random order
+            - prefetch_batches: number of batches read ahead (0 to read each batch when it is requested)
+            - seed: seed of the random order (None for a different order every time)
+
+        Returns: generator of dictionaries mapping each feature name to a batch of values."""
+        if shuffle:
+            indices = np.random.RandomState(seed).permutation(len(self))
+        else:
+            indices = np.arange(len(self))
+        batches = (self.read_batch(indices[start:start + batch_size]) for start in range(0, len(indices), batch_size))
+        return prefetch(batches, prefetch_batches) if prefetch_batches else batches
+
+
+class _Raised:
+    """Exception raised by the prefetch thread, to be raised again in the consuming thread."""
+    def __init__(self, error):
+        self.error = error
+
+
+_END = object()  # marks the end of prefetched items
+
+
+def prefetch(iterable, queue_size=2):
+    """Iterate over iterable in a background thread, which stays up to queue_size items ahead of the
+    consumer. Exceptions raised while producing items are raised again by the consumer, and the thread
+    stops when the consumer stops iterating.
+
+    Returns: generator of the items of iterable."""
+    items = queue.Queue(maxsize=max(1, queue_size))
+    stopped = threading.Event()
+
+    def put(item):
+        """Put item in the queue, waiting for room unless the consumer stopped. Returns False if it did."""
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as error:
+            put(_Raised(error))
+            return
+        put(_END)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _END:
+                return
+            if isinstance(item, _Raised):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
@@ -1,23 +1,83 @@
 """Toronto Book Corpus implemented as a subclass of StringDataset."""
-from cic.datasets.text_dataset import TextDataset
+from cic.datasets.text_dataset import TextDataset, chunk_iterable, merge_dictionaries, read_spool, \
+    tokenize_string, within_length_limits
+from cic.datasets.preprocessing_cache import file_source_id, load_manifest, save_manifest
+from cic.datasets.sentence_index import SentenceHashIndex, sentence_hashes
+from cic.datasets.sentence_filters import SentenceFilter, no_adjacent_duplicate_words, normalize_whitespace, \
+    only_letters_and
+from cic.datasets.batch_reading import BatchReadDataset
+from cic.datasets.splits import persisted_split
+from cic.datasets.storage import GrowableDataset, RaggedArray, as_padded_or_ragged, read_rows, shuffle_rows_on_disk
+from cic.utils.token_tools import token_dtype, widen_tokens
+from cic.datasets.vocabulary import Vocabulary, load_legacy_vocabulary
 import cic.paths
+import collections
+import itertools
+import multiprocessing
 import os
-import h5py
 import pickle
-from arcadian.dataset import Dataset
-import random
+import tempfile
+import gensim
+import h5py
+import numpy as np
 
-class TorontoBookCorpus(Dataset):
+class TorontoBookCorpus(BatchReadDataset):
     def __init__(self, max_s_len, result_path, max_num_s=None, max_part_len=100000,
                  stop_token='<STOP>', regenerate=False, vocab=None, load_to_mem=True,
-                 second_file_first=False, max_vocab_len=None, shuffle=True, **kwargs):
+                 second_file_first=False, max_vocab_len=None, shuffle=True, ragged=False, sharded=False,
+                 num_workers=1, num_shards=None, seed=None, shuffle_block_len=1000000,
+                 chunk_len=1024, compression=None, resume=False, deduplicate=False, **kwargs):
         """Book Corpus provided by Toronto University, with approx. 70 million sentences. Contains
         a single feature 'message' of numpy encoded sentences. Sentences are filtered for min and
         max lengths, and sentences containing non-alphabetical non-period characters are removed.
-        If loading entire dataset be sure to set load_to_mem=False so as to keep the full dataset on disk."""
-
+        If loading entire dataset be sure to set load_to_mem=False so as to keep the full dataset on disk.
+
+        If ragged is True, sentences are saved without padding as a flat 'tokens' array plus 'offsets' into it,
+        and the dataset is kept as a RaggedArray which pads sentences when they are indexed. Otherwise sentences
+        are saved as a padded 'messages' matrix. Saved results of either format can be loaded either way.
+
+        The vocabulary is counted over all sentences read before any sentence is encoded, and max_num_s limits
+        the number of lines kept by the sentence filter that are read. Sequentially, the words of the corpus
+        files are counted in a first pass, and the corpus is then read again in partitions of max_part_len
+        sentences, tokenized by num_workers processes and written. If sharded is True, the corpus files are split
+        into num_shards byte ranges (4 per worker by default). Worker processes read, filter, count and tokenize
+        each shard, the counts of all shards are merged into one vocabulary, and shards are then encoded and
+        written in order. No more shards are read once max_num_s sentences are. Results are identical for any
+        max_part_len, and for sequential and sharded builds with any number of shards and workers.
+
+        Sentences are shuffled with seed (None for a random order) if shuffle is True. The shuffle runs on disk
+        holding about shuffle_block_len sentences in memory at a time, and saves the permutation it applied
+        as 'shuffle_order' (see cic.datasets.storage.shuffle_rows_on_disk).
+
+        Saved datasets are chunked chunk_len sentences at a time (ragged tokens in chunks of the same number of
+        bytes as padded ones), so contiguous batches of sentences are read a few chunks at a time. compression may
+        be 'lzf' (fast) or 'gzip' (smaller), applied after the HDF5 shuffle filter. Datasets grow geometrically as
+        partitions are written and are trimmed at the end. The vocabulary is complete before any sentence is
+        written, so tokens are written in the narrowest unsigned dtype which holds it (uint16 for fewer than 65536
+        words), and widened to int32 when sentences are read.
+
+        After each partition, sequential ingest commits a manifest (ingest_manifest.json) of the sentences written,
+        the position reached in the corpus files and a snapshot of the vocabulary. If resume is True and an earlier
+        ingest with the same settings was interrupted, ingest continues from its last committed partition instead
+        of starting over. Results are only loaded once the manifest marks them complete.
+
+        If deduplicate is True, sequential ingest keeps only the first occurrence of each sentence, and saves the
+        64-bit hashes of the sentences kept as a sorted index (see load_sentence_index). Duplicates are dropped
+        a partition at a time, so with max_num_s the dataset may hold slightly fewer sentences.
+
+        With load_to_mem=False, generate_batches() reads each batch of sentences from disk with a few slice
+        reads (see read_batch) in a background thread, which stays prefetch_batches batches ahead. Sentences are
+        already shuffled on disk, so generate_batches(shuffle=False) reads whole runs of sentences at a time.
+
+        split() with a seed saves the indices of its split in result_path (see cic.datasets.splits), so later runs
+        load the same train/validation split instead of computing it again."""
+
+        self.result_path = result_path
         self.stop_token = stop_token
         self.max_num_s = max_num_s
+        self.ragged = ragged
+        self.sentence_filter = book_corpus_filter()  # counts the sentences each filter rule rejected
+        self.num_duplicates = 0  # number of duplicate sentences dropped when deduplicating
 
         if not os.path.exists(result_path):
             os.makedirs(result_path)
@@ -25,140 +85,78 @@ class TorontoBookCorpus(Dataset):
         # Dataset is contained in two .txt files, and is way too big to store on disk
         # We partition dataset into subsets, process each one using a string dataset,
         # and save all to an h5py file.
-        strings = []
-
         data_path = os.path.join(result_path, 'data.hdf5')
-        vocab_path = os.path.join(result_path, 'vocab.pkl')
+        vocab_path = os.path.join(result_path, 'vocab.npz')
+        manifest = load_manifest(os.path.join(result_path, 'ingest_manifest.json'))
 
-        results_exist = (os.path.isfile(data_path) and os.path.isfile(vocab_path))
+        # Results of an ingest that was interrupted are incomplete, even if an old vocabulary is present.
+        # Results saved before ingest manifests have a pickled vocabulary, which is migrated when loaded
+        legacy_vocab_path = os.path.join(result_path, 'vocab.pkl')
+        results_exist = (os.path.isfile(data_path) and (manifest is None or manifest['stage'] == 'complete')
+                         and (os.path.isfile(vocab_path) or (manifest is None and os.path.isfile(legacy_vocab_path))))
 
         if not results_exist or regenerate:
 
-            # Open dataset file for storing numpy sentences
-            self.dataset_file = h5py.File(data_path, 'w')
-
-            # Count lines in file
-            def file_len(fname):
-                with open(fname) as f:
-                    for i, l in enumerate(f):
-                        pass
-                return i + 1
-
-            p1_num_lines = file_len(cic.paths.BOOK_CORPUS_P1)
-            p2_num_lines = file_len(cic.paths.BOOK_CORPUS_P2)
-            num_lines = p1_num_lines + p2_num_lines
-
-            if max_s_len is not None:
-                num_lines = min(num_lines, max_num_s)
-
-            print('Number of sentences: %s' % num_lines)
-
-            print('Max number of sentences: %s' % max_num_s)
-
-            data = self.dataset_file.create_dataset('messages', (1, max_s_len), maxshape=(num_lines, max_s_len), dtype='i')
-
-            assert 'messages' in self.dataset_file
-
-            def readfiles(filenames):
-                for f in filenames:
-                    with open(f) as file:
-                        for line in file:
-                            yield line
-
-            nlp = None
-            num_read_s = 0  # number of sentences read and converted
-
             # This makes it easy to create a validation set using the second file.
             if second_file_first:
                 files_to_read = [cic.paths.BOOK_CORPUS_P2, cic.paths.BOOK_CORPUS_P1]
             else:
                 files_to_read = [cic.paths.BOOK_CORPUS_P1, cic.paths.BOOK_CORPUS_P2]
 
-            for line in readfiles(files_to_read):
-
-                line_tokens = line.split()
-                line = ' '.join(line_tokens)
-
-                accept = True
-
-                # Any filtering of strings goes here.
-
-                # Sentences can only contain letters and periods
-                for c in line:
-                    if not c.isalpha() and c != ' ' and c != '.':
-                        accept = False
-
-                # Remove sentences with duplicate adjacent words
-                for index in range(len(line_tokens) - 1):
-                    if line_tokens[index] == line_tokens[index+1]:
-                        accept = False
-
-                if accept:
-                    strings.append(line)
-                else:
-                    continue
-
-                # Quit when max_num_s strings are read
-                if max_num_s is not None and num_read_s + len(strings) >= max_num_s:
-                    print('break')
-                    break
-
-                if len(strings) >= max_part_len:
-                    print('Number of examples previously read: %s' % num_read_s)
-
-                    converter = TextDataset(strings, max_s_len, result_save_path=None, regenerate=True,
-                                            token_to_id=vocab, update_vocab=True, stop_token=stop_token,
-                                            nlp=nlp, max_vocab_len=max_vocab_len, **kwargs)
-
-                    # Check that previous words still have the same indices
-                    if vocab is not None:
-                        for key in vocab:
-                            assert vocab[key] == converter.token_to_id[key]
-
-                    # Grab modified vocabulary, keep updating it
-                    vocab = converter.token_to_id
+            # Everything that affects the sentences written. A run can only be resumed with the same settings
+            settings = {name: repr(value) for name, value in sorted(kwargs.items())}
+            settings.update(sources=[file_source_id(filename) for filename in files_to_read], max_s_len=max_s_len,
+                            max_num_s=max_num_s, max_part_len=max_part_len, stop_token=stop_token,
+                            vocab=None if vocab is None else len(vocab), max_vocab_len=max_vocab_len, ragged=ragged,
+                            deduplicate=deduplicate)
+
+            resumed = resume and not regenerate and not sharded and _Ingest.resumable(result_path, manifest)
+            if resumed and manifest['settings'] != settings:
+                raise ValueError('Cannot resume ingest in %s, it was started with different settings. '
+                                 'Pass regenerate=True to start over.' % result_path)
+            if deduplicate and sharded:
+                raise ValueError('Deduplication is only supported by sequential ingest, not with sharded=True')
+
+            # A previous vocabulary must not pass for results of this ingest until it completes
+            for old_vocab_path in [vocab_path, legacy_vocab_path]:
+                if os.path.isfile(old_vocab_path):
+                    os.remove(old_vocab_path)
 
-                    # Grab tokenizer to save time
-                    nlp = converter.nlp
-
-                    # We converted one batch of strings, get ready for the next
-                    strings = []
-
-                    # Write to dataset
-                    data.resize(num_read_s + len(converter), axis=0)
-                    data[num_read_s:num_read_s+len(converter), :] = converter.np_messages
-
-
-                    # Switch to next partition
-                    num_read_s += len(converter)
-
-            # Move remaining examples
-            converter = TextDataset(strings, max_s_len, result_save_path=None, regenerate=True,
-                                    token_to_id=vocab, update_vocab=True, stop_token=stop_token,
-                                    nlp=nlp, **kwargs)
-
-            # Check that previous words still have the same indices
-            if vocab is not None:
-                for key in vocab:
-                    assert vocab[key] == converter.token_to_id[key]
-
-            vocab = converter.token_to_id
+            print('Max number of sentences: %s' % max_num_s)
 
-            # Save vocab
-            self.vocab = vocab
-            with open(vocab_path, 'wb') as f:
-                pickle.dump(vocab, f)
+            # Open dataset file for storing numpy sentences
+            ingest = _Ingest(h5py.File(data_path, 'r+' if resumed else 'w'), result_path, settings,
+                             self.sentence_filter, max_s_len, ragged, deduplicate, chunk_len, compression,
+                             manifest if resumed else None)
+            if not resumed:
+                # A provided vocabulary is copied once so the caller's is left as is
+                if vocab is not None:
+                    ingest.vocab = vocab.copy() if isinstance(vocab, Vocabulary) else Vocabulary.from_dict(vocab)
+                ingest.commit('counting')
+
+            if sharded:
+                self._ingest_shards(ingest, files_to_read, max_s_len, max_num_s, stop_token, max_vocab_len,
+                                    num_workers, num_shards, result_path, kwargs)
+            else:
+                self._ingest_partitions(ingest, files_to_read, max_s_len, max_num_s, max_part_len, stop_token,
+                                        max_vocab_len, num_workers, kwargs)
 
-            data.resize(num_read_s + len(converter), axis=0)
-            data[num_read_s:num_read_s + len(converter), :] = converter.np_messages
+            print(self.sentence_filter.report())
+            self.num_duplicates = ingest.num_duplicates
+            if deduplicate:
+                print('Dropped %s duplicate sentences' % self.num_duplicates)
 
-            assert data.shape[0] == num_read_s + len(converter)
+            # Cut datasets down to the sentences written
+            ingest.trim()
 
             if shuffle:
                 print('Shuffling data')
-                random.shuffle(data)
+                ingest.shuffle(np.random.RandomState(seed), shuffle_block_len)
+
+            ingest.complete(vocab_path)
 
-            self.data = data
+            self.dataset_file = ingest.dataset_file
+            self.vocab = ingest.vocab
 
         else:
             print('Loading dataset from save...')
@@ -168,21 +166,455 @@ class TorontoBookCorpus(Dataset):
             # for obj in self.dataset_file:
             #     print(obj)
 
-            # Results exist, just load them!
-            self.data = self.dataset_file['messages']
+            self.vocab = load_vocabulary(result_path)
 
-            with open(vocab_path, 'rb') as f:
-                self.vocab = pickle.load(f)
+        # Results exist, just load them!
+        if 'tokens' in self.dataset_file:
+            tokens = self.dataset_file['tokens']
+            self.data = RaggedArray(tokens, self.dataset_file['offsets'], int(tokens.attrs['width']))
+        else:
+            self.data = self.dataset_file['messages']
 
         # Get ready to index dataset
         if load_to_mem:
-            self.data = self.data.value  # Retrieve numpy array from h5py array (disk to memory)
+            # Retrieve numpy arrays from h5py arrays (disk to memory)
+            if isinstance(self.data, RaggedArray):
+                self.data = RaggedArray(self.data.tokens[()], self.data.offsets[()], self.data.width)
+            else:
+                self.data = self.data[()]
+            self.data = as_padded_or_ragged(self.data, ragged)
+
+    def _ingest_partitions(self, ingest, filenames, max_s_len, max_num_s, max_part_len, stop_token, max_vocab_len,
+                           num_workers, text_dataset_kwargs):
+        """Count the words of the corpus files into the vocabulary, unless ingest was resumed after counting. Then
+        read and filter the lines of the corpus files from the position ingest reached, and convert and write them
+        a partition of max_part_len sentences at a time, committing after each partition."""
+        # Converts no strings itself, but holds the settings used to build the vocabulary
+        converter = TextDataset([], max_s_len, token_to_id=ingest.vocab, update_vocab=False, stop_token=stop_token,
+                                ragged=True, **text_dataset_kwargs)
+        if not ingest.resumed:
+            print('Counting words')
+            converter.build_vocabulary(count_corpus_words(filenames, max_num_s, ingest.sentence_index is not None),
+                                       ingest.vocab, max_vocab_len)
+            ingest.vocab = converter.token_to_id
+            ingest.create_datasets()
+            ingest.commit('ingesting')
+
+        strings = []
+        for line_position, line in read_lines_with_positions(filenames, ingest.position):
+
+            line = self.sentence_filter(line)
+            if line is not None:
+                strings.append(line)
+            else:
+                continue
+
+            # Quit when max_num_s strings are read
+            if max_num_s is not None and ingest.num_lines + len(strings) >= max_num_s:
+                print('Read max_num_s = %s sentences' % max_num_s)
+                break
+
+            if len(strings) >= max_part_len:
+                print('Number of examples previously read: %s' % ingest.num_lines)
+
+                self._write_partition(ingest, strings, max_s_len, stop_token, converter.nlp, num_workers,
+                                      text_dataset_kwargs)
+
+                # We converted one batch of strings, get ready for the next
+                strings = []
+                ingest.commit('ingesting', line_position)
+
+        # Move remaining examples
+        self._write_partition(ingest, strings, max_s_len, stop_token, converter.nlp, num_workers, text_dataset_kwargs)
+
+    def _write_partition(self, ingest, strings, max_s_len, stop_token, nlp, num_workers, text_dataset_kwargs):
+        """Convert a partition of strings with the vocabulary of ingest, dropping sentences seen before if
+        deduplicating, and append them to the sentences written.
+
+        Returns: the TextDataset which converted the partition."""
+        ingest.num_lines += len(strings)
+        if ingest.sentence_index is not None:
+            strings = ingest.deduplicate(strings)
+
+        # The vocabulary is complete, so it is used as is instead of being copied for every partition
+        converter = TextDataset(strings, max_s_len, result_save_path=None, regenerate=True,
+                                token_to_id=ingest.vocab, update_vocab=False, stop_token=stop_token,
+                                nlp=nlp, extend_vocab=True, ragged=self.ragged, num_workers=num_workers,
+                                **text_dataset_kwargs)
+
+        ingest.write(converter.np_messages)
+        return converter
+
+    def _ingest_shards(self, ingest, filenames, max_s_len, max_num_s, stop_token, max_vocab_len, num_workers,
+                       num_shards, result_path, text_dataset_kwargs):
+        """Read, filter, count and tokenize byte-range shards of the corpus files in worker processes,
+        then build the vocabulary of ingest from the merged counts and encode and write the shards in order."""
+        # Converts no strings itself, but holds the settings used to build the vocabulary and encode sentences
+        converter = TextDataset([], max_s_len, token_to_id=ingest.vocab, update_vocab=False, stop_token=stop_token,
+                                ragged=True, **text_dataset_kwargs)
+
+        shards = byte_range_shards(filenames, num_shards or 4 * num_workers)
+        print('Ingesting %s shards with %s workers' % (len(shards), num_workers))
+
+        with tempfile.TemporaryDirectory(dir=result_path) as spool_dir:
+            shard_args = [(shard, converter.max_message_length, converter.min_message_length,
+                           os.path.join(spool_dir, 'shard_%s.pkl' % index)) for index, shard in enumerate(shards)]
+
+            # Shards are ingested in parallel a few at a time, and results are taken in corpus order. No more
+            # shards are dispatched once max_num_s sentences are read
+            shard_results = []
+            num_lines = 0
+            pending = collections.deque()
+            num_in_flight = 1 if num_workers is None or num_workers <= 1 else 2 * num_workers
+            with _ingest_pool(converter.nlp.tokenizer, num_workers) as pool:
+                next_shard = 0
+                while True:
+                    while next_shard < len(shard_args) and len(pending) < num_in_flight:
+                        # A shard never needs more lines than were missing when it was dispatched
+                        max_lines = None if max_num_s is None else max_num_s - num_lines
+                        pending.append((shard_args[next_shard],
+                                        pool.apply_async(_ingest_shard, shard_args[next_shard] + (max_lines,))))
+                        next_shard += 1
+                    if not pending:
+                        break
+                    args, async_result = pending.popleft()
+                    result = async_result.get()
+                    if max_num_s is not None and num_lines + result[0] > max_num_s:
+                        # Only the first max_num_s sentences are used, the rest of this shard is dropped
+                        result = pool.apply(_ingest_shard, args + (max_num_s - num_lines,))
+                    shard_results.append(result)
+                    num_lines += result[0]
+                    self.sentence_filter.add_counts(result[3])
+                    if max_num_s is not None and num_lines >= max_num_s:
+                        break
+
+            converter.build_vocabulary(merge_dictionaries(result[1] for result in shard_results), ingest.vocab,
+                                       max_vocab_len)
+            ingest.vocab = converter.token_to_id
+            ingest.create_datasets()
+
+            num_read_s = 0
+            for num_shard_lines, dictionary, spool_path, filter_counts in shard_results:
+                with open(spool_path, 'rb') as spool:
+                    np_messages = converter.encode_token_chunks(read_spool(spool), lambda message: None)
+                ingest.write(np_messages)
+                num_read_s += len(np_messages)
+
+        print('Number of sentences read and converted: %s, %s' % (num_lines, num_read_s))
 
     def __getitem__(self, index):
-        return {'message': self.data[index, :]}
+        return {'message': widen_tokens(self.data[index, :])}
+
+    def read_batch(self, indices):
+        """Read the sentences at indices, coalescing runs of consecutive indices into single reads."""
+        return {'message': widen_tokens(read_rows(self.data, indices))}
+
+    def split(self, fraction, seed=None):
+        """Split into two datasets, the first with fraction of the sentences. A split with a seed is saved in
+        result_path the first time, and loaded afterwards. It differs from the split arcadian made for the same
+        seed (see cic.datasets.splits)."""
+        if seed is None:
+            return super().split(fraction, seed=seed)
+        return persisted_split(self, fraction, seed, self.result_path)
 
     def __len__(self):
         if self.max_num_s is None:
             return self.data.shape[0]
         else:
             return min(self.data.shape[0], self.max_num_s)
+
+
+
+def load_vocabulary(result_path):
+    """Load the Vocabulary of a TorontoBookCorpus saved in result_path. A pickled vocab.pkl saved by older
+    versions is migrated to vocab.npz first, keeping its indices so that models trained on it stay valid."""
+    vocab_path = os.path.join(result_path, 'vocab.npz')
+    legacy_vocab_path = os.path.join(result_path, 'vocab.pkl')
+    if not os.path.isfile(vocab_path) and os.path.isfile(legacy_vocab_path):
+        load_legacy_vocabulary(legacy_vocab_path).save(vocab_path)
+    return Vocabulary.load(vocab_path)
+
+
+def load_sentence_index(result_path, mmap=True):
+    """Load the SentenceHashIndex of the sentences of a TorontoBookCorpus built in result_path with
+    deduplicate=True."""
+    return SentenceHashIndex.load(os.path.join(result_path, 'sentence_index.npy'), mmap=mmap)
+
+
+class _Ingest:
+    def __init__(self, dataset_file, result_path, settings, sentence_filter, max_s_len, ragged, deduplicate,
+                 chunk_len, compression, manifest=None):
+        """Sentences written so far by an ingest of the corpus into dataset_file, together with what is needed
+        to resume it: the vocabulary, the position reached in the corpus files and, when deduplicating, the
+        hashes of the sentences kept. commit() saves them with a manifest (ingest_manifest.json) in result_path.
+
+        Arguments:
+            - dataset_file: h5py file the sentences are written to, opened for writing
+            - settings: everything that affects the sentences written, saved in the manifest
+            - sentence_filter: filter the lines were read with, whose counts are saved in the manifest
+            - manifest: manifest of an interrupted ingest to continue (see resumable()), or None to start over
+        """
+        self.dataset_file = dataset_file
+        self.result_path = result_path
+        self.settings = settings
+        self.sentence_filter = sentence_filter
+        self.ragged = ragged
+        self.manifest_path = os.path.join(result_path, 'ingest_manifest.json')
+        self.checkpoint_vocab_path = os.path.join(result_path, 'vocab_checkpoint.npz')
+        self.hashes_path = os.path.join(result_path, 'sentence_hashes.bin')  # hashes kept so far, in ingest order
+        self.sentence_index = SentenceHashIndex() if deduplicate else None
+        self.vocab = None
+        self.num_duplicates = 0  # number of duplicate sentences dropped
+        self.num_lines = 0  # number of lines kept by the sentence filter that were read, before deduplication
+        self.position = (0, 0)  # (file index, byte offset) in the corpus files where reading starts
+        self.resumed = manifest is not None
+        self.max_s_len = max_s_len
+        self.chunk_len = chunk_len
+        self.compression = compression
+
+        if manifest is not None:
+            # Continue after the last committed partition
+            print('Resuming ingest after %s sentences' % manifest['num_rows'])
+            if ragged:
+                self.tokens = GrowableDataset.reopen(dataset_file['tokens'], manifest['num_tokens'])
+                self.offsets = GrowableDataset.reopen(dataset_file['offsets'], manifest['num_rows'] + 1)
+            else:
+                self.data = GrowableDataset.reopen(dataset_file['messages'], manifest['num_rows'])
+            self.vocab = Vocabulary.load(self.checkpoint_vocab_path)
+            sentence_filter.add_counts(manifest['filter_counts'])
+            self.num_duplicates = manifest['num_duplicates']
+            self.num_lines = manifest['num_lines']
+            self.position = (manifest['file_index'], manifest['byte_offset'])
+            if deduplicate:
+                # Drop hashes written after the last commit
+                os.truncate(self.hashes_path, 8 * manifest['num_hashes'])
+                self.sentence_index.add(np.fromfile(self.hashes_path, dtype=np.uint64))
+        else:
+            # Datasets are created by create_datasets() once the vocabulary is complete
+            self.tokens = self.offsets = self.data = None
+            if os.path.isfile(self.checkpoint_vocab_path):
+                os.remove(self.checkpoint_vocab_path)
+            if deduplicate:
+                open(self.hashes_path, 'wb').close()
+        self.hashes_file = open(self.hashes_path, 'ab') if deduplicate else None
+
+    @staticmethod
+    def resumable(result_path, manifest):
+        """Returns: whether manifest, loaded from result_path, is of an interrupted ingest which can be continued.
+        An ingest is only continued once its vocabulary is counted."""
+        return (manifest is not None and manifest['stage'] == 'ingesting' and 'num_lines' in manifest
+                and os.path.isfile(os.path.join(result_path, 'data.hdf5'))
+                and os.path.isfile(os.path.join(result_path, 'vocab_checkpoint.npz')))
+
+    def create_datasets(self):
+        """Create the datasets sentences are written to. Tokens are stored in the narrowest dtype which holds the
+        vocabulary, which must be complete."""
+        dtype = token_dtype(len(self.vocab))
+        if self.ragged:
+            self.tokens = GrowableDataset(self.dataset_file, 'tokens', dtype=dtype,
+                                          chunk_len=self.chunk_len * self.max_s_len, compression=self.compression)
+            self.tokens.dataset.attrs['width'] = self.max_s_len
+            self.offsets = GrowableDataset(self.dataset_file, 'offsets', dtype='i8', chunk_len=self.chunk_len,
+                                           compression=self.compression)
+            self.offsets.append(np.zeros(1, dtype=np.int64))
+        else:
+            self.data = GrowableDataset(self.dataset_file, 'messages', (self.max_s_len,), dtype=dtype,
+                                        chunk_len=self.chunk_len, compression=self.compression)
+
+    @property
+    def num_rows(self):
+        """Number of sentences written."""
+        if self.ragged:
+            return 0 if self.offsets is None else self.offsets.size - 1
+        return 0 if self.data is None else self.data.size
+
+    def write(self, np_messages):
+        """Append converted sentences (padded or a RaggedArray) after the sentences written so far."""
+        if len(np_messages) == 0:
+            return
+        if self.ragged:
+            part_offsets = np.asarray(np_messages.offsets) - np_messages.offsets[0]
+            self.offsets.append(self.tokens.size + part_offsets[1:])
+            self.tokens.append(np_messages.tokens[np_messages.offsets[0]:np_messages.offsets[-1]])
+        else:
+            self.data.append(np.asarray(np_messages))
+
+    def deduplicate(self, strings):
+        """Returns: strings without sentences seen before, whose hashes are added to the index."""
+        hashes = sentence_hashes(strings)
+        is_new = self.sentence_index.add(hashes)
+        self.hashes_file.write(hashes[is_new].tobytes())
+        self.num_duplicates += len(strings) - int(is_new.sum())
+        return [string for string, is_new_string in zip(strings, is_new) if is_new_string]
+
+    def commit(self, stage, position=(0, 0)):
+        """Save the vocabulary and a manifest of the sentences written up to position, a (file index, byte offset)
+        pair in the corpus files where reading resumes. stage is 'counting' until the vocabulary is counted, then
+        'ingesting', 'shuffling' and 'complete'."""
+        self.dataset_file.flush()
+        if self.hashes_file is not None:
+            self.hashes_file.flush()
+            os.fsync(self.hashes_file.fileno())
+        if self.vocab is not None:
+            self.vocab.save(self.checkpoint_vocab_path + '.tmp')
+            os.replace(self.checkpoint_vocab_path + '.tmp', self.checkpoint_vocab_path)
+        save_manifest({'stage': stage, 'settings': self.settings,
+                       'num_rows': self.num_rows,
+                       'num_tokens': (0 if self.tokens is None else self.tokens.size) if self.ragged else None,
+                       'file_index': position[0], 'byte_offset': position[1],
+                       'filter_counts': self.sentence_filter.counts(),
+                       'num_hashes': len(self.sentence_index) if self.sentence_index is not None else None,
+                       'num_duplicates': self.num_duplicates, 'num_lines': self.num_lines}, self.manifest_path)
+
+    def trim(self):
+        """Cut datasets down to the sentences written."""
+        for growable in ([self.tokens, self.offsets] if self.ragged else [self.data]):
+            growable.trim()
+
+    def shuffle(self, random_state, block_len):
+        """Shuffle the sentences written on disk (see cic.datasets.storage.shuffle_rows_on_disk)."""
+        # Rows are shuffled in place, so an interrupted shuffle cannot be resumed
+        self.commit('shuffling')
+        with tempfile.TemporaryDirectory(dir=self.result_path) as scratch_dir:
+            with h5py.File(os.path.join(scratch_dir, 'shuffle.hdf5'), 'w') as scratch_file:
+                shuffle_rows_on_disk(self.dataset_file, scratch_file, random_state, block_len)
+
+    def complete(self, vocab_path):
+        """Save the vocabulary to vocab_path and the index of the sentences kept, and mark results complete."""
+        self.vocab.save(vocab_path)
+        if self.sentence_index is not None:
+            self.sentence_index.save(os.path.join(self.result_path, 'sentence_index.npy'))
+        self.commit('complete')
+        if os.path.isfile(self.checkpoint_vocab_path):
+            os.remove(self.checkpoint_vocab_path)
+        if self.hashes_file is not None:
+            self.hashes_file.close()
+            os.remove(self.hashes_path)
+
+
+def book_corpus_filter():
+    """Returns: a SentenceFilter which normalizes the whitespace of a line of the corpus, and keeps it
+    only if it is a clean sentence: letters, spaces and periods only, and no word repeated twice in a row."""
+    return SentenceFilter([only_letters_and('characters other than letters and periods', ' .'),
+                           no_adjacent_duplicate_words()],
+                          normalize=normalize_whitespace)
+
+
+def count_corpus_words(filenames, max_num_s=None, deduplicate=False):
+    """Count the words of the first max_num_s lines of files kept by book_corpus_filter(), leaving out lines
+    seen before if deduplicate is True.
+
+    Returns: gensim dictionary of the counts."""
+    lines = book_corpus_filter().filter(line for position, line in read_lines_with_positions(filenames))
+    sentence_index = SentenceHashIndex() if deduplicate else None
+    dictionary = gensim.corpora.Dictionary()
+    for chunk in chunk_iterable(itertools.islice(lines, max_num_s), 1000):
+        if sentence_index is not None:
+            chunk = [line for line, is_new in zip(chunk, sentence_index.add(sentence_hashes(chunk))) if is_new]
+        dictionary.add_documents([each_line.split() for each_line in chunk])
+    return dictionary
+
+
+def read_lines_with_positions(filenames, start=(0, 0)):
+    """Yield (position, line) for each line of files, starting at position start. A position is a
+    (file index, byte offset) pair just after a line, from which reading can later resume."""
+    file_index, byte_offset = start
+    for file_index in range(file_index, len(filenames)):
+        with open(filenames[file_index], 'rb') as f:
+            f.seek(byte_offset)
+            for line in f:
+                byte_offset += len(line)
+                yield (file_index, byte_offset), line.decode('utf-8')
+        byte_offset = 0
+
+
+def byte_range_shards(filenames, num_shards):
+    """Split files into about num_shards byte ranges of equal size.
+
+    Returns: list of (filename, start, end) tuples, in file order. See read_shard_lines()."""
+    sizes = [os.path.getsize(filename) for filename in filenames]
+    shard_size = max(1, -(-sum(sizes) // max(1, num_shards)))
+    return [(filename, start, min(start + shard_size, size))
+            for filename, size in zip(filenames, sizes)
+            for start in range(0, size, shard_size)]
+
+
+def read_shard_lines(shard):
+    """Yield each line of a file that starts within the byte range of a shard. Every line of a file
+    belongs to exactly one of its shards."""
+    filename, start, end = shard
+    with open(filename, 'rb') as f:
+        position = start
+        if start > 0:
+            # Skip the rest of a line that started in the previous shard
+            f.seek(start - 1)
+            position = start - 1 + len(f.readline())
+        while position < end:
+            line = f.readline()
+            if len(line) == 0:
+                break
+            position += len(line)
+            yield line.decode('utf-8')
+
+
+# Tokenizer used by each ingest worker process. Set once per worker by the pool initializer.
+_ingest_tokenizer = None
+
+
+def _init_ingest_worker(tokenizer):
+    global _ingest_tokenizer
+    _ingest_tokenizer = tokenizer
+
+
+class _SerialPool:
+    """Runs ingest tasks in this process, with the interface of the multiprocessing pool used otherwise."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def apply(self, function, args):
+        return function(*args)
+
+    def apply_async(self, function, args):
+        return _ReadyResult(function(*args))
+
+
+class _ReadyResult:
+    """Result of a task run by _SerialPool, with the interface of multiprocessing.pool.AsyncResult."""
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+def _ingest_pool(tokenizer, num_workers):
+    """Returns: a pool of num_workers ingest worker processes, or a serial pool if num_workers is 1."""
+    if num_workers is None or num_workers <= 1:
+        _init_ingest_worker(tokenizer)
+        return _SerialPool()
+    return multiprocessing.Pool(num_workers, initializer=_init_ingest_worker, initargs=(tokenizer,))
+
+
+def _ingest_shard(shard, max_length, min_length, spool_path, max_lines=None):
+    """Read and filter the lines of a shard, count their words and tokenize them. Token lists within
+    length limits are pickled to spool_path in chunks.
+
+    Returns: number of lines kept by the filter (at most max_lines), gensim dictionary of their word
+    counts, spool_path, and the counts of the filter (see SentenceFilter.counts)."""
+    sentence_filter = book_corpus_filter()
+    lines = sentence_filter.filter(read_shard_lines(shard))
+
+    dictionary = gensim.corpora.Dictionary()
+    num_lines = 0
+    with open(spool_path, 'wb') as spool:
+        for chunk in chunk_iterable(itertools.islice(lines, max_lines), 1000):
+            dictionary.add_documents([each_line.split() for each_line in chunk])
+            tk_chunk = [tokenize_string(each_line, _ingest_tokenizer) for each_line in chunk]
+            pickle.dump([tk_tokens for tk_tokens in tk_chunk
+                         if within_length_limits(tk_tokens, max_length, min_length)], spool)
+            num_lines += len(chunk)
+
+    return num_lines, dictionary, spool_path, sentence_filter.counts()
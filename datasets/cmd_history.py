@@ -1,18 +1,23 @@
 """Cornell Movie Dialogues corpus, where conversations are represented each as a (history, response) pair,
 where history are the N previous messages and response is how the systems responds."""
 import cic.utils.mdd_tools as mddt
-from arcadian.dataset import Dataset
+from cic.datasets.batch_reading import BatchReadDataset
+from cic.datasets.cornell_lines import load_cornell_lines
+from cic.datasets.vocabulary import Vocabulary
 from cic.utils.squad_tools import invert_dictionary
-from cic.datasets.text_dataset import construct_numpy_from_messages, convert_numpy_array_to_strings
+from cic.datasets.text_dataset import convert_numpy_array_to_strings
+from cic.datasets.storage import WindowArray, as_padded_or_ragged
+from cic.utils.token_tools import construct_ragged_from_messages, token_dtype, widen_tokens
 import cic.paths as paths
 import pickle
 import spacy
 import numpy as np
 import os
 
-class CornellMovieHistoryDataset(Dataset):
+class CornellMovieHistoryDataset(BatchReadDataset):
 
-    def __init__(self, num_convos=None, max_vocab=10000, max_c_len=50, max_s_len=10, save_dir=None, regen=False):
+    def __init__(self, num_convos=None, max_vocab=10000, max_c_len=50, max_s_len=10, save_dir=None, regen=False,
+                 ragged=False, truncate_context=False, windowed=False):
         """Creates a dataset of (context, target) pairs from the Cornell Movie Dialogue dataset, where context
         is the previous utterances in the conversation up until the current turn, and target is the next
         utterance to be spoken. The context feature is of shape (num_utterances, max_c_len) where num_utterances
@@ -26,6 +31,13 @@ class CornellMovieHistoryDataset(Dataset):
         stop_token - string to use as stop token in vocab
         save_dir - save intermediate results to this directory for faster loading
         regen - regenerate intermediate results (does by default if save_dir=None)
+        ragged - if True, keep contexts and targets as RaggedArrays which store only the tokens of each example
+        and pad rows when they are indexed, instead of as padded matrices
+        truncate_context - if True, contexts longer than max_c_len keep their last max_c_len tokens (the most
+        recent utterances). Otherwise examples with longer contexts are left out
+        windowed - if True, keep the tokens of each message once, and contexts and targets as WindowArrays which
+        cut each example out of them when it is indexed. Memory then grows with the size of the corpus instead of
+        with the number of utterances times max_c_len (intermediate results are always saved this way)
 
         """
         self.stop_token = '<STOP>'
@@ -45,8 +57,8 @@ class CornellMovieHistoryDataset(Dataset):
             print('Min convo len: %s' % np.min(convo_lens))
             print('Max convo len: %s' % np.max(convo_lens))
             print('Finding messages...')
-            mddt.load_messages_from_cornell_movie_lines_by_id(id_to_msg, paths.CORNELL_MOVIE_LINES_FILE, '<STOP>',
-                                                              self.nlp)
+            line_store = load_cornell_lines(paths.CORNELL_MOVIE_LINES_FILE, self.nlp)
+            mddt.load_messages_from_cornell_movie_lines_by_id(id_to_msg, line_store, '<STOP>')
 
             none_count = [1 for id in id_to_msg if id_to_msg[id] is None]
             print('Fraction none: %s' % (np.sum(none_count) / len(id_to_msg)))
@@ -55,16 +67,16 @@ class CornellMovieHistoryDataset(Dataset):
             # convert conversations to format of list of lists of messages
             convos = format_convos(convos, id_to_msg)
 
-            examples = build_examples_from_convos(convos, max_c_len=max_c_len, max_s_len=max_s_len)
-            contexts = [example[0] for example in examples]
-            targets = [example[1] for example in examples]
-
             # build vocabulary
-            self.vocab = mddt.build_vocabulary_from_messages(id_to_msg, max_vocab_len=max_vocab)
+            self.vocab = Vocabulary.from_dict(mddt.build_vocabulary_from_messages(id_to_msg, max_vocab_len=max_vocab))
             self.inv_vocab = invert_dictionary(self.vocab)
 
-            self.np_contexts = construct_numpy_from_messages(contexts, self.vocab, max_c_len, unk_token='<UNK>')
-            self.np_targets = construct_numpy_from_messages(targets, self.vocab, max_s_len, unk_token='<UNK>')
+            # Contexts repeat the earlier messages of their conversation, so messages are encoded once,
+            # with the narrowest dtype that holds the vocabulary, and examples are windows over them
+            self.np_contexts, self.np_targets = build_context_examples(convos, self.vocab, max_c_len, max_s_len,
+                                                                       truncate_context=truncate_context,
+                                                                       dtype=token_dtype(len(self.vocab)),
+                                                                       windowed=True)
 
             # save intermediate results
             if save_dir is not None:
@@ -77,37 +89,67 @@ class CornellMovieHistoryDataset(Dataset):
             with open(os.path.join(save_dir, 'results.pkl'), 'rb') as f:
                 self.np_contexts, self.np_targets, self.vocab, self.inv_vocab = pickle.load(f)
 
+        if not (windowed and isinstance(self.np_contexts, WindowArray)):
+            # Windows are copied into ragged or padded rows (results saved before windows hold RaggedArrays)
+            self.np_contexts = as_padded_or_ragged(_copy_windows(self.np_contexts), ragged)
+            self.np_targets = as_padded_or_ragged(_copy_windows(self.np_targets), ragged)
+
     def __len__(self):
         return self.np_targets.shape[0]
 
     def __getitem__(self, index):
-        return {'context': self.np_contexts[index, :],
-                'response': self.np_targets[index, :]}
+        return {'context': widen_tokens(self.np_contexts[index, :]),
+                'response': widen_tokens(self.np_targets[index, :])}
 
+    def read_batch(self, indices):
+        """Read the examples at indices, padding the rows of all of them at once."""
+        return {'context': widen_tokens(np.asarray(self.np_contexts[indices])),
+                'response': widen_tokens(np.asarray(self.np_targets[indices]))}
 
-def build_examples_from_convos(convos, max_c_len=None, max_s_len=None):
-    """Turns each conversation into examples,
-    for each utterance in the conversation. Removes
-    examples which have contexts or responses that
-    are greater than the provided max lengths.
 
-    convos - list of lists of messages (list of conversations)
-    max_c_len - maximum length of each context
-    max_s_len - maximum length of response
+def _copy_windows(np_messages):
+    """Returns: np_messages as a RaggedArray, with the tokens of each row copied, if it is a WindowArray."""
+    return np_messages.to_ragged() if isinstance(np_messages, WindowArray) else np_messages
 
-    Returns: returns examples of form (prev_utterances, utterance)."""
-    examples = []
-    for convo in convos:
-        for index in range(len(convo)):
-            response = convo[index]
-            prev_msgs = convo[:index]
-            context = sum(prev_msgs, [])
 
-            if max_c_len is None or len(context) <= max_c_len:
-                if max_s_len is None or len(response) <= max_s_len:
-                    examples.append([context, response])
+def build_context_examples(convos, vocab, max_c_len, max_s_len, truncate_context=False, unk_token='<UNK>',
+                           dtype=np.int32, windowed=False):
+    """Turns each conversation into examples, one for each utterance in the conversation, with the previous
+    utterances as context. Every message is encoded once. Messages of a conversation are stored back to back,
+    so each context is a contiguous window of tokens ending where its response starts.
 
-    return examples
+    convos - list of lists of messages (list of conversations), where each message is a list of tokens
+    vocab - mapping from each token to its index
+    max_c_len - maximum length of each context
+    max_s_len - maximum length of response (longer responses are left out)
+    truncate_context - if True, contexts longer than max_c_len keep their last max_c_len tokens. Otherwise
+    examples with longer contexts are left out
+    unk_token - out-of-vocabulary tokens are replaced with this token
+    dtype - integer type of token indices
+    windowed - if True, return WindowArrays over the tokens of all messages, which hold each message once.
+    Otherwise all windows are gathered into RaggedArrays at once
+
+    Returns: the contexts and the responses of all examples."""
+    messages = [message for convo in convos for message in convo]
+    max_length = max((len(message) for message in messages), default=0)
+    flat_ids, offsets = construct_ragged_from_messages(messages, vocab, max_length, unk_token=unk_token, dtype=dtype)
+
+    # Token offset where the conversation of each message starts
+    convo_lens = np.array([len(convo) for convo in convos], dtype=np.int64)
+    convo_starts = np.repeat(offsets[np.cumsum(convo_lens) - convo_lens], convo_lens)
+    message_starts = offsets[:-1]
+    message_lens = np.diff(offsets)
+
+    context_lens = message_starts - convo_starts
+    if truncate_context:
+        context_lens = np.minimum(context_lens, max_c_len)
+    keep = (context_lens <= max_c_len) & (message_lens <= max_s_len)
+
+    contexts = WindowArray(flat_ids, message_starts[keep] - context_lens[keep], context_lens[keep], max_c_len)
+    targets = WindowArray(flat_ids, message_starts[keep], message_lens[keep], max_s_len)
+    if windowed:
+        return contexts, targets
+    return contexts.to_ragged(), targets.to_ragged()
 
 
 def format_convos(convos, id2msg):
@@ -2,7 +2,10 @@
 where history are the N previous messages and response is how the systems responds."""
 import cic.utils.mdd_tools as mddt
 from arcadian.dataset import Dataset
+from cic.datasets.cornell_lines import load_cornell_lines
+from cic.datasets.vocabulary import Vocabulary
 from cic.utils.squad_tools import invert_dictionary
+from cic.utils.token_tools import widen_tokens
 import cic.paths as paths
 import spacy
 import numpy as np
@@ -24,8 +27,8 @@ class CornellMovieHistoryUtteranceDataset(Dataset):
         print('Min convo len: %s' % np.min(convo_lens))
         print('Max convo len: %s' % np.max(convo_lens))
         print('Finding messages...')
-        mddt.load_messages_from_cornell_movie_lines_by_id(id_to_msg, paths.CORNELL_MOVIE_LINES_FILE, stop_token,
-                                                          self.nlp)
+        line_store = load_cornell_lines(paths.CORNELL_MOVIE_LINES_FILE, self.nlp)
+        mddt.load_messages_from_cornell_movie_lines_by_id(id_to_msg, line_store, stop_token)
 
         none_count = [1 for id in id_to_msg if id_to_msg[id] is None]
         print('Fraction none: %s' % (np.sum(none_count) / len(id_to_msg)))
@@ -43,7 +46,7 @@ class CornellMovieHistoryUtteranceDataset(Dataset):
                 break
 
         # build vocabulary
-        self.vocab = mddt.build_vocabulary_from_messages(id_to_msg, max_vocab_len=max_vocab)
+        self.vocab = Vocabulary.from_dict(mddt.build_vocabulary_from_messages(id_to_msg, max_vocab_len=max_vocab))
         self.inv_vocab = invert_dictionary(self.vocab)
 
         self.np_convos = mddt.conversations_to_numpy(convos, id_to_msg, self.vocab, n, max_s_len,
@@ -56,7 +59,7 @@ class CornellMovieHistoryUtteranceDataset(Dataset):
         return self.np_convos.shape[0]
 
     def __getitem__(self, index):
-        return {'convo': self.np_convos[index, :, :]}
+        return {'convo': widen_tokens(self.np_convos[index, :, :])}
 
 
 def rm_convos_greater_max_len(convos, id2msg, max_len):
@@ -1,6 +1,8 @@
 import arcadian.dataset
 import spacy
 import cic.models.old_chat_model
+from cic.datasets.splits import persisted_split
+from cic.utils.token_tools import widen_tokens
 
 class CornellMovieConversationDataset(arcadian.dataset.Dataset):
     def __init__(self, max_s_len, reverse_inputs=False, seed='seed',
@@ -9,6 +11,7 @@ class CornellMovieConversationDataset(arcadian.dataset.Dataset):
 
         self.stop_token = stop_token
         self.max_s_len = max_s_len
+        self.save_dir = save_dir
 
         self.examples, self.messages, self.responses, self.vocab, self.inv_vocab\
             = cic.models.old_chat_model.preprocess_all_cornell_conversations(self.nlp, reverse_inputs=reverse_inputs,
@@ -23,8 +26,16 @@ class CornellMovieConversationDataset(arcadian.dataset.Dataset):
         assert self.messages.shape[0] == self.responses.shape[0]
 
     def __getitem__(self, index):
-        return {'message': self.messages[index, :],
-                'response': self.responses[index, :]}
+        return {'message': widen_tokens(self.messages[index, :]),
+                'response': widen_tokens(self.responses[index, :])}
+
+    def split(self, fraction, seed=None):
+        """Split into two datasets. With a seed and a save_dir, the split is saved in save_dir and loaded
+        by later runs. The saved split differs from the split arcadian made for the same seed (see
+        cic.datasets.splits)."""
+        if seed is None or self.save_dir is None:
+            return super().split(fraction, seed=seed)
+        return persisted_split(self, fraction, seed, self.save_dir)
 
     def __len__(self):
         return self.messages.shape[0]
\ No newline at end of file
@@ -1,5 +1,6 @@
 """Stores Dataset subclass for the Cornell movie dialogues dataset."""
 
+from cic.datasets.cornell_lines import load_cornell_lines
 from cic.datasets.text_dataset import TextDataset
 
 
@@ -17,22 +18,7 @@ class CornellMovieSentencesDataset(TextDataset):
         super().__init__(messages, max_s_len, token_to_id=token_to_id, stop_token=stop_token, regenerate=regenerate)
 
     def _load_messages_from_cornell_movie_lines(self, movie_lines_filename, max_number_of_messages=None):
-        delimiter = ' +++$+++ '
-        movie_lines_file = open(movie_lines_filename, 'rb')
-        messages = []
-        line_index = 0
-        for message_line in movie_lines_file:
-            if max_number_of_messages is None or line_index < max_number_of_messages:
-                try:
-                    message_data = message_line.decode('utf-8').split(delimiter)
-                    message = message_data[4][:-1]
-                    messages.append(message)
-                except UnicodeDecodeError:
-                    pass
-            else:
-                break
-
-        movie_lines_file.close()
-
-        return messages
-
+        """Returns: list of the first max_number_of_messages messages (all if None), read from the pre-parsed
+        store of movie_lines_filename (see cic.datasets.cornell_lines)."""
+        messages = load_cornell_lines(movie_lines_filename).messages()
+        return list(messages[:max_number_of_messages] if max_number_of_messages is not None else messages)
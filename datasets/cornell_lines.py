@@ -0,0 +1,120 @@
+"""Pre-parsed store of the lines of the Cornell Movie Dialogues corpus (movie_lines.txt). Lines are decoded,
+split into fields and tokenized once, and each field is saved as a string blob with an offset index (see
+cic.datasets.storage). Cornell datasets then look lines up by id without reading or tokenizing the corpus again."""
+import os
+import shutil
+
+import spacy
+
+from cic.datasets.preprocessing_cache import file_source_id, load_manifest, save_manifest
+from cic.datasets.storage import StringBlobWriter, load_string_blob
+from cic.utils.mdd_tools import DELIMITER
+
+FIELDS = ['line_id', 'character_id', 'movie_id', 'character_name', 'message', 'tokens']
+TOKEN_SEPARATOR = '\x1f'  # tokens may contain whitespace, but never this control character
+
+
+class CornellLineStore:
+    def __init__(self, fields):
+        """Lines of movie_lines.txt in file order, with lines that are not valid utf-8 left out.
+
+        Arguments:
+            - fields: dictionary mapping each name in FIELDS to a sequence of strings with one entry per line.
+            Tokens of each line are joined by TOKEN_SEPARATOR
+        """
+        self.fields = fields
+        self.id_to_row = {line_id: row for row, line_id in enumerate(fields['line_id'])}
+
+    def __len__(self):
+        return len(self.id_to_row)
+
+    def __contains__(self, line_id):
+        return line_id in self.id_to_row
+
+    def messages(self):
+        """Returns: sequence of the original message of each line."""
+        return self.fields['message']
+
+    def tokens(self, row, stop_token=None):
+        """Returns: list of the lower-cased tokens of the line at row, followed by stop_token if given."""
+        joined = self.fields['tokens'][row]
+        tk_tokens = joined.split(TOKEN_SEPARATOR) if joined else []
+        return tk_tokens + [stop_token] if stop_token is not None else tk_tokens
+
+    def message_info(self, line_id, stop_token=None):
+        """Returns: [character_id, movie_id, character_name, message, tokens] of the line with line_id, as
+        stored by cic.utils.mdd_tools.load_messages_from_cornell_movie_lines_by_id."""
+        row = self.id_to_row[line_id]
+        return [self.fields['character_id'][row], self.fields['movie_id'][row],
+                self.fields['character_name'][row], self.fields['message'][row], self.tokens(row, stop_token)]
+
+    @classmethod
+    def build(cls, movie_lines_filename, store_dir, nlp):
+        """Parse and tokenize every line of movie_lines_filename, and save the fields of all lines in store_dir.
+        Messages are lower-cased and tokenized with nlp, with whitespace tokens removed."""
+        writers = {field: StringBlobWriter(*_field_paths(store_dir, field)) for field in FIELDS}
+        with open(movie_lines_filename, 'rb') as movie_lines_file:
+            for message_line in movie_lines_file:
+                try:
+                    message_data = message_line.decode('utf-8').split(DELIMITER)
+                except UnicodeDecodeError:
+                    continue
+                message = message_data[4][:-1] if message_data[4].endswith('\n') else message_data[4]
+                tk_tokens = [str(token) for token in nlp.tokenizer(message.lower()) if str(token) != ' ']
+                values = message_data[:4] + [message, TOKEN_SEPARATOR.join(tk_tokens)]
+                for field, value in zip(FIELDS, values):
+                    writers[field].append(value)
+        for writer in writers.values():
+            writer.close()
+
+    @classmethod
+    def load(cls, store_dir, mmap=True):
+        """Load a store saved with build(). If mmap is True, fields are memory-mapped instead of read."""
+        fields = {field: load_string_blob(*_field_paths(store_dir, field), mmap=mmap) for field in FIELDS}
+        fields['line_id'] = fields['line_id'].tolist()
+        return cls(fields)
+
+
+def _field_paths(store_dir, field):
+    return os.path.join(store_dir, field + '.bin'), os.path.join(store_dir, field + '_offsets.npy')
+
+
+def _tokenizer_id(nlp):
+    nlp_meta = getattr(nlp, 'meta', {})
+    return '%s-%s-%s' % (nlp_meta.get('lang'), nlp_meta.get('name'), nlp_meta.get('version'))
+
+
+def default_store_dir(movie_lines_filename):
+    """Returns: directory of the store of movie_lines_filename, next to the file."""
+    return os.path.splitext(movie_lines_filename)[0] + '_parsed'
+
+
+def load_cornell_lines(movie_lines_filename, nlp=None, store_dir=None, regenerate=False):
+    """Load the pre-parsed store of movie_lines_filename, building it first if it does not exist, the file
+    changed since it was built, or it was built with a different tokenizer than nlp.
+
+    Arguments:
+        - movie_lines_filename: path of movie_lines.txt
+        - nlp: spacy object used to tokenize lines when building the store (loaded if None and needed)
+        - store_dir: directory of the store (see default_store_dir if None)
+        - regenerate: if True, build the store again even if it exists
+
+    Returns: a CornellLineStore."""
+    store_dir = store_dir or default_store_dir(movie_lines_filename)
+    manifest_path = os.path.join(store_dir, 'manifest.json')
+    manifest = load_manifest(manifest_path)
+
+    if (regenerate or manifest is None or manifest['source'] != file_source_id(movie_lines_filename)
+            or (nlp is not None and _tokenizer_id(nlp) != manifest['tokenizer'])):
+        print('Parsing Cornell movie lines...')
+        if nlp is None:
+            nlp = spacy.load('en')
+        if os.path.exists(store_dir):
+            shutil.rmtree(store_dir)
+        os.makedirs(store_dir)
+        CornellLineStore.build(movie_lines_filename, store_dir, nlp)
+        # The manifest is written last, so an interrupted build is rebuilt on the next load
+        save_manifest({'source': file_source_id(movie_lines_filename), 'tokenizer': _tokenizer_id(nlp)},
+                      manifest_path)
+
+    return CornellLineStore.load(store_dir)
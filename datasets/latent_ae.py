@@ -1,9 +1,11 @@
 import numpy as np
-import arcadian.dataset
 import os
 import h5py
 
-class LatentDataset(arcadian.dataset.Dataset):
+from cic.datasets.batch_reading import BatchReadDataset
+from cic.datasets.storage import read_rows
+
+class LatentDataset(BatchReadDataset):
     def __init__(self, save_dir, latent_size, data=None, autoencoder=None, regenerate=False,
                  conversion_batch_size=50, max_codes=None, feature_name='code'):
         """Dataset of latent codes generated by an autoencoder for some input data examples.
@@ -47,6 +49,10 @@ class LatentDataset(arcadian.dataset.Dataset):
         # Get a single item as an index from the dataset.
         return {self.feature_name: self.dataset[index, :]}
 
+    def read_batch(self, indices):
+        """Read the codes at indices, coalescing runs of consecutive indices into single reads."""
+        return {self.feature_name: read_rows(self.dataset, indices)}
+
     def __len__(self):
         # Return the length of the dataset.
         if self.max_codes is None:
@@ -0,0 +1,139 @@
+"""Length-bucketed batching. Examples of similar length are grouped into the same batches, so that batches
+can be trimmed to their longest member instead of always being padded to the maximum length."""
+import time
+
+import numpy as np
+from arcadian.dataset import Dataset
+
+from cic.datasets.batch_reading import prefetch
+
+
+class LengthBucketedDataset(Dataset):
+    def __init__(self, dataset, feature='message', stop_id=None, trim=False, report_every=None,
+                 seed=None, chunk_size=10000, prefetch_batches=2):
+        """Wrap a dataset so that generate_batches() groups examples by the true length of one
+        feature, and reports how many real (non-padding) tokens per second are consumed.
+
+        Models built with a fixed max_len (AutoEncoder, Seq2Seq, NeuralLanguageModelTraining) need
+        trim=False, and still benefit from batches of similar length when their loss ignores padding.
+
+        Arguments:
+            - dataset: dataset whose feature is a padded [max_len] array of token indices per example
+            - feature: name of the feature to bucket by
+            - stop_id: index of the stop token. Length counts non-zero ids before it. Leave it None for features
+            holding several stop tokens, such as conversation contexts, so that every non-zero id is counted
+            - trim: if True, cut the feature of each batch down to its longest member (plus stop token)
+            - report_every: also print throughput every report_every batches (None to only print per epoch)
+            - seed: seed of the random generator used to shuffle batches
+            - chunk_size: number of examples read at a time when measuring lengths
+            - prefetch_batches: number of batches read ahead by a background thread (0 to read each batch
+            when it is requested). Datasets with a read_batch() method read each batch at once
+        """
+        self.dataset = dataset
+        self.feature = feature
+        self.stop_id = stop_id
+        self.trim = trim
+        self.report_every = report_every
+        self.random = np.random.RandomState(seed)
+        self.prefetch_batches = prefetch_batches
+        self.tokens_per_sec = None  # throughput of the last full pass through the data
+
+        # Lengths are measured once, a chunk of examples at a time
+        self.lengths = np.zeros(len(dataset), dtype=np.int64)
+        self.widths = np.zeros(len(dataset), dtype=np.int64)  # position after the last non-zero id
+        for start in range(0, len(dataset), chunk_size):
+            np_messages = self._read_batch(np.arange(start, min(start + chunk_size, len(dataset))))[feature]
+            self.lengths[start:start + len(np_messages)] = message_lengths(np_messages, stop_id)
+            is_token = np_messages != 0
+            self.widths[start:start + len(np_messages)] \
+                = np.where(is_token.any(axis=1), np_messages.shape[1] - is_token[:, ::-1].argmax(axis=1), 0)
+
+    def __getitem__(self, index):
+        return self.dataset[index]
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def _read_batch(self, indices):
+        if hasattr(self.dataset, 'read_batch'):
+            return self.dataset.read_batch(indices)
+        examples = [self.dataset[index] for index in indices]
+        return {name: np.stack([example[name] for example in examples]) for name in examples[0]}
+
+    def generate_batches(self, batch_size, shuffle=True):
+        """Generate batches of examples of similar length. If shuffle, which examples of equal length
+        are batched together and the order of batches are random.
+
+        Returns: generator of dictionaries mapping each feature name to a batch of values."""
+        batches = length_bucketed_batches(self.lengths, batch_size, shuffle=shuffle, random=self.random)
+
+        np_batches = (self._read_batch(batch) for batch in batches)
+        if self.prefetch_batches:
+            np_batches = prefetch(np_batches, self.prefetch_batches)
+
+        num_tokens = 0
+        num_cells = 0
+        start_time = time.time()
+        for batch_index, np_batch in enumerate(np_batches):
+            batch = batches[batch_index]
+            if self.trim:
+                np_batch[self.feature] = np_batch[self.feature][:, :max(1, self.widths[batch].max())]
+
+            num_tokens += self.lengths[batch].sum()
+            num_cells += np_batch[self.feature].size
+
+            yield np_batch
+
+            if self.report_every is not None and (batch_index + 1) % self.report_every == 0:
+                self._report(num_tokens, num_cells, time.time() - start_time)
+
+        self.tokens_per_sec = self._report(num_tokens, num_cells, time.time() - start_time)
+
+    def _report(self, num_tokens, num_cells, elapsed):
+        """Print throughput in real tokens per second, and how much of each batch was padding.
+
+        Returns: tokens per second."""
+        tokens_per_sec = num_tokens / max(elapsed, 1e-9)
+        print('%s tokens in %.1fs: %.0f tokens/sec, %.1f%% padding'
+              % (num_tokens, elapsed, tokens_per_sec, 100 * (1 - num_tokens / max(num_cells, 1))))
+        return tokens_per_sec
+
+
+def message_lengths(np_messages, stop_id=None):
+    """Compute the true length of each message: the number of non-zero ids before the first stop token.
+
+    Arguments:
+        - np_messages: m x n numpy array of token indices
+        - stop_id: index of the stop token (None to count all non-zero ids)
+
+    Returns: numpy array of m lengths."""
+    np_messages = np.asarray(np_messages)
+    is_token = np_messages != 0
+    if stop_id is not None:
+        is_stop = np_messages == stop_id
+        stop_positions = np.where(is_stop.any(axis=1), is_stop.argmax(axis=1), np_messages.shape[1])
+        is_token &= np.arange(np_messages.shape[1]) < stop_positions[:, np.newaxis]
+    return is_token.sum(axis=1)
+
+
+def length_bucketed_batches(lengths, batch_size, shuffle=True, random=np.random):
+    """Split example indices into batches of examples with similar lengths.
+
+    Arguments:
+        - lengths: length of each example
+        - batch_size: maximum number of examples per batch
+        - shuffle: if True, break ties between equal lengths randomly and shuffle the order of batches
+        - random: numpy random generator used to shuffle
+
+    Returns: list of numpy arrays of example indices."""
+    lengths = np.asarray(lengths)
+    if shuffle:
+        permutation = random.permutation(len(lengths))
+        order = permutation[np.argsort(lengths[permutation], kind='stable')]
+    else:
+        order = np.argsort(lengths, kind='stable')
+
+    batches = [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+    if shuffle:
+        batches = [batches[index] for index in random.permutation(len(batches))]
+    return batches
@@ -0,0 +1,168 @@
+"""Cache of dataset preprocessing results. Each entry is a directory named after a hash of the input data
+and of every parameter that affects preprocessing, so results for different settings live side by side."""
+import hashlib
+import json
+import os
+import shutil
+
+
+class PreprocessingCache:
+    def __init__(self, cache_dir, max_entries=4, max_bytes=None):
+        """Directory of keyed preprocessing results. When the cache grows past max_entries
+        entries or max_bytes bytes, least recently used entries are removed.
+
+        Arguments:
+            - cache_dir: directory holding one subdirectory per cache entry
+            - max_entries: maximum number of entries to keep (None for no limit)
+            - max_bytes: maximum total size of all entries in bytes (None for no limit)
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def key(self, params, strings=None, source_id=None):
+        """Compute the cache key for a preprocessing run.
+
+        Arguments:
+            - params: dictionary of all parameters that affect preprocessing results
+            - strings: iterable of input strings, hashed in full if source_id is not given
+            - source_id: string identifying the input (e.g. file path, size and modification time),
+            used instead of hashing strings
+
+        Returns: hexadecimal key string."""
+        key_hash = hashlib.sha1()
+        for name in sorted(params):
+            key_hash.update(('%s=%r\n' % (name, params[name])).encode('utf-8'))
+
+        if source_id is not None:
+            key_hash.update(('source=%s\n' % source_id).encode('utf-8'))
+        else:
+            for each_string in strings:
+                key_hash.update(each_string.encode('utf-8'))
+                key_hash.update(b'\n')
+
+        return key_hash.hexdigest()
+
+    def entry_path(self, key):
+        """Directory in which results for this key are stored."""
+        return os.path.join(self.cache_dir, key)
+
+    def contains(self, key, filenames):
+        """Returns True if the entry for key holds all of filenames."""
+        entry_path = self.entry_path(key)
+        return all(os.path.isfile(os.path.join(entry_path, filename)) for filename in filenames)
+
+    def touch(self, key):
+        """Mark the entry for key as most recently used, creating its directory if needed."""
+        entry_path = self.entry_path(key)
+        if not os.path.exists(entry_path):
+            os.makedirs(entry_path)
+        with open(os.path.join(entry_path, 'last_used'), 'a'):
+            os.utime(os.path.join(entry_path, 'last_used'), None)
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until the cache is within its limits. The entry
+        for key keep is never removed."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_path = os.path.join(self.cache_dir, name)
+            last_used_path = os.path.join(entry_path, 'last_used')
+            if name == keep or not os.path.isfile(last_used_path):
+                continue
+            entries.append((os.path.getmtime(last_used_path), _directory_size(entry_path), entry_path))
+
+        # Oldest entries are evicted first
+        entries.sort()
+
+        num_entries = len(entries) + (1 if keep is not None else 0)
+        total_bytes = sum(entry[1] for entry in entries)
+        if keep is not None and os.path.exists(self.entry_path(keep)):
+            total_bytes += _directory_size(self.entry_path(keep))
+
+        for last_used, num_bytes, entry_path in entries:
+            if (self.max_entries is None or num_entries <= self.max_entries) \
+                    and (self.max_bytes is None or total_bytes <= self.max_bytes):
+                break
+            print('Evicting cached preprocessing results: %s' % entry_path)
+            shutil.rmtree(entry_path, ignore_errors=True)
+            num_entries -= 1
+            total_bytes -= num_bytes
+
+
+def _directory_size(path):
+    """Total size in bytes of all files under path."""
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for filename in files:
+            total += os.path.getsize(os.path.join(root, filename))
+    return total
+
+
+def file_source_id(filename):
+    """Identify an input file by its absolute path, size and modification time, so it
+    does not need to be read in full to compute a cache key. If the file does not exist,
+    it is identified by path alone."""
+    if not os.path.isfile(filename):
+        return os.path.abspath(filename)
+    stat = os.stat(filename)
+    return '%s:%s:%s' % (os.path.abspath(filename), stat.st_size, stat.st_mtime)
+
+
+def count_lines(filename, counts_path=None, buffer_size=1 << 20):
+    """Count the lines of a file by counting newline bytes in large buffered reads, without decoding
+    or splitting lines. A last line without a newline is counted too.
+
+    Arguments:
+        - filename: file to count lines of
+        - counts_path: if given, a JSON file of previous counts keyed by file_source_id(). A file whose
+        path, size and modification time are unchanged is not read again
+        - buffer_size: number of bytes read at a time
+
+    Returns: number of lines in the file."""
+    source_id = file_source_id(filename)
+    counts = {}
+    if counts_path is not None and os.path.isfile(counts_path):
+        with open(counts_path) as f:
+            counts = json.load(f)
+        if source_id in counts:
+            return counts[source_id]
+
+    num_lines = 0
+    last_byte = b'\n'
+    with open(filename, 'rb') as f:
+        buffer = f.read(buffer_size)
+        while buffer:
+            num_lines += buffer.count(b'\n')
+            last_byte = buffer[-1:]
+            buffer = f.read(buffer_size)
+    if last_byte != b'\n':
+        num_lines += 1
+
+    if counts_path is not None:
+        counts[source_id] = num_lines
+        with open(counts_path, 'w') as f:
+            json.dump(counts, f, indent=4)
+
+    return num_lines
+
+
+def save_manifest(manifest, path):
+    """Save a JSON manifest atomically: it is written to a temporary file which then replaces path,
+    so an interrupted write leaves the previous manifest intact."""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def load_manifest(path):
+    """Returns: the manifest saved at path with save_manifest(), or None if there is none."""
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,92 @@
+"""Sentence filters shared by corpus loaders. A filter is a pipeline of named rules built from compiled regular
+expressions and translate tables. Each sentence is checked against the rules in order and rejected by the first
+rule it fails, and the number of sentences each rule rejected is counted so loaders can report what they drop."""
+import collections
+import re
+
+
+Rule = collections.namedtuple('Rule', ['name', 'accept'])
+
+
+class SentenceFilter:
+    def __init__(self, rules, normalize=None):
+        """Pipeline of rules that sentences must pass.
+
+        Arguments:
+            - rules: list of Rule, checked in order. rule.accept(sentence) returns True if the sentence passes
+            - normalize: if given, sentences are normalized by this function before they are checked
+        """
+        self.rules = list(rules)
+        self.normalize = normalize
+        self.num_accepted = 0
+        self.rejections = collections.OrderedDict((rule.name, 0) for rule in self.rules)
+
+    def __call__(self, sentence):
+        """Returns: the (normalized) sentence if it passes every rule, otherwise None."""
+        if self.normalize is not None:
+            sentence = self.normalize(sentence)
+        for rule in self.rules:
+            if not rule.accept(sentence):
+                self.rejections[rule.name] += 1
+                return None
+        self.num_accepted += 1
+        return sentence
+
+    def filter(self, sentences):
+        """Yield each (normalized) sentence that passes every rule."""
+        for sentence in sentences:
+            sentence = self(sentence)
+            if sentence is not None:
+                yield sentence
+
+    @property
+    def num_seen(self):
+        return self.num_accepted + sum(self.rejections.values())
+
+    def counts(self):
+        """Returns: (number of accepted sentences, dictionary of rejections per rule), e.g. to send
+        the counts of a worker process back to be added up with add_counts()."""
+        return self.num_accepted, dict(self.rejections)
+
+    def add_counts(self, counts):
+        """Add counts returned by counts() of another filter with the same rules."""
+        num_accepted, rejections = counts
+        self.num_accepted += num_accepted
+        for name, num_rejected in rejections.items():
+            self.rejections[name] = self.rejections.get(name, 0) + num_rejected
+
+    def report(self):
+        """Returns: a summary of how many sentences were accepted, and rejected by each rule."""
+        lines = ['Accepted %s of %s sentences' % (self.num_accepted, self.num_seen)]
+        for name, num_rejected in self.rejections.items():
+            lines.append('    rejected by %s: %s' % (name, num_rejected))
+        return '\n'.join(lines)
+
+
+def normalize_whitespace(sentence):
+    """Replace every run of whitespace with a single space, and strip the ends."""
+    return ' '.join(sentence.split())
+
+
+def forbid_pattern(name, pattern):
+    """Rule rejecting sentences in which the regular expression pattern is found."""
+    search = re.compile(pattern).search
+    return Rule(name, lambda sentence: search(sentence) is None)
+
+
+def only_letters_and(name, allowed_characters):
+    """Rule rejecting sentences containing any character other than letters (str.isalpha) and
+    allowed_characters. Allowed characters are deleted with a translate table, and the rest is checked
+    with a single str.isalpha() call."""
+    table = str.maketrans('', '', allowed_characters)
+    return Rule(name, lambda sentence: _all_letters(sentence.translate(table)))
+
+
+def _all_letters(string):
+    return len(string) == 0 or string.isalpha()
+
+
+def no_adjacent_duplicate_words(name='adjacent duplicate words'):
+    """Rule rejecting sentences in which a word is immediately repeated. Words are separated by
+    single spaces (see normalize_whitespace)."""
+    return forbid_pattern(name, r'(?:^| )([^ ]+) \1(?= |$)')
@@ -0,0 +1,103 @@
+"""Compact index of 64-bit sentence hashes, to deduplicate a corpus while it is read and to check whether
+sentences (e.g. generated by a model) appear in a corpus without rescanning its text."""
+import hashlib
+
+import numpy as np
+
+
+def sentence_hash(sentence):
+    """Returns: 64-bit hash of a sentence, after normalizing its whitespace."""
+    digest = hashlib.blake2b(' '.join(sentence.split()).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def sentence_hashes(sentences):
+    """Returns: uint64 numpy array of the hash of each sentence (see sentence_hash)."""
+    return np.fromiter((sentence_hash(sentence) for sentence in sentences), dtype=np.uint64)
+
+
+class SentenceHashIndex:
+    def __init__(self, hashes=None):
+        """Set of 64-bit sentence hashes, stored as a few sorted numpy arrays. Hashes added together form
+        a new sorted array, and arrays of similar size are merged, so adding n hashes costs O(n log n) in
+        total and a lookup searches a logarithmic number of arrays. Saved indices hold one sorted array,
+        which can be memory-mapped.
+
+        Arguments:
+            - hashes: sorted numpy array of unique uint64 hashes
+        """
+        self.levels = [] if hashes is None or len(hashes) == 0 else [hashes]
+
+    @classmethod
+    def from_sentences(cls, sentences, chunk_size=100000):
+        """Create an index of the hashes of sentences, hashed chunk_size sentences at a time."""
+        index = cls()
+        chunk = []
+        for sentence in sentences:
+            chunk.append(sentence)
+            if len(chunk) >= chunk_size:
+                index.add(sentence_hashes(chunk))
+                chunk = []
+        index.add(sentence_hashes(chunk))
+        return index
+
+    def __len__(self):
+        return sum(len(level) for level in self.levels)
+
+    def contains(self, hashes):
+        """Returns: boolean numpy array, True for each hash in the index."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        found = np.zeros(len(hashes), dtype=bool)
+        for level in self.levels:
+            positions = np.minimum(np.searchsorted(level, hashes), len(level) - 1)
+            found |= np.asarray(level[positions]) == hashes
+        return found
+
+    def contains_sentences(self, sentences):
+        """Returns: boolean numpy array, True for each sentence whose hash is in the index."""
+        return self.contains(sentence_hashes(sentences))
+
+    def __contains__(self, sentence):
+        return bool(self.contains_sentences([sentence])[0])
+
+    def add(self, hashes):
+        """Add hashes to the index.
+
+        Returns: boolean numpy array, True for each hash which was not in the index before. Of hashes
+        repeated within hashes, only the first is new."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        unique_hashes, first_positions = np.unique(hashes, return_index=True)
+        is_new_unique = ~self.contains(unique_hashes)
+        is_new = np.zeros(len(hashes), dtype=bool)
+        is_new[first_positions[is_new_unique]] = True
+
+        new_hashes = unique_hashes[is_new_unique]
+        if len(new_hashes) > 0:
+            self.levels.append(new_hashes)
+            # Merge arrays of similar size, so sizes at least halve from each array to the next
+            while len(self.levels) > 1 and len(self.levels[-2]) <= 2 * len(self.levels[-1]):
+                self.levels[-2:] = [_merge_sorted(self.levels[-2], self.levels[-1])]
+        return is_new
+
+    def compact(self):
+        """Merge the index into a single sorted array.
+
+        Returns: the sorted uint64 numpy array of all hashes."""
+        while len(self.levels) > 1:
+            self.levels[-2:] = [_merge_sorted(self.levels[-2], self.levels[-1])]
+        return self.levels[0] if self.levels else np.zeros(0, dtype=np.uint64)
+
+    def save(self, path):
+        """Save the index as a .npy file of sorted hashes."""
+        np.save(path, self.compact())
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load an index saved with save(). If mmap is True, memory-map it instead of reading it."""
+        return cls(np.load(path, mmap_mode='r' if mmap else None))
+
+
+def _merge_sorted(first, second):
+    merged = np.concatenate([first, second])
+    merged.sort(kind='mergesort')
+    return merged
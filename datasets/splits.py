@@ -0,0 +1,112 @@
+"""Deterministic train/validation splits saved as manifests of example indices. A split is computed once
+from the number of examples, the fraction and the seed, saved next to the dataset, and loaded by later
+runs instead of being recomputed.
+
+Persisted splits do not assign examples the way arcadian's Dataset.split did for the same seed, so a model
+trained on an arcadian split has seen part of the validation split of the same seed here. Such models must be
+retrained (or evaluated on data held out some other way) before their validation metrics are compared."""
+import hashlib
+import os
+
+import numpy as np
+
+from cic.datasets.batch_reading import BatchReadDataset
+
+# Increase when the assignment of examples to splits changes, so manifests of the old assignment are not
+# loaded. Version 1 was arcadian's Dataset.split, which saved no manifest.
+SPLIT_FORMAT_VERSION = 2
+
+
+class IndexedSubset(BatchReadDataset):
+    def __init__(self, dataset, indices):
+        """View of the examples of dataset at indices, in that order.
+
+        Arguments:
+            - dataset: dataset to take examples from. If it has a read_batch() method, batches are read with it
+            - indices: numpy array of indices into dataset
+        """
+        self.dataset = dataset
+        self.indices = indices
+
+    def __getitem__(self, index):
+        return self.dataset[self.indices[index]]
+
+    def __len__(self):
+        return len(self.indices)
+
+    def read_batch(self, indices):
+        dataset_indices = self.indices[indices]
+        if hasattr(self.dataset, 'read_batch'):
+            return self.dataset.read_batch(dataset_indices)
+        examples = [self.dataset[index] for index in dataset_indices]
+        return {name: np.stack([example[name] for example in examples]) for name in examples[0]}
+
+
+def split_seed(seed):
+    """Returns: integer seed for numpy derived from seed, which may be a string. Unlike hash(), the result
+    is the same in every run."""
+    return int.from_bytes(hashlib.blake2b(str(seed).encode('utf-8'), digest_size=4).digest(), 'little')
+
+
+def split_indices(num_examples, fraction, seed):
+    """Randomly split range(num_examples) in two.
+
+    Arguments:
+        - num_examples: number of examples to split
+        - fraction: fraction of the examples in the first split
+        - seed: seed of the split (see split_seed)
+
+    Returns: sorted numpy arrays of the indices in the first and second split."""
+    permutation = np.random.RandomState(split_seed(seed)).permutation(num_examples)
+    num_first = int(num_examples * fraction)
+    return np.sort(permutation[:num_first]), np.sort(permutation[num_first:])
+
+
+def split_manifest_path(directory, fraction, seed):
+    """Returns: path of the manifest of the split with fraction and seed, in directory."""
+    return os.path.join(directory, 'split_v%s_%s_%08x.npz' % (SPLIT_FORMAT_VERSION, fraction, split_seed(seed)))
+
+
+def save_split(path, first, second, fraction, seed):
+    """Save the indices of a split as a manifest, together with the fraction and seed that produced them.
+    The manifest is written to a temporary file first, so an interrupted save leaves no partial manifest."""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        np.savez(f, first=first, second=second, num_examples=len(first) + len(second), fraction=fraction,
+                 seed=str(seed), version=SPLIT_FORMAT_VERSION)
+    os.replace(temp_path, path)
+
+
+def load_split(path, num_examples, fraction, seed):
+    """Returns: the first and second indices saved in the manifest at path, or None if there is no manifest
+    or it was made for a different number of examples, fraction, seed or version."""
+    if not os.path.isfile(path):
+        return None
+    with np.load(path) as manifest:
+        if ('version' not in manifest or int(manifest['version']) != SPLIT_FORMAT_VERSION
+                or int(manifest['num_examples']) != num_examples or float(manifest['fraction']) != fraction
+                or str(manifest['seed']) != str(seed)):
+            return None
+        return manifest['first'], manifest['second']
+
+
+def persisted_split(dataset, fraction, seed, directory):
+    """Split dataset in two with a manifest saved in directory. The first call computes the split and saves it,
+    and later calls with the same fraction and seed load it. Splits only depend on the length of dataset, so
+    a regenerated dataset of the same length reuses its manifest.
+
+    Arguments:
+        - dataset: dataset to split
+        - fraction: fraction of the examples in the first split
+        - seed: seed of the split. Required, since random splits would not be reproducible
+        - directory: directory of the manifest, usually the directory the dataset is saved in
+
+    Returns: IndexedSubset of the first and of the second split."""
+    if seed is None:
+        raise ValueError('Persisted splits need a seed')
+    path = split_manifest_path(directory, fraction, seed)
+    indices = load_split(path, len(dataset), fraction, seed)
+    if indices is None:
+        indices = split_indices(len(dataset), fraction, seed)
+        save_split(path, indices[0], indices[1], fraction, seed)
+    return IndexedSubset(dataset, indices[0]), IndexedSubset(dataset, indices[1])
@@ -0,0 +1,500 @@
+"""Compact on-disk storage formats for text datasets, which can be memory-mapped instead of loaded
+into memory. Processes that memory-map the same files share one copy in the page cache."""
+import array
+
+import h5py
+import numpy as np
+import os
+
+from cic.utils.token_tools import pad_ragged_rows
+
+
+class StringBlob:
+    def __init__(self, blob, offsets):
+        """Read-only sequence of strings stored as a single utf-8 byte array. String i is
+        blob[offsets[i]:offsets[i+1]]. Both arrays may be memory-mapped.
+
+        Arguments:
+            - blob: uint8 numpy array holding all encoded strings back to back
+            - offsets: int64 numpy array of len(strings) + 1 byte offsets into blob
+        """
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            # Share the same blob, only the offsets are narrowed
+            return StringBlob(self.blob, self.offsets[start:max(start, stop) + 1])
+
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('StringBlob index out of range')
+        return bytes(self.blob[self.offsets[index]:self.offsets[index + 1]]).decode('utf-8')
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def tolist(self):
+        """Returns: list of all strings, decoded from one read of the blob."""
+        blob = bytes(self.blob[self.offsets[0]:self.offsets[-1]]) if len(self.offsets) > 0 else b''
+        offsets = (np.asarray(self.offsets) - (self.offsets[0] if len(self.offsets) > 0 else 0)).tolist()
+        return [blob[start:stop].decode('utf-8') for start, stop in zip(offsets[:-1], offsets[1:])]
+
+
+class StringBlobWriter:
+    def __init__(self, blob_path, offsets_path):
+        """Write strings one at a time to blob_path as one utf-8 byte blob. Their offsets
+        are written to offsets_path (a .npy file) on close(). Read back with load_string_blob()."""
+        self.offsets_path = offsets_path
+        self.blob_file = open(blob_path, 'wb')
+        self.offsets = array.array('q', [0])
+
+    def append(self, string):
+        encoded = string.encode('utf-8')
+        self.blob_file.write(encoded)
+        self.offsets.append(self.offsets[-1] + len(encoded))
+
+    def close(self):
+        self.blob_file.close()
+        np.save(self.offsets_path, np.frombuffer(self.offsets, dtype=np.int64))
+
+
+def save_string_blob(strings, blob_path, offsets_path):
+    """Write strings to blob_path as one utf-8 byte blob and their offsets to offsets_path
+    (a .npy file). Strings are written one at a time and may be any iterable."""
+    writer = StringBlobWriter(blob_path, offsets_path)
+    for each_string in strings:
+        writer.append(each_string)
+    writer.close()
+
+
+def load_string_blob(blob_path, offsets_path, mmap=True):
+    """Load strings saved with save_string_blob(). If mmap is True, memory-map both files
+    instead of reading them, so loading takes constant time.
+
+    Returns: a StringBlob."""
+    if mmap:
+        offsets = np.load(offsets_path, mmap_mode='r')
+        if os.path.getsize(blob_path) > 0:
+            blob = np.memmap(blob_path, dtype=np.uint8, mode='r')
+        else:
+            blob = np.zeros(0, dtype=np.uint8)  # empty files cannot be memory-mapped
+    else:
+        offsets = np.load(offsets_path)
+        blob = np.fromfile(blob_path, dtype=np.uint8)
+    return StringBlob(blob, offsets)
+
+
+class RaggedArray:
+    def __init__(self, tokens, offsets, width):
+        """Read-only matrix of token indices stored without padding. Row i holds the tokens
+        tokens[offsets[i]:offsets[i+1]] and reads as a row of width columns padded with index 0,
+        so a RaggedArray can stand in for a padded [num_rows, width] matrix while storing only
+        real tokens. Both arrays may be memory-mapped (or be h5py datasets, read row by row).
+
+        Arguments:
+            - tokens: 1-D array of the token indices of all rows back to back
+            - offsets: int64 array of num_rows + 1 offsets into tokens
+            - width: number of columns of each padded row
+        """
+        self.tokens = tokens
+        self.offsets = offsets
+        self.width = width
+
+    @classmethod
+    def from_padded(cls, np_messages):
+        """Create a ragged array from a padded matrix, dropping the padding (index 0) at the end of each row."""
+        np_messages = np.asarray(np_messages)
+        width = np_messages.shape[1]
+        is_token = np_messages != 0
+        lengths = np.where(is_token.any(axis=1), width - is_token[:, ::-1].argmax(axis=1), 0)
+        offsets = np.zeros(len(np_messages) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(np_messages[np.arange(width) < lengths[:, np.newaxis]], offsets, width)
+
+    @classmethod
+    def concatenate(cls, ragged_arrays, width, dtype=np.int32):
+        """Join ragged arrays (or (tokens, offsets) pairs) into one ragged array, row after row."""
+        parts = [(ragged.tokens, ragged.offsets) if isinstance(ragged, RaggedArray) else ragged
+                 for ragged in ragged_arrays]
+        tokens = np.concatenate([np.asarray(part_tokens[part_offsets[0]:part_offsets[-1]], dtype=dtype)
+                                 for part_tokens, part_offsets in parts] + [np.zeros(0, dtype=dtype)])
+        lengths = np.concatenate([np.diff(part_offsets) for part_tokens, part_offsets in parts]
+                                 + [np.zeros(0, dtype=np.int64)])
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(tokens, offsets, width)
+
+    @property
+    def shape(self):
+        return len(self), self.width
+
+    @property
+    def dtype(self):
+        return self.tokens.dtype
+
+    def lengths(self):
+        """Returns: number of tokens in each row, without padding."""
+        return np.diff(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            rows, columns = index
+            if isinstance(rows, slice) and columns == slice(None):
+                return self[rows]
+            return np.asarray(self[rows])[..., columns]
+
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                # Share the same tokens, only the offsets are narrowed
+                return RaggedArray(self.tokens, self.offsets[start:max(start, stop) + 1], self.width)
+            index = np.arange(start, stop, step)
+
+        if np.ndim(index) == 0:
+            if index < 0:
+                index += len(self)
+            if index < 0 or index >= len(self):
+                raise IndexError('RaggedArray index out of range')
+            return self._pad_rows(np.array([index]))[0]
+
+        index = np.asarray(index)
+        if index.dtype == bool:
+            index = np.flatnonzero(index)
+        return self._pad_rows(np.where(index < 0, index + len(self), index))
+
+    def _pad_rows(self, rows):
+        """Returns: padded len(rows) x width matrix of the given rows."""
+        if not isinstance(self.tokens, np.ndarray):
+            # Arrays on disk such as h5py datasets are read with one slice per run of consecutive rows
+            return read_rows(self, rows)
+
+        starts = np.asarray(self.offsets[rows], dtype=np.int64)
+        lengths = np.asarray(self.offsets[rows + 1], dtype=np.int64) - starts
+        return pad_ragged_rows(self.tokens, starts, lengths, self.width)
+
+    def _read_run(self, start, stop):
+        """Returns: padded matrix of rows start to stop, read with one slice of offsets and one of tokens."""
+        run_offsets = np.asarray(self.offsets[start:stop + 1], dtype=np.int64)
+        run_tokens = np.asarray(self.tokens[run_offsets[0]:run_offsets[-1]])
+        return pad_ragged_rows(run_tokens, run_offsets[:-1] - run_offsets[0], np.diff(run_offsets), self.width,
+                               dtype=self.dtype)
+
+    def take(self, rows):
+        """Returns: a new in-memory RaggedArray of the given rows, in the given order, without padding."""
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = np.asarray(self.offsets[rows], dtype=np.int64)
+        lengths = np.asarray(self.offsets[rows + 1], dtype=np.int64) - starts
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        sources = np.arange(offsets[-1], dtype=np.int64) + np.repeat(starts - offsets[:-1], lengths)
+        return RaggedArray(np.asarray(self.tokens)[sources], offsets, self.width)
+
+    def to_padded(self):
+        """Returns: padded len(self) x width numpy matrix of all rows."""
+        return self._pad_rows(np.arange(len(self)))
+
+    def __array__(self, dtype=None):
+        np_messages = self.to_padded()
+        return np_messages if dtype is None else np_messages.astype(dtype)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+class WindowArray:
+    def __init__(self, tokens, starts, lengths, width):
+        """Read-only matrix of token indices whose rows are windows over one stream of tokens. Row i holds the
+        tokens tokens[starts[i]:starts[i] + lengths[i]] and reads as a row of width columns padded with index 0.
+        Unlike the rows of a RaggedArray, windows may overlap, so rows which repeat the same tokens (such as the
+        contexts of successive utterances of a conversation) share one copy of them.
+
+        Arguments:
+            - tokens: 1-D numpy array of token indices
+            - starts: int64 numpy array of the position in tokens where each row starts
+            - lengths: int64 numpy array of the number of tokens in each row, at most width
+            - width: number of columns of each padded row
+        """
+        self.tokens = tokens
+        self.starts = starts
+        self.row_lengths = lengths
+        self.width = width
+
+    @property
+    def shape(self):
+        return len(self), self.width
+
+    @property
+    def dtype(self):
+        return self.tokens.dtype
+
+    def lengths(self):
+        """Returns: number of tokens in each row, without padding."""
+        return self.row_lengths
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            rows, columns = index
+            if isinstance(rows, slice) and columns == slice(None):
+                return self[rows]
+            return np.asarray(self[rows])[..., columns]
+
+        if isinstance(index, slice):
+            # Share the same tokens, only the windows are narrowed
+            return WindowArray(self.tokens, self.starts[index], self.row_lengths[index], self.width)
+
+        if np.ndim(index) == 0:
+            if index < 0:
+                index += len(self)
+            if index < 0 or index >= len(self):
+                raise IndexError('WindowArray index out of range')
+            start = self.starts[index]
+            row = np.zeros(self.width, dtype=self.dtype)
+            row[:self.row_lengths[index]] = self.tokens[start:start + self.row_lengths[index]]
+            return row
+
+        index = np.asarray(index)
+        if index.dtype == bool:
+            index = np.flatnonzero(index)
+        index = np.where(index < 0, index + len(self), index)
+        return pad_ragged_rows(self.tokens, self.starts[index], self.row_lengths[index], self.width)
+
+    def to_ragged(self):
+        """Returns: RaggedArray of the same rows, with the tokens of each row copied."""
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(self.row_lengths, out=offsets[1:])
+        sources = np.arange(offsets[-1], dtype=np.int64) + np.repeat(self.starts - offsets[:-1], self.row_lengths)
+        return RaggedArray(self.tokens[sources], offsets, self.width)
+
+    def to_padded(self):
+        """Returns: padded len(self) x width numpy matrix of all rows."""
+        return pad_ragged_rows(self.tokens, self.starts, self.row_lengths, self.width)
+
+    def __array__(self, dtype=None):
+        np_messages = self.to_padded()
+        return np_messages if dtype is None else np_messages.astype(dtype)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+def coalesced_runs(rows, max_gap=0):
+    """Split sorted, unique row indices into runs of consecutive rows. Runs separated by at most max_gap
+    rows are merged, so that a few unused rows are read instead of starting a new read.
+
+    Returns: list of (start, stop) pairs, where each run holds rows start to stop - 1."""
+    rows = np.asarray(rows, dtype=np.int64)
+    if len(rows) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(rows) > max_gap + 1) + 1
+    starts = rows[np.concatenate([[0], breaks])]
+    stops = rows[np.concatenate([breaks - 1, [len(rows) - 1]])] + 1
+    return list(zip(starts.tolist(), stops.tolist()))
+
+
+def read_rows(array, rows, max_gap=0):
+    """Read rows of an on-disk array (e.g. an h5py dataset, or a RaggedArray of h5py datasets) in the
+    given order, in as few reads as possible. Requested rows are sorted, coalesced into runs of
+    consecutive rows (see coalesced_runs) and each run is read with a single slice.
+
+    Arguments:
+        - array: array of rows which can be sliced
+        - rows: indices of the rows to read, in any order and possibly repeated
+        - max_gap: merge runs separated by at most this many rows
+
+    Returns: numpy array of the rows (padded rows for a RaggedArray)."""
+    rows = np.asarray(rows, dtype=np.int64)
+    if isinstance(array, np.ndarray) or (isinstance(array, RaggedArray) and isinstance(array.tokens, np.ndarray)):
+        return array[rows]
+
+    unique_rows, inverse = np.unique(rows, return_inverse=True)
+    runs = coalesced_runs(unique_rows, max_gap)
+    if len(runs) == 0:
+        return np.zeros((0,) + tuple(array.shape[1:]), dtype=array.dtype)
+    if not isinstance(array, RaggedArray) and 2 * len(runs) > len(unique_rows):
+        # Mostly scattered rows are read with a single selection of increasing indices
+        return np.asarray(array[unique_rows])[inverse]
+
+    run_ends = np.searchsorted(unique_rows, [stop for start, stop in runs])
+    parts = []
+    for (start, stop), run_begin, run_end in zip(runs, np.concatenate([[0], run_ends[:-1]]), run_ends):
+        run = array._read_run(start, stop) if isinstance(array, RaggedArray) else np.asarray(array[start:stop])
+        parts.append(run[unique_rows[run_begin:run_end] - start])
+    return np.concatenate(parts)[inverse]
+
+
+def as_padded_or_ragged(np_messages, ragged):
+    """Returns: np_messages as a RaggedArray if ragged is True, otherwise as a padded numpy matrix."""
+    if ragged:
+        return np_messages if isinstance(np_messages, RaggedArray) else RaggedArray.from_padded(np_messages)
+    return np_messages.to_padded() if isinstance(np_messages, RaggedArray) else np_messages
+
+
+def save_ragged_array(ragged, tokens_path, offsets_path):
+    """Save a RaggedArray as two .npy files, holding its tokens and offsets."""
+    np.save(tokens_path, np.asarray(ragged.tokens[ragged.offsets[0]:ragged.offsets[-1]]))
+    np.save(offsets_path, np.asarray(ragged.offsets) - ragged.offsets[0])
+
+
+def load_ragged_array(tokens_path, offsets_path, width, mmap=True):
+    """Load a RaggedArray saved with save_ragged_array(). If mmap is True, memory-map both files
+    instead of reading them."""
+    mmap_mode = 'r' if mmap else None
+    return RaggedArray(np.load(tokens_path, mmap_mode=mmap_mode), np.load(offsets_path, mmap_mode=mmap_mode), width)
+
+
+class GrowableDataset:
+    def __init__(self, group, name, row_shape=(), dtype='i', chunk_len=1024, compression=None, growth=2.0):
+        """Resizable h5py dataset which rows are appended to. Storage grows geometrically, by a factor of
+        growth, so that appending many partitions resizes the dataset only a logarithmic number of times.
+        Call trim() when done appending to cut the dataset down to the rows written.
+
+        Arguments:
+            - group: h5py group (or file) to create the dataset in
+            - name: name of the dataset
+            - row_shape: shape of each row, () for a flat array
+            - dtype: data type of the dataset
+            - chunk_len: number of rows per HDF5 chunk. Contiguous batches of rows are read a chunk at a time
+            - compression: None, 'lzf' or 'gzip'. Compressed chunks are byte-shuffled first (HDF5 shuffle filter)
+            - growth: factor the dataset size is multiplied by when it runs out of space
+        """
+        row_shape = tuple(row_shape)
+        self.dataset = group.create_dataset(name, (0,) + row_shape, maxshape=(None,) + row_shape, dtype=dtype,
+                                            chunks=(max(1, chunk_len),) + row_shape, compression=compression,
+                                            shuffle=compression is not None)
+        self.growth = growth
+        self.size = 0  # number of rows written
+
+    @classmethod
+    def reopen(cls, dataset, size, growth=2.0):
+        """Continue appending to an existing resizable dataset after its first size rows. Rows past
+        size, e.g. written after the last checkpoint of an interrupted run, are overwritten or trimmed."""
+        growable = cls.__new__(cls)
+        growable.dataset = dataset
+        growable.growth = growth
+        growable.size = size
+        return growable
+
+    def append(self, values):
+        """Write values after the rows written so far."""
+        if len(values) == 0:
+            return
+        end = self.size + len(values)
+        if end > self.dataset.shape[0]:
+            self.dataset.resize(max(end, int(self.dataset.shape[0] * self.growth)), axis=0)
+        self.dataset[self.size:end] = values
+        self.size = end
+
+    def trim(self):
+        """Resize the dataset to the rows written.
+
+        Returns: the h5py dataset."""
+        self.dataset.resize(self.size, axis=0)
+        return self.dataset
+
+
+def shuffle_rows_on_disk(group, scratch_group, random, block_len=1000000):
+    """Shuffle the sentences saved in an h5py group in place, holding about block_len rows in memory
+    at a time. The group holds either a padded 'messages' matrix or ragged 'tokens' and 'offsets'.
+
+    Rows are shuffled in two sequential passes. The first reads blocks of rows and appends each row to
+    one of about num_rows / block_len buckets in scratch_group, picked uniformly at random. The second
+    shuffles each bucket in memory and writes the buckets back one after another. This gives a uniformly
+    random permutation, which is saved as 'shuffle_order': shuffled row i was row shuffle_order[i].
+
+    Arguments:
+        - group: h5py group (or file) holding the rows
+        - scratch_group: empty h5py group used to hold buckets, with room for a copy of the rows
+        - random: numpy RandomState used to shuffle
+        - block_len: number of rows read at a time, and expected number of rows per bucket
+
+    Returns: the 'shuffle_order' dataset."""
+    ragged = 'tokens' in group
+    if ragged:
+        tokens, offsets = group['tokens'], group['offsets']
+        width = int(tokens.attrs['width'])
+        num_rows = offsets.shape[0] - 1
+        bucket_features = {'tokens': (tokens.dtype, ()), 'lengths': (np.int64, ())}
+    else:
+        messages = group['messages']
+        num_rows = messages.shape[0]
+        bucket_features = {'messages': (messages.dtype, messages.shape[1:])}
+    num_buckets = max(1, -(-num_rows // block_len))
+
+    bucket_features['rows'] = (np.int64, ())
+    buckets = []
+    for index in range(num_buckets):
+        bucket_group = scratch_group.create_group(str(index))
+        buckets.append({name: GrowableDataset(bucket_group, name, row_shape, dtype, chunk_len=4096)
+                        for name, (dtype, row_shape) in bucket_features.items()})
+
+    # Pass 1: scatter rows to random buckets
+    for start in range(0, num_rows, block_len):
+        stop = min(start + block_len, num_rows)
+        if ragged:
+            block_offsets = offsets[start:stop + 1]
+            block = RaggedArray(tokens[block_offsets[0]:block_offsets[-1]], block_offsets - block_offsets[0], width)
+        else:
+            block = messages[start:stop]
+
+        assignments = random.randint(num_buckets, size=stop - start)
+        block_order = np.argsort(assignments, kind='stable')
+        bucket_ends = np.cumsum(np.bincount(assignments, minlength=num_buckets))
+        for bucket, bucket_start, bucket_end in zip(buckets, bucket_ends - np.diff(bucket_ends, prepend=0),
+                                                    bucket_ends):
+            rows = block_order[bucket_start:bucket_end]
+            if len(rows) == 0:
+                continue
+            bucket['rows'].append(start + rows)
+            if ragged:
+                part = block.take(rows)
+                bucket['tokens'].append(part.tokens)
+                bucket['lengths'].append(part.lengths())
+            else:
+                bucket['messages'].append(block[rows])
+
+    # Pass 2: shuffle each bucket in memory and write buckets back in order
+    if 'shuffle_order' in group:
+        del group['shuffle_order']
+    shuffle_order = group.create_dataset('shuffle_order', (num_rows,), dtype=np.int64)
+    position = 0
+    num_tokens = 0
+    for index, bucket in enumerate(buckets):
+        bucket = {name: growable.trim() for name, growable in bucket.items()}
+        permutation = random.permutation(bucket['rows'].shape[0])
+        if len(permutation) == 0:
+            del scratch_group[str(index)]
+            continue
+        end = position + len(permutation)
+        shuffle_order[position:end] = bucket['rows'][()][permutation]
+        if ragged:
+            bucket_offsets = np.zeros(len(permutation) + 1, dtype=np.int64)
+            np.cumsum(bucket['lengths'][()], out=bucket_offsets[1:])
+            part = RaggedArray(bucket['tokens'][()], bucket_offsets, width).take(permutation)
+            if len(part.tokens) > 0:
+                tokens[num_tokens:num_tokens + len(part.tokens)] = part.tokens
+            offsets[position + 1:end + 1] = num_tokens + part.offsets[1:]
+            num_tokens += len(part.tokens)
+        else:
+            messages[position:end] = bucket['messages'][()][permutation]
+        position = end
+        del scratch_group[str(index)]
+
+    return shuffle_order
+
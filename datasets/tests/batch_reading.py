@@ -0,0 +1,82 @@
+"""Tests for batch-level reading and prefetching."""
+import os
+import shutil
+import tempfile
+
+import h5py
+import numpy as np
+import unittest2
+
+from cic.datasets.batch_reading import BatchReadDataset, prefetch
+from cic.datasets.storage import RaggedArray, coalesced_runs, read_rows
+
+
+class ArrayDataset(BatchReadDataset):
+    def __init__(self, np_messages):
+        self.np_messages = np_messages
+
+    def __getitem__(self, index):
+        return {'message': self.np_messages[index]}
+
+    def __len__(self):
+        return len(self.np_messages)
+
+    def read_batch(self, indices):
+        return {'message': read_rows(self.np_messages, indices)}
+
+
+class BatchReadingTest(unittest2.TestCase):
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp()
+        self.np_messages = np.array([[index + 1] * (index % 4) + [0] * (4 - index % 4) for index in range(50)],
+                                    dtype=np.int32)
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    def test_coalesced_runs(self):
+        assert coalesced_runs([]) == []
+        assert coalesced_runs([1, 2, 3, 7, 9, 10]) == [(1, 4), (7, 8), (9, 11)]
+        assert coalesced_runs([1, 2, 3, 7, 9, 10], max_gap=1) == [(1, 4), (7, 11)]
+
+    def test_read_rows_from_disk(self):
+        indices = [17, 3, 4, 5, 49, 3, 0, 30]
+        with h5py.File(os.path.join(self.save_dir, 'data.hdf5'), 'w') as f:
+            ragged = RaggedArray.from_padded(self.np_messages)
+            f.create_dataset('messages', data=self.np_messages)
+            f.create_dataset('tokens', data=ragged.tokens)
+            f.create_dataset('offsets', data=ragged.offsets)
+
+            on_disk_ragged = RaggedArray(f['tokens'], f['offsets'], 4)
+            for max_gap in [0, 5]:
+                assert np.array_equal(read_rows(f['messages'], indices, max_gap), self.np_messages[indices])
+                assert np.array_equal(read_rows(on_disk_ragged, indices, max_gap), self.np_messages[indices])
+            assert np.array_equal(on_disk_ragged[indices], self.np_messages[indices])
+            assert read_rows(f['messages'], []).shape == (0, 4)
+
+    def test_generate_batches(self):
+        dataset = ArrayDataset(self.np_messages)
+        for prefetch_batches in [0, 2]:
+            batches = list(dataset.generate_batches(7, shuffle=True, prefetch_batches=prefetch_batches, seed=0))
+            assert [len(batch['message']) for batch in batches] == [7] * 7 + [1]
+            assert sorted(map(tuple, np.concatenate([batch['message'] for batch in batches]))) \
+                == sorted(map(tuple, self.np_messages))
+
+    def test_prefetch(self):
+        assert list(prefetch(range(100), queue_size=3)) == list(range(100))
+
+        def failing():
+            yield 1
+            raise KeyError('failed')
+
+        with self.assertRaises(KeyError):
+            list(prefetch(failing()))
+
+        # Stopping early stops the thread
+        items = prefetch(iter(range(1000)), queue_size=1)
+        assert next(items) == 0
+        items.close()
+
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -1,6 +1,14 @@
 """Tests for TorontoBookCorpus dataset class."""
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import numpy as np
 import unittest2
-from cic.datasets.book_corpus import TorontoBookCorpus
+import cic.datasets.book_corpus
+from cic.datasets.book_corpus import TorontoBookCorpus, byte_range_shards, read_shard_lines, \
+    read_lines_with_positions
 from cic.datasets.text_dataset import convert_numpy_array_to_strings
 import cic.paths
 
@@ -53,3 +61,111 @@ class TorontoBookCorpusTest(unittest2.TestCase):
 
         for i in range(len(messages)):
             print(messages[i])
+
+    def test_sharded_matches_sequential(self):
+        result_dir = tempfile.mkdtemp()
+        try:
+            sequential = TorontoBookCorpus(20, result_path=os.path.join(result_dir, 'sequential'), regenerate=True,
+                                           min_length=5, max_num_s=10000, max_part_len=10000, shuffle=False)
+            sharded = TorontoBookCorpus(20, result_path=os.path.join(result_dir, 'sharded'), regenerate=True,
+                                        min_length=5, max_num_s=10000, sharded=True, num_workers=4, shuffle=False)
+            assert sequential.vocab.id_to_token == sharded.vocab.id_to_token
+            assert np.array_equal(sequential.data, sharded.data)
+        finally:
+            shutil.rmtree(result_dir)
+
+    def test_sharded_at_default_settings(self):
+        # Both builds count vocabulary over all sentences, so partitions of max_part_len sentences (100000 by
+        # default) give the same results as shards, for any number of shards and workers
+        result_dir = tempfile.mkdtemp()
+        settings = dict(min_length=5, max_num_s=250000, seed=0)
+        try:
+            sequential = TorontoBookCorpus(20, result_path=os.path.join(result_dir, 'sequential'), regenerate=True,
+                                           **settings)
+            serial = TorontoBookCorpus(20, result_path=os.path.join(result_dir, 'serial'), regenerate=True,
+                                       sharded=True, **settings)
+            parallel = TorontoBookCorpus(20, result_path=os.path.join(result_dir, 'parallel'), regenerate=True,
+                                         sharded=True, num_workers=4, num_shards=50, **settings)
+            for sharded in [serial, parallel]:
+                assert sequential.vocab.id_to_token == sharded.vocab.id_to_token
+                assert np.array_equal(sequential.data, sharded.data)
+        finally:
+            shutil.rmtree(result_dir)
+
+    def test_sharded_stops_reading_at_max_num_s(self):
+        result_dir = tempfile.mkdtemp()
+        try:
+            filenames = [os.path.join(result_dir, 'p1.txt'), os.path.join(result_dir, 'p2.txt')]
+            for filename in filenames:
+                with open(filename, 'w') as f:
+                    f.write('the cat sat on a mat .\n' * 1000)
+
+            ingest_shard = cic.datasets.book_corpus._ingest_shard
+            shards_read = []
+
+            def count_shards(shard, *args):
+                shards_read.append(shard)
+                return ingest_shard(shard, *args)
+
+            with mock.patch.object(cic.paths, 'BOOK_CORPUS_P1', filenames[0]), \
+                    mock.patch.object(cic.paths, 'BOOK_CORPUS_P2', filenames[1]), \
+                    mock.patch.object(cic.datasets.book_corpus, '_ingest_shard', side_effect=count_shards):
+                tbc = TorontoBookCorpus(20, result_path=os.path.join(result_dir, 'result'), regenerate=True,
+                                        min_length=1, max_num_s=250, sharded=True, num_shards=20, shuffle=False)
+            assert len(tbc) == 250
+            assert len(shards_read) < 5
+        finally:
+            shutil.rmtree(result_dir)
+
+    def test_resume_after_interrupt(self):
+        result_dir = tempfile.mkdtemp()
+        settings = dict(min_length=5, max_num_s=10000, max_part_len=1000, seed=0)
+        try:
+            complete = TorontoBookCorpus(20, result_path=os.path.join(result_dir, 'complete'), regenerate=True,
+                                         **settings)
+
+            # Interrupt ingest when it starts converting the fourth partition
+            text_dataset = cic.datasets.book_corpus.TextDataset
+            num_partitions = []
+
+            def interrupt_fourth_partition(*args, **kwargs):
+                num_partitions.append(None)
+                if len(num_partitions) == 4:
+                    raise KeyboardInterrupt()
+                return text_dataset(*args, **kwargs)
+
+            with mock.patch.object(cic.datasets.book_corpus, 'TextDataset', side_effect=interrupt_fourth_partition):
+                with self.assertRaises(KeyboardInterrupt):
+                    TorontoBookCorpus(20, result_path=os.path.join(result_dir, 'resumed'), regenerate=True,
+                                      **settings)
+
+            resumed = TorontoBookCorpus(20, result_path=os.path.join(result_dir, 'resumed'), resume=True, **settings)
+            assert complete.vocab.id_to_token == resumed.vocab.id_to_token
+            assert np.array_equal(complete.data, resumed.data)
+        finally:
+            shutil.rmtree(result_dir)
+
+
+class ByteRangeShardTest(unittest2.TestCase):
+    def test_every_line_in_one_shard(self):
+        save_dir = tempfile.mkdtemp()
+        try:
+            filenames = [os.path.join(save_dir, 'a.txt'), os.path.join(save_dir, 'b.txt')]
+            lines = [['first line\n', '\n', 'a longer third line\n', 'x\n', 'no newline'], ['only line\n']]
+            for filename, file_lines in zip(filenames, lines):
+                with open(filename, 'w') as f:
+                    f.write(''.join(file_lines))
+
+            for num_shards in [1, 2, 3, 7, 100]:
+                shards = byte_range_shards(filenames, num_shards)
+                read_lines = [line for shard in shards for line in read_shard_lines(shard)]
+                assert read_lines == lines[0] + lines[1]
+
+            # Reading resumes from the position after any line
+            positioned_lines = list(read_lines_with_positions(filenames))
+            assert [line for position, line in positioned_lines] == lines[0] + lines[1]
+            for index, (position, line) in enumerate(positioned_lines):
+                assert [line for position, line in read_lines_with_positions(filenames, position)] \
+                    == (lines[0] + lines[1])[index + 1:]
+        finally:
+            shutil.rmtree(save_dir)
@@ -0,0 +1,56 @@
+"""Tests for building (context, response) examples from Cornell conversations."""
+import numpy as np
+import unittest2
+
+from cic.datasets.cmd_history import build_context_examples
+
+
+class BuildContextExamplesTest(unittest2.TestCase):
+    def setUp(self):
+        self.vocab = {'': 0, '<UNK>': 1, 'a': 2, 'b': 3, 'c': 4, 'd': 5, '<STOP>': 6}
+        self.convos = [[['a', '<STOP>'], ['b', 'c', '<STOP>'], ['d', 'x', 'a', '<STOP>']],
+                       [],
+                       [['c', 'c', 'c', 'c', '<STOP>'], ['a', '<STOP>']]]
+
+    def expected_examples(self, max_c_len, max_s_len, truncate_context):
+        examples = []
+        for convo in self.convos:
+            for index, response in enumerate(convo):
+                context = [token for message in convo[:index] for token in message]
+                if truncate_context:
+                    context = context[max(0, len(context) - max_c_len):]
+                if len(context) <= max_c_len and len(response) <= max_s_len:
+                    examples.append((context, response))
+        return examples
+
+    def test_windows_match_joined_messages(self):
+        for truncate_context in [False, True]:
+            contexts, targets = build_context_examples(self.convos, self.vocab, 5, 4,
+                                                       truncate_context=truncate_context, dtype=np.uint8)
+            examples = self.expected_examples(5, 4, truncate_context)
+            assert len(contexts) == len(targets) == len(examples)
+            assert contexts.tokens.dtype == np.uint8 and contexts.width == 5 and targets.width == 4
+            for index, (context, response) in enumerate(examples):
+                assert list(contexts[index]) == [self.vocab.get(token, 1) for token in context] \
+                    + [0] * (5 - len(context))
+                assert list(targets[index]) == [self.vocab.get(token, 1) for token in response] \
+                    + [0] * (4 - len(response))
+
+        # Without truncation, examples with 5 tokens of context are left out
+        contexts, _ = build_context_examples(self.convos, self.vocab, 4, 5)
+        assert len(contexts) == 3
+        contexts, _ = build_context_examples(self.convos, self.vocab, 4, 5, truncate_context=True)
+        assert len(contexts) == 5 and list(contexts[4]) == [4, 4, 4, 6]
+
+    def test_windowed_examples_share_tokens(self):
+        contexts, targets = build_context_examples(self.convos, self.vocab, 4, 5, truncate_context=True)
+        windowed_contexts, windowed_targets = build_context_examples(self.convos, self.vocab, 4, 5,
+                                                                     truncate_context=True, windowed=True)
+        assert windowed_contexts.tokens is windowed_targets.tokens
+        assert len(windowed_contexts.tokens) == 16  # every message once
+        assert np.array_equal(windowed_contexts.to_padded(), contexts.to_padded())
+        assert np.array_equal(windowed_targets[[4, 0]], targets[[4, 0]])
+
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,39 @@
+"""Tests for encoding Cornell conversations as [num_convos, N, max_s_len] arrays."""
+import copy
+
+import numpy as np
+import unittest2
+
+import cic.utils.mdd_tools as mddt
+
+
+class ConversationsToNumpyTest(unittest2.TestCase):
+    def setUp(self):
+        self.vocab = {'': 0, '<UNK>': 1, '<STOP>': 2, 'hi': 3, 'there': 4, 'bye': 5}
+        self.id_to_message = {'L1': ['u0', 'm0', 'A', 'hi there', ['hi', 'there']],
+                              'L2': ['u1', 'm0', 'B', 'bye now', ['bye', 'now']],
+                              'L3': ['u0', 'm0', 'A', 'hi hi hi hi', ['hi', 'hi', 'hi', 'hi']],
+                              'L4': None}
+        self.convos = [['u0', 'u1', 'm0', ['L1', 'L2', 'L3']],
+                       ['u0', 'u1', 'm0', ['L2', 'L4']],
+                       ['u0', 'u1', 'm0', ['L3']]]
+
+    def test_conversations_to_numpy(self):
+        id_to_message = copy.deepcopy(self.id_to_message)
+        np_convos = mddt.conversations_to_numpy(self.convos, id_to_message, self.vocab, 2, 3)
+        assert np_convos.shape == (3, 2, 3) and np_convos.dtype == np.uint8
+        assert np.array_equal(np_convos[0], [[3, 4, 2], [5, 1, 2]])
+        assert not np_convos[1].any()
+        assert np.array_equal(np_convos[2], [[3, 3, 3], [0, 0, 0]])
+
+        # Messages are left unchanged, so encoding again gives the same result
+        assert id_to_message == self.id_to_message
+        assert np.array_equal(mddt.conversations_to_numpy(self.convos, id_to_message, self.vocab, 2, 3), np_convos)
+
+        np_convos = mddt.conversations_to_numpy(self.convos, id_to_message, self.vocab, 4, 5, add_stop=False)
+        assert np.array_equal(np_convos[0, :3, :3], [[3, 4, 0], [5, 1, 0], [3, 3, 3]])
+        assert np_convos[0, 2, 3] == 3 and not np_convos[0, 3].any()
+
+
+if __name__ == '__main__':
+    unittest2.main()
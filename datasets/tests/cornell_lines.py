@@ -0,0 +1,54 @@
+"""Tests for the pre-parsed store of Cornell movie lines."""
+import os
+import shutil
+import tempfile
+
+import spacy
+import unittest2
+
+from cic.datasets.cornell_lines import load_cornell_lines
+import cic.utils.mdd_tools as mddt
+
+
+class CornellLineStoreTest(unittest2.TestCase):
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp()
+        self.movie_lines_filename = os.path.join(self.save_dir, 'movie_lines.txt')
+        with open(self.movie_lines_filename, 'wb') as f:
+            f.write(b'L2 +++$+++ u0 +++$+++ m0 +++$+++ BIANCA +++$+++ They do not!\n')
+            f.write(b'L3 +++$+++ u2 +++$+++ m0 +++$+++ CAMERON +++$+++ \xff\n')
+            f.write(b'L1 +++$+++ u2 +++$+++ m0 +++$+++ CAMERON +++$+++ They  do to.\n')
+            f.write(b'L4 +++$+++ u0 +++$+++ m0 +++$+++ BIANCA +++$+++ \n')
+        self.nlp = spacy.load('en')
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    def test_store_matches_parsed_lines(self):
+        line_store = load_cornell_lines(self.movie_lines_filename, self.nlp)
+        assert len(line_store) == 3 and 'L3' not in line_store
+        assert list(line_store.messages()) == ['They do not!', 'They  do to.', '']
+        assert line_store.message_info('L2', '<STOP>') \
+            == ['u0', 'm0', 'BIANCA', 'They do not!', ['they', 'do', 'not', '!', '<STOP>']]
+        assert line_store.message_info('L4') == ['u0', 'm0', 'BIANCA', '', []]
+
+        id_to_message = {'L1': None, 'L3': None}
+        mddt.load_messages_from_cornell_movie_lines_by_id(id_to_message, line_store, '<STOP>')
+        assert id_to_message['L3'] is None
+        assert id_to_message['L1'][-1] == [str(token) for token in self.nlp.tokenizer('they  do to.')
+                                           if str(token) != ' '] + ['<STOP>']
+
+        assert mddt.load_messages_from_cornell_movie_lines(line_store, max_number_of_messages=1,
+                                                           max_message_length=3) == [[]]
+
+    def test_store_is_rebuilt_when_file_changes(self):
+        load_cornell_lines(self.movie_lines_filename, self.nlp)
+        with open(self.movie_lines_filename, 'ab') as f:
+            f.write(b'L5 +++$+++ u2 +++$+++ m0 +++$+++ CAMERON +++$+++ Hi there\n')
+        os.utime(self.movie_lines_filename, (0, 0))
+        line_store = load_cornell_lines(self.movie_lines_filename)
+        assert 'L5' in line_store and line_store.tokens(line_store.id_to_row['L5']) == ['hi', 'there']
+
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,64 @@
+"""Tests for length-bucketed batching."""
+import numpy as np
+import unittest2
+from arcadian.dataset import DictionaryDataset
+
+from cic.datasets.length_bucketing import LengthBucketedDataset, message_lengths, length_bucketed_batches
+
+
+class LengthBucketingTest(unittest2.TestCase):
+    def setUp(self):
+        # Stop token has index 1
+        self.np_messages = np.array([[4, 5, 1, 0, 0],
+                                     [3, 1, 0, 0, 0],
+                                     [6, 7, 8, 9, 1],
+                                     [1, 0, 0, 0, 0],
+                                     [5, 4, 1, 0, 0],
+                                     [2, 2, 2, 1, 0]])
+
+    def test_message_lengths(self):
+        assert list(message_lengths(self.np_messages, stop_id=1)) == [2, 1, 4, 0, 2, 3]
+        assert list(message_lengths(self.np_messages)) == [3, 2, 5, 1, 3, 4]
+
+    def test_batches_cover_all_examples(self):
+        lengths = message_lengths(self.np_messages, stop_id=1)
+        for shuffle in [True, False]:
+            batches = length_bucketed_batches(lengths, 2, shuffle=shuffle, random=np.random.RandomState(0))
+            assert sorted(np.concatenate(batches)) == list(range(len(lengths)))
+            # Each batch holds neighbours in length order
+            assert sorted(tuple(sorted(lengths[batch])) for batch in batches) == [(0, 1), (2, 2), (3, 4)]
+
+    def test_trim(self):
+        dataset = LengthBucketedDataset(DictionaryDataset({'message': self.np_messages}), stop_id=1, trim=True,
+                                        seed=0)
+        num_examples = 0
+        num_tokens = 0
+        for batch in dataset.generate_batches(2):
+            np_messages = batch['message']
+            num_examples += len(np_messages)
+            num_tokens += message_lengths(np_messages, stop_id=1).sum()
+            # Only padding was trimmed: the longest member still ends with its stop token
+            assert (np_messages[:, -1] == 1).any()
+        assert num_examples == len(self.np_messages)
+        assert num_tokens == message_lengths(self.np_messages, stop_id=1).sum()
+        assert dataset.tokens_per_sec > 0
+
+    def test_contexts_with_several_stop_tokens(self):
+        # Contexts of conversations end each of their messages with the stop token
+        np_contexts = np.array([[4, 5, 1, 3, 1, 6, 1],
+                                [7, 1, 0, 0, 0, 0, 0],
+                                [0, 0, 0, 0, 0, 0, 0],
+                                [8, 1, 9, 9, 1, 0, 0]])
+        assert list(message_lengths(np_contexts)) == [7, 2, 0, 5]
+
+        dataset = LengthBucketedDataset(DictionaryDataset({'message': np_contexts}), trim=True, seed=0)
+        assert list(dataset.lengths) == [7, 2, 0, 5]
+        num_tokens = 0
+        for batch in dataset.generate_batches(2):
+            num_tokens += (batch['message'] != 0).sum()
+        # No token after the first stop token was trimmed
+        assert num_tokens == (np_contexts != 0).sum()
+
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,83 @@
+"""Tests for the keyed preprocessing cache used by TextDataset."""
+import os
+import shutil
+import tempfile
+import time
+
+import unittest2
+
+from cic.datasets.preprocessing_cache import PreprocessingCache, count_lines
+
+
+class PreprocessingCacheTest(unittest2.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_key_depends_on_strings_and_params(self):
+        cache = PreprocessingCache(self.cache_dir)
+        key = cache.key({'max_length': 10}, strings=['hello world', 'goodbye'])
+        assert key == cache.key({'max_length': 10}, strings=['hello world', 'goodbye'])
+        assert key != cache.key({'max_length': 11}, strings=['hello world', 'goodbye'])
+        assert key != cache.key({'max_length': 10}, strings=['hello world', 'goodbye!'])
+        assert key != cache.key({'max_length': 10}, source_id='file')
+
+    def test_lru_eviction(self):
+        cache = PreprocessingCache(self.cache_dir, max_entries=2)
+        for key in ['a', 'b', 'c']:
+            cache.touch(key)
+            time.sleep(0.01)
+
+        # Entry 'a' is used again, so 'b' is now the least recently used entry.
+        cache.touch('a')
+        cache.evict(keep='a')
+
+        assert os.path.exists(cache.entry_path('a'))
+        assert not os.path.exists(cache.entry_path('b'))
+        assert os.path.exists(cache.entry_path('c'))
+
+    def test_contains(self):
+        cache = PreprocessingCache(self.cache_dir)
+        cache.touch('a')
+        assert not cache.contains('a', ['data.npy'])
+        open(os.path.join(cache.entry_path('a'), 'data.npy'), 'w').close()
+        assert cache.contains('a', ['data.npy'])
+
+
+class CountLinesTest(unittest2.TestCase):
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.save_dir, 'lines.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    def test_count_lines(self):
+        for text, num_lines in [('', 0), ('one', 1), ('one\n', 1), ('one\ntwo', 2), ('one\n\nthree\n', 3)]:
+            with open(self.filename, 'w') as f:
+                f.write(text)
+            assert count_lines(self.filename, buffer_size=2) == num_lines
+
+    def test_counts_are_stored(self):
+        counts_path = os.path.join(self.save_dir, 'line_counts.json')
+        with open(self.filename, 'w') as f:
+            f.write('one\ntwo\n')
+        assert count_lines(self.filename, counts_path) == 2
+
+        # The stored count is used while the file's size and modification time are unchanged
+        stat = os.stat(self.filename)
+        with open(self.filename, 'w') as f:
+            f.write('one two\n')
+        os.utime(self.filename, (stat.st_atime, stat.st_mtime))
+        assert count_lines(self.filename, counts_path) == 2
+
+        # Files that changed are counted again
+        with open(self.filename, 'a') as f:
+            f.write('three\nfour\n')
+        assert count_lines(self.filename, counts_path) == 3
+
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,54 @@
+"""Tests for the sentence filter pipeline."""
+import unittest2
+
+from cic.datasets.book_corpus import book_corpus_filter
+from cic.datasets.sentence_filters import Rule, SentenceFilter, forbid_pattern, only_letters_and, \
+    no_adjacent_duplicate_words, normalize_whitespace
+from cic.datasets.uk_wac import ukwac_filter
+
+
+class SentenceFilterTest(unittest2.TestCase):
+    def test_first_failing_rule_is_counted(self):
+        sentence_filter = SentenceFilter([forbid_pattern('digits', r'\d'),
+                                          Rule('short', lambda s: len(s.split()) < 3)],
+                                         normalize=normalize_whitespace)
+        sentences = ['  a  b ', 'a 1', 'a b c', 'a b 1 c', 'c']
+        assert list(sentence_filter.filter(sentences)) == ['a b', 'c']
+        assert sentence_filter.counts() == (2, {'digits': 2, 'short': 1})
+        assert sentence_filter.num_seen == 5
+
+        sentence_filter.add_counts((1, {'digits': 1, 'short': 0}))
+        assert sentence_filter.counts() == (3, {'digits': 3, 'short': 1})
+        assert 'rejected by digits: 3' in sentence_filter.report()
+
+    def test_rules(self):
+        letters = only_letters_and('letters', ' .')
+        assert letters.accept('Hello there. Bye.')
+        assert letters.accept('')
+        assert not letters.accept("don't")
+
+        duplicates = no_adjacent_duplicate_words()
+        assert not duplicates.accept('the theory of the the')
+        assert duplicates.accept('the theory the')
+        assert duplicates.accept('a ab ab.')
+        assert not duplicates.accept('no no')
+
+    def test_book_corpus_filter(self):
+        sentence_filter = book_corpus_filter()
+        assert sentence_filter('  he  ran away .\n') == 'he ran away .'
+        assert sentence_filter('he said , go .') is None
+        assert sentence_filter('go go now') is None
+        assert sentence_filter.counts()[0] == 1
+
+    def test_ukwac_filter(self):
+        sentence_filter = ukwac_filter(max_length=4)
+        assert sentence_filter('The Cat sat') == 'the cat sat'
+        assert sentence_filter('the cat sat down') is None
+        assert sentence_filter('Current URL http') is None
+        assert sentence_filter('in 1990') is None
+        assert sentence_filter('a (small) cat') is None
+        assert sentence_filter('   ') is None
+
+
+if __name__ == '__main__':
+    unittest2.main()
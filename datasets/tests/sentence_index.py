@@ -0,0 +1,58 @@
+"""Tests for the sentence hash index."""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import unittest2
+
+from cic.datasets.sentence_index import SentenceHashIndex, sentence_hash, sentence_hashes
+
+
+class SentenceHashIndexTest(unittest2.TestCase):
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    def test_hash(self):
+        assert sentence_hash('the cat sat .') == sentence_hash('  the  cat sat .\n')
+        assert sentence_hash('the cat sat .') != sentence_hash('the cat sat')
+        assert sentence_hashes(['a', 'b']).dtype == np.uint64
+
+    def test_add(self):
+        index = SentenceHashIndex()
+        assert list(index.add(sentence_hashes(['a', 'b', 'a', 'c']))) == [True, True, False, True]
+        assert list(index.add(sentence_hashes(['c', 'd', 'd']))) == [False, True, False]
+        assert len(index) == 4
+        assert 'd' in index and 'e' not in index
+
+    def test_levels_stay_few(self):
+        random = np.random.RandomState(0)
+        index = SentenceHashIndex()
+        all_hashes = random.randint(0, 2 ** 63, size=20000, dtype=np.int64).astype(np.uint64)
+        for start in range(0, len(all_hashes), 100):
+            index.add(all_hashes[start:start + 100])
+            assert len(index.levels) <= 10
+        assert index.contains(all_hashes).all()
+        assert np.array_equal(index.compact(), np.unique(all_hashes))
+
+    def test_save_load(self):
+        index = SentenceHashIndex.from_sentences(['one .', 'two .', 'one .', 'three .'], chunk_size=2)
+        path = os.path.join(self.save_dir, 'index.npy')
+        index.save(path)
+        for mmap in [True, False]:
+            loaded = SentenceHashIndex.load(path, mmap=mmap)
+            assert len(loaded) == 3
+            assert list(loaded.contains_sentences(['two .', 'four .', 'three  .'])) == [True, False, True]
+
+    def test_empty(self):
+        index = SentenceHashIndex()
+        assert len(index) == 0
+        assert list(index.contains_sentences(['a'])) == [False]
+        assert len(index.compact()) == 0
+
+
+if __name__ == '__main__':
+    unittest2.main()
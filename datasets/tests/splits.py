@@ -0,0 +1,61 @@
+"""Tests for persisted train/validation split manifests."""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import unittest2
+from arcadian.dataset import DictionaryDataset
+
+from cic.datasets.splits import SPLIT_FORMAT_VERSION, persisted_split, split_indices, split_manifest_path
+
+
+class PersistedSplitTest(unittest2.TestCase):
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp()
+        self.dataset = DictionaryDataset({'message': np.arange(200).reshape(100, 2)})
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    def test_split_indices(self):
+        first, second = split_indices(100, 0.9, 'seed')
+        assert len(first) == 90 and len(second) == 10
+        assert np.array_equal(np.sort(np.concatenate([first, second])), np.arange(100))
+        assert np.array_equal(first, split_indices(100, 0.9, 'seed')[0])
+        assert not np.array_equal(second, split_indices(100, 0.9, 'other seed')[1])
+
+    def test_split_is_saved_and_loaded(self):
+        train, val = persisted_split(self.dataset, 0.9, 'seed', self.save_dir)
+        path = split_manifest_path(self.save_dir, 0.9, 'seed')
+        assert os.path.isfile(path)
+        assert len(train) == 90 and len(val) == 10
+        assert np.array_equal(val[3]['message'], self.dataset[val.indices[3]]['message'])
+        assert np.array_equal(val.read_batch([1, 0])['message'],
+                              self.dataset.d['message'][val.indices[[1, 0]]])
+
+        modified_time = os.path.getmtime(path)
+        _, loaded_val = persisted_split(self.dataset, 0.9, 'seed', self.save_dir)
+        assert np.array_equal(loaded_val.indices, val.indices)
+        assert os.path.getmtime(path) == modified_time
+
+        # A manifest made for a different number of examples is replaced
+        smaller = DictionaryDataset({'message': np.arange(100).reshape(50, 2)})
+        smaller_train, _ = persisted_split(smaller, 0.9, 'seed', self.save_dir)
+        assert len(smaller_train) == 45 and smaller_train.indices.max() < 50
+
+    def test_manifest_of_other_version_is_not_loaded(self):
+        path = split_manifest_path(self.save_dir, 0.9, 'seed')
+        assert os.path.basename(path).startswith('split_v%s_' % SPLIT_FORMAT_VERSION)
+        with open(path, 'wb') as f:
+            np.savez(f, first=np.arange(10), second=np.arange(10, 100), num_examples=100, fraction=0.9, seed='seed')
+        train, _ = persisted_split(self.dataset, 0.9, 'seed', self.save_dir)
+        assert len(train) == 90
+
+    def test_seed_is_required(self):
+        with self.assertRaises(ValueError):
+            persisted_split(self.dataset, 0.9, None, self.save_dir)
+
+
+if __name__ == '__main__':
+    unittest2.main()
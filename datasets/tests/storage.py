@@ -0,0 +1,190 @@
+"""Tests for compact on-disk storage formats."""
+import os
+import shutil
+import tempfile
+
+import h5py
+import numpy as np
+import unittest2
+
+from cic.datasets.storage import save_string_blob, load_string_blob, RaggedArray, save_ragged_array, \
+    load_ragged_array, shuffle_rows_on_disk, GrowableDataset, WindowArray
+from cic.utils.token_tools import token_dtype, widen_tokens
+
+
+class StringBlobTest(unittest2.TestCase):
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp()
+        self.blob_path = os.path.join(self.save_dir, 'strings.bin')
+        self.offsets_path = os.path.join(self.save_dir, 'offsets.npy')
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    def test_round_trip(self):
+        strings = ['hello world .', '', 'café au lait', 'the end']
+        save_string_blob(strings, self.blob_path, self.offsets_path)
+
+        for mmap in [True, False]:
+            blob = load_string_blob(self.blob_path, self.offsets_path, mmap=mmap)
+            assert len(blob) == len(strings)
+            assert list(blob) == strings
+            assert blob[-1] == 'the end'
+            assert list(blob[1:3]) == strings[1:3]
+            assert list(blob[:100]) == strings
+            assert blob.tolist() == strings and blob[1:3].tolist() == strings[1:3]
+
+    def test_empty(self):
+        save_string_blob([], self.blob_path, self.offsets_path)
+        blob = load_string_blob(self.blob_path, self.offsets_path, mmap=True)
+        assert len(blob) == 0
+        assert list(blob) == []
+
+
+
+class RaggedArrayTest(unittest2.TestCase):
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp()
+        self.tokens_path = os.path.join(self.save_dir, 'tokens.npy')
+        self.offsets_path = os.path.join(self.save_dir, 'offsets.npy')
+        self.np_messages = np.array([[4, 5, 1, 0], [0, 0, 0, 0], [3, 0, 2, 1], [6, 1, 0, 0]], dtype=np.int32)
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    def test_from_padded(self):
+        ragged = RaggedArray.from_padded(self.np_messages)
+        assert ragged.shape == self.np_messages.shape
+        assert list(ragged.lengths()) == [3, 0, 4, 2]
+        assert np.array_equal(ragged.to_padded(), self.np_messages)
+        assert np.array_equal(np.asarray(ragged), self.np_messages)
+
+    def test_indexing(self):
+        ragged = RaggedArray.from_padded(self.np_messages)
+        assert np.array_equal(ragged[2], self.np_messages[2])
+        assert np.array_equal(ragged[-1], self.np_messages[-1])
+        assert np.array_equal(ragged[[3, 0]], self.np_messages[[3, 0]])
+        assert np.array_equal(ragged[1:3].to_padded(), self.np_messages[1:3])
+        assert np.array_equal(ragged[::2], self.np_messages[::2])
+        assert ragged[2, -1] == 1
+        with self.assertRaises(IndexError):
+            ragged[4]
+
+    def test_concatenate(self):
+        first = RaggedArray.from_padded(self.np_messages[:2])
+        second = RaggedArray.from_padded(self.np_messages)[2:]
+        ragged = RaggedArray.concatenate([first, second], 4)
+        assert np.array_equal(ragged.to_padded(), self.np_messages)
+
+    def test_take(self):
+        ragged = RaggedArray.from_padded(self.np_messages).take([3, 1, 0])
+        assert np.array_equal(ragged.to_padded(), self.np_messages[[3, 1, 0]])
+
+    def test_save_load(self):
+        for np_messages in [self.np_messages, self.np_messages[1:2], self.np_messages[:0]]:
+            save_ragged_array(RaggedArray.from_padded(np_messages), self.tokens_path, self.offsets_path)
+            for mmap in [True, False]:
+                ragged = load_ragged_array(self.tokens_path, self.offsets_path, 4, mmap=mmap)
+                assert np.array_equal(ragged.to_padded(), np_messages)
+
+
+
+class WindowArrayTest(unittest2.TestCase):
+    def test_overlapping_windows(self):
+        windows = WindowArray(np.array([4, 5, 6, 7], dtype=np.uint8), np.array([0, 1, 2, 0]), np.array([2, 3, 0, 1]),
+                              3)
+        np_padded = np.array([[4, 5, 0], [5, 6, 7], [0, 0, 0], [4, 0, 0]], dtype=np.uint8)
+        assert windows.shape == (4, 3) and windows.dtype == np.uint8
+        assert np.array_equal(windows.to_padded(), np_padded)
+        assert np.array_equal(windows[1], np_padded[1]) and np.array_equal(windows[-1], np_padded[-1])
+        assert np.array_equal(windows[[3, -3]], np_padded[[3, 1]])
+        assert np.array_equal(windows[1:3].to_padded(), np_padded[1:3])
+        assert np.array_equal(windows[:, 0], np_padded[:, 0])
+        assert np.array_equal(windows.to_ragged().to_padded(), np_padded)
+        with self.assertRaises(IndexError):
+            windows[4]
+
+
+class ShuffleRowsOnDiskTest(unittest2.TestCase):
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp()
+        self.np_messages = np.array([[index % 7 + 1] * (index % 5) + [0] * (5 - index % 5) for index in range(103)],
+                                    dtype=np.int32)
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    def shuffle(self, ragged):
+        with h5py.File(os.path.join(self.save_dir, 'data.hdf5'), 'w') as f, \
+                h5py.File(os.path.join(self.save_dir, 'scratch.hdf5'), 'w') as scratch:
+            if ragged:
+                ragged_messages = RaggedArray.from_padded(self.np_messages)
+                f.create_dataset('tokens', data=ragged_messages.tokens).attrs['width'] = 5
+                f.create_dataset('offsets', data=ragged_messages.offsets)
+            else:
+                f.create_dataset('messages', data=self.np_messages)
+
+            shuffle_order = shuffle_rows_on_disk(f, scratch, np.random.RandomState(0), block_len=10)[()]
+            assert len(scratch) == 0
+            if ragged:
+                shuffled = RaggedArray(f['tokens'][()], f['offsets'][()], 5).to_padded()
+            else:
+                shuffled = f['messages'][()]
+        return shuffle_order, shuffled
+
+    def test_shuffle_is_recorded_permutation(self):
+        for ragged in [False, True]:
+            shuffle_order, shuffled = self.shuffle(ragged)
+            assert sorted(shuffle_order) == list(range(len(self.np_messages)))
+            assert not np.array_equal(shuffle_order, np.arange(len(self.np_messages)))
+            assert np.array_equal(shuffled, self.np_messages[shuffle_order])
+
+
+
+class GrowableDatasetTest(unittest2.TestCase):
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    def test_append_and_trim(self):
+        with h5py.File(os.path.join(self.save_dir, 'data.hdf5'), 'w') as f:
+            growable = GrowableDataset(f, 'messages', (3,), chunk_len=4, compression='lzf')
+            num_resizes = 0
+            for index in range(100):
+                old_shape = growable.dataset.shape
+                growable.append(np.full([index % 3, 3], index))
+                num_resizes += growable.dataset.shape != old_shape
+            assert num_resizes < 10
+            messages = growable.trim()[()]
+            assert messages.shape == (99, 3)
+            assert np.array_equal(messages[:, 0], [index for index in range(100) for _ in range(index % 3)])
+            assert f['messages'].compression == 'lzf' and f['messages'].shuffle
+
+    def test_layouts_round_trip(self):
+        # Throughput and size of these layouts are compared by exec/benchmark_hdf5_layout.py
+        random = np.random.RandomState(0)
+        np_messages = random.randint(0, 20000, size=[2000, 20]).astype(np.int32)
+        for compression in [None, 'lzf', 'gzip']:
+            with h5py.File(os.path.join(self.save_dir, '%s.hdf5' % compression), 'w') as f:
+                growable = GrowableDataset(f, 'messages', (20,), chunk_len=64, compression=compression)
+                for partition in np.array_split(np_messages, 7):
+                    growable.append(partition)
+                messages = growable.trim()
+                assert messages.compression == compression and messages.chunks == (64, 20)
+                assert np.array_equal(messages[()], np_messages)
+
+
+class TokenDtypeTest(unittest2.TestCase):
+    def test_token_dtype(self):
+        assert token_dtype(256) == np.uint8
+        assert token_dtype(257) == np.uint16
+        assert token_dtype(65536) == np.uint16
+        assert token_dtype(70000) == np.uint32
+        assert widen_tokens(np.array([3, 65535], dtype=np.uint16)).dtype == np.int32
+        assert widen_tokens(np.array([3], dtype=np.int64)).dtype == np.int64
+
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,63 @@
+"""Tests for streaming TextDataset construction: tokenizing in worker processes and spooling tokens to disk."""
+import pickle
+import random
+import shutil
+import tempfile
+
+import numpy as np
+import spacy
+import unittest2
+
+from cic.datasets.text_dataset import TextDataset, read_spool
+
+
+class TextDatasetStreamingTest(unittest2.TestCase):
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp()
+        self.nlp = spacy.load('en_core_web_sm')
+        random_words = random.Random(0)
+        words = ['the', 'cat', 'sat', 'on', 'a', 'mat', 'dog', 'ran', ',', '.', 'Zebra']
+        self.strings = [' '.join(random_words.choice(words) for _ in range(random_words.randint(0, 12)))
+                        for _ in range(500)]
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    def build(self, **kwargs):
+        # Strings come from a generator, so they can only be read once
+        return TextDataset((each_string for each_string in self.strings), 10, min_length=3, nlp=self.nlp,
+                           chunk_size=7, vocab_min_freq=2, **kwargs)
+
+    def test_workers_give_identical_results(self):
+        single = self.build(num_workers=1)
+        multiple = self.build(num_workers=3)
+        assert len(single) > 0
+        assert single.id_to_token == multiple.id_to_token
+        assert np.array_equal(single.np_messages, multiple.np_messages)
+        assert single.messages == multiple.messages
+
+    def test_spooled_tokens_match_in_memory_conversion(self):
+        dataset = self.build()
+
+        # Chunks are spooled after length filtering, so some chunks are empty
+        np_messages, messages = dataset.convert_strings_to_numpy(self.strings)
+        assert np.array_equal(dataset.np_messages, np_messages)
+        assert dataset.messages == messages
+
+        saved = self.build(result_save_path=self.save_dir, source_id='strings', num_workers=2)
+        loaded = self.build(result_save_path=self.save_dir, source_id='strings')
+        assert saved.id_to_token == loaded.id_to_token == dataset.id_to_token
+        assert np.array_equal(loaded.np_messages, dataset.np_messages)
+        assert loaded.messages == dataset.messages
+
+    def test_read_spool(self):
+        with tempfile.TemporaryFile() as spool:
+            chunks = [[['a', 'b']], [], [['c'], []]]
+            for chunk in chunks:
+                pickle.dump(chunk, spool)
+            spool.seek(0)
+            assert list(read_spool(spool)) == chunks
+
+
+if __name__ == '__main__':
+    unittest2.main()
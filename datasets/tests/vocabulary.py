@@ -0,0 +1,94 @@
+"""Tests for the array-backed Vocabulary."""
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import unittest2
+
+from cic.datasets.vocabulary import Vocabulary, load_legacy_vocabulary
+from cic.utils.token_tools import id_to_token_array
+
+
+class VocabularyTest(unittest2.TestCase):
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    def test_lookup(self):
+        vocab = Vocabulary(['', '<STOP>', '<UNK>', 'hello'])
+        assert vocab['hello'] == 3
+        assert vocab.id_to_token[1] == '<STOP>'
+        assert 'world' not in vocab
+        assert vocab.add('world') == 4
+        assert vocab.add('hello') == 3
+        assert dict(vocab) == {'': 0, '<STOP>': 1, '<UNK>': 2, 'hello': 3, 'world': 4}
+
+    def test_from_dict(self):
+        vocab = Vocabulary.from_dict({'b': 1, 'a': 0})
+        assert vocab.id_to_token == ['a', 'b']
+
+        # Dictionaries pickled by older versions can skip indices and give tokens the same index
+        vocab = Vocabulary.from_dict({'<STOP>': 0, '<UNK>': 1, '': 0, 'a': 1, 'b': 3})
+        assert len(vocab) == 4
+        assert vocab.id_to_token == ['', 'a', '', 'b']
+        assert vocab['<STOP>'] == 0 and vocab['b'] == 3
+        assert vocab.add('c') == 4
+        assert vocab.decode(np.array([[3, 2, 1]])) == ['b a']
+
+        with self.assertRaises(ValueError):
+            Vocabulary.from_dict({'a': -1})
+
+    def test_legacy_vocabulary(self):
+        token_to_id = {'<STOP>': 0, '<UNK>': 1, 'the': 0, 'cat': 1, 'sat': 2}
+        path = os.path.join(self.save_dir, 'vocab.pkl')
+        with open(path, 'wb') as f:
+            pickle.dump(token_to_id, f)
+
+        vocab = load_legacy_vocabulary(path)
+        assert dict(vocab) == token_to_id
+
+        # Saving keeps every index, including shared ones
+        vocab.save(os.path.join(self.save_dir, 'vocab.npz'))
+        loaded = Vocabulary.load(os.path.join(self.save_dir, 'vocab.npz'))
+        assert dict(loaded) == token_to_id
+        assert loaded.id_to_token == vocab.id_to_token == ['the', 'cat', 'sat']
+
+    def test_save_load(self):
+        vocab = Vocabulary(['', '<STOP>', 'café', 'the'])
+        path = os.path.join(self.save_dir, 'vocab.npz')
+        vocab.save(path)
+
+        loaded = Vocabulary.load(path)
+        assert loaded.id_to_token == vocab.id_to_token
+        assert loaded['café'] == 2
+
+        # Indices without a token are kept free, even if '' is a token
+        vocab = Vocabulary.from_dict({'': 0, 'a': 2})
+        vocab.save(path)
+        loaded = Vocabulary.load(path)
+        assert dict(loaded) == {'': 0, 'a': 2}
+        assert loaded.id_to_token == ['', '', 'a']
+
+    def test_encode_decode(self):
+        vocab = Vocabulary(['', '<STOP>', '<UNK>', 'hello', 'world'])
+        np_messages = vocab.encode([['hello', 'there', 'world', '<STOP>']], 5, unk_token='<UNK>')
+        assert np.array_equal(np_messages, [[3, 2, 4, 1, 0]])
+        assert vocab.decode(np_messages, stop_token='<STOP>') == ['hello <UNK> world']
+
+    def test_token_array_is_cached(self):
+        vocab = Vocabulary(['', '<STOP>', 'hello'])
+        assert id_to_token_array(vocab) is vocab.token_array()
+        assert list(vocab.token_array()) == ['', '<STOP>', 'hello']
+        vocab.add('world')
+        assert list(id_to_token_array(vocab)) == ['', '<STOP>', 'hello', 'world']
+        assert pickle.loads(pickle.dumps(vocab)).id_to_token == vocab.id_to_token
+
+    def test_extend_keeps_indices(self):
+        vocab = Vocabulary(['', 'a', 'b'])
+        vocab.extend(['b', 'c', 'a', 'd'])
+        assert vocab.id_to_token == ['', 'a', 'b', 'c', 'd']
+        assert vocab['b'] == 2
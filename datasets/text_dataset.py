@@ -1,27 +1,45 @@
 """David Donahue November 2017"""
+import collections
+import hashlib
+import itertools
+import multiprocessing
 import pickle
+import tempfile
 
 import gensim
 import numpy as np
 import os
 import spacy
 import arcadian.dataset
+from cic.datasets.preprocessing_cache import PreprocessingCache
+from cic.datasets.storage import RaggedArray, StringBlobWriter, load_string_blob, load_ragged_array, \
+    save_ragged_array
+from cic.datasets.vocabulary import Vocabulary
+from cic.utils.token_tools import construct_numpy_from_messages, construct_ragged_from_messages, \
+    convert_numpy_array_to_strings, token_dtype, widen_tokens
+
+# Increase when the saved results change format, so old cache entries are not loaded.
+RESULTS_FORMAT_VERSION = 4
 
 
 class TextDataset(arcadian.dataset.Dataset):
     def __init__(self, strings, max_length, min_length=None, result_save_path=None, token_to_id=None,
                  stop_token='<STOP>', unk_token='<UNK>', regenerate=False, max_num_s=None,
                  vocab_min_freq=0, keep_unk_sentences=True, update_vocab=True, nlp=None,
-                 max_vocab_len=None):
+                 max_vocab_len=None, num_workers=1, chunk_size=1000, source_id=None,
+                 max_cache_entries=4, max_cache_bytes=None, mmap=False, extend_vocab=False,
+                 ragged=False):
         """Helper class to create datasets of strings. Tokenizes strings, builds a vocabulary of tokens and
         converts all strings into a large numpy array of indices.
 
         Arguments:
-            strings - list of Python strings, interpretted as sentences
+            strings - iterable of Python strings, interpretted as sentences. Strings are streamed, not kept in
+            memory, so this can be a generator (if saving results, specify source_id as well)
             max_length - only strings containing max_length-1 will be kept (make room for stop token)
             min_length - minimum length of strings before stop token is added
             result_save_path - specify this if you want to save results of dataset preparation (saves time!)
-            token_to_id - specify your own vocabulary to process sentences
+            token_to_id - specify your own vocabulary to process sentences (a Vocabulary or a dictionary
+            mapping each token to its index, whose indices are kept, see Vocabulary.from_dict)
             stop_token - specify token to place at end of strings
             unk_token - if not None, prunes all vocab that appears only once, replaces with unk_token
             regenerate - if True, regenerate vocabulary and numpy arrays even if they exist in the save path
@@ -31,6 +49,21 @@ class TextDataset(arcadian.dataset.Dataset):
             keep_unk_sentences - if False, throw away strings that contain under min freq words
             update_vocab - if token_to_id is provided, whether or not to add new vocab terms found in strings
             nlp - if provided, uses nlp object for tokenization. Can save time if calling multiple string datasets
+            num_workers - number of worker processes used to tokenize strings (1 tokenizes in this process)
+            chunk_size - number of strings sent to a tokenizer worker at a time
+            source_id - string identifying the input strings in the result cache, instead of hashing all strings.
+            Strings are only read if results for this source and these parameters are not cached
+            max_cache_entries - keep at most this many sets of results in result_save_path (least recently used
+            results are removed first)
+            max_cache_bytes - keep at most this many bytes of results in result_save_path
+            mmap - if True, memory-map saved results instead of reading them into memory. np_messages is then a
+            RaggedArray over read-only memory-mapped files and messages a StringBlob (see cic.datasets.storage)
+            extend_vocab - if True, new words are appended to the provided token_to_id (a Vocabulary) in place
+            instead of to a copy. Vocabularies are append-only, so existing indices never change and one
+            vocabulary can be grown over many datasets at the cost of only their new words
+            ragged - if True, keep np_messages as a RaggedArray which stores only the tokens of each message and pads
+            rows when they are indexed, instead of as a padded [num_messages, max_length] matrix. Saved results are
+            always stored ragged
         """
         self.stop_token = stop_token
         self.unknown_token = unk_token
@@ -39,90 +72,124 @@ class TextDataset(arcadian.dataset.Dataset):
         self.nlp = nlp
         if self.nlp is None:
             self.nlp = spacy.load('en_core_web_sm')
-        self.strings = strings
         self.vocab_min_freq = vocab_min_freq
         self.keep_unk_sentences = keep_unk_sentences
+        self.num_workers = num_workers
+        self.chunk_size = chunk_size
+        self.extend_vocab = extend_vocab
+        self.ragged = ragged or mmap
 
-        if result_save_path is not None:
-            # Make sure result_save_path exists.
-            if not os.path.exists(result_save_path):
-                os.makedirs(result_save_path)
+        if extend_vocab and token_to_id is not None and not isinstance(token_to_id, Vocabulary):
+            raise ValueError('Only a Vocabulary can be extended in place, not %s' % type(token_to_id).__name__)
 
+        self.cache = None
+        cache_key = None
         if result_save_path is not None:
-            # If the result path exists, make sure these paths are available.
-            self.vocab_save_path = os.path.join(result_save_path, 'vocabulary.pkl')
-            self.sentences_save_path = os.path.join(result_save_path, 'sentences.pkl')
-            self.numpy_save_path = os.path.join(result_save_path, 'np_sentences.npy')
-
-        results_exist = self._numpy_string_formatting_results_exist(result_save_path)
+            # Results are stored in an entry of the cache keyed by the input strings and all preprocessing
+            # parameters, so changing any of them never serves stale results.
+            self.cache = PreprocessingCache(result_save_path, max_entries=max_cache_entries,
+                                            max_bytes=max_cache_bytes)
+            if source_id is None and iter(strings) is strings:
+                raise ValueError('Strings can only be read once. Specify a source_id to save results built '
+                                 'from an iterator.')
+            params = self._preprocessing_params(token_to_id, update_vocab, max_vocab_len)
+            cache_key = self.cache.key(params, strings=strings, source_id=source_id)
+
+        results_exist = self._numpy_string_formatting_results_exist(cache_key)
 
         # If results exist, we will save time and load everything from the save directory. Otherwise,
         # regenerate the vocabulary and numpy results and save them.
-        if results_exist and token_to_id is None and not regenerate:
+        if results_exist and not regenerate:
             print('Loading vocabulary, strings, and numpy-encoded strings from save path.')
-
-            self.token_to_id = pickle.load(open(self.vocab_save_path, 'rb'))
-            self.id_to_token = {v: k for k, v in self.token_to_id.items()}
-            self.messages = pickle.load(open(self.sentences_save_path, 'rb'))
-            self.np_messages = np.load(self.numpy_save_path)
+            self.cache.touch(cache_key)
+
+            self.token_to_id = Vocabulary.load(self.vocab_save_path)
+            if extend_vocab and token_to_id is not None:
+                # The saved vocabulary was built on top of token_to_id, so only its new words are appended
+                token_to_id.extend(self.token_to_id.id_to_token[len(token_to_id):])
+                self.token_to_id = token_to_id
+            self.id_to_token = self.token_to_id.id_to_token
+            self.messages = load_string_blob(self.sentences_save_path, self.offsets_save_path, mmap=mmap)
+            if not mmap:
+                self.messages = list(self.messages)
+            self.np_messages = load_ragged_array(self.numpy_save_path, self.numpy_offsets_save_path,
+                                                 self.max_message_length, mmap=mmap)
         else:
-            self.token_to_id = {}
-
-            if update_vocab:
-                # Generate vocabulary ourselves.
-                new_token_to_id, _ = create_vocabulary(self.strings, no_below=vocab_min_freq, max_len=max_vocab_len)
-
-                # Add stop token to vocabulary
-                vocab_size = len(self.token_to_id)
-                self.token_to_id[self.stop_token] = vocab_size
-
-                # Add unknown token to vocabulary
-                if self.unknown_token is not None:
-                    vocab_size = len(self.token_to_id)
-                    self.token_to_id[self.unknown_token] = vocab_size
-
-                # Add new vocab to final vocabulary
-                self.token_to_id.update(new_token_to_id)
-
-            if token_to_id is not None:
-                # Use user-defined token_to_id as base vocabulary,
-                # Add newly found words onto it
-                self.token_to_id = add_new_vocabulary(token_to_id, self.token_to_id)
-
-            self.id_to_token = {v: k for k, v in self.token_to_id.items()}
+            # Input strings are streamed twice: once to count the vocabulary and tokenize, once to encode.
+            # Formatted sentences are written straight to disk when results are saved.
+            if result_save_path is not None:
+                self.cache.touch(cache_key)
+                messages_writer = StringBlobWriter(self.sentences_save_path, self.offsets_save_path)
+            else:
+                messages_writer = []
 
-            self.np_messages, self.messages = self.convert_strings_to_numpy(self.strings)
+            self.np_messages = self._build_from_strings(strings, token_to_id, update_vocab, max_vocab_len,
+                                                        messages_writer.append)
 
             # Save results so we can load them next time.
             if result_save_path is not None:
                 print('Saving vocabulary, strings, and numpy-encoded strings.')
-                pickle.dump(self.token_to_id, open(self.vocab_save_path, 'wb'))
-                pickle.dump(self.messages, open(self.sentences_save_path, 'wb'))
-                np.save(self.numpy_save_path, self.np_messages)
+                messages_writer.close()
+                self.token_to_id.save(self.vocab_save_path)
+                save_ragged_array(self.np_messages, self.numpy_save_path, self.numpy_offsets_save_path)
+                self.cache.evict(keep=cache_key)
+
+                self.messages = load_string_blob(self.sentences_save_path, self.offsets_save_path, mmap=mmap)
+                if not mmap:
+                    self.messages = list(self.messages)
+            else:
+                self.messages = messages_writer
 
         # Trim results to max_number_of_sentences
         if max_num_s is not None:
             self.np_messages = self.np_messages[:max_num_s, :]
             self.messages = self.messages[:max_num_s]
 
-    def _numpy_string_formatting_results_exist(self, result_save_path):
-        """Check that all save files exist, return true in this case.
+        # Messages are built and saved ragged, pad them unless a ragged array was asked for
+        if not self.ragged:
+            self.np_messages = self.np_messages.to_padded()
+
+    def _preprocessing_params(self, token_to_id, update_vocab, max_vocab_len):
+        """Collect every parameter that affects the results of preprocessing, used to key the
+        preprocessing cache. Includes the tokenizer model and a hash of any provided vocabulary."""
+        vocab_hash = None
+        if token_to_id is not None:
+            vocab_hash = hashlib.sha1(repr(sorted(token_to_id.items())).encode('utf-8')).hexdigest()
+
+        nlp_meta = getattr(self.nlp, 'meta', {})
+
+        return {'format': RESULTS_FORMAT_VERSION,
+                'max_length': self.max_message_length,
+                'min_length': self.min_message_length,
+                'stop_token': self.stop_token,
+                'unk_token': self.unknown_token,
+                'vocab_min_freq': self.vocab_min_freq,
+                'keep_unk_sentences': self.keep_unk_sentences,
+                'update_vocab': update_vocab,
+                'max_vocab_len': max_vocab_len,
+                'token_to_id': vocab_hash,
+                'tokenizer': '%s-%s-%s' % (nlp_meta.get('lang'), nlp_meta.get('name'), nlp_meta.get('version'))}
+
+    def _numpy_string_formatting_results_exist(self, cache_key):
+        """Check that all save files exist in the cache entry for cache_key, return true in this case.
 
         Arguments:
-            - result_save_path: directory to check for processing results
+            - cache_key: key of the cache entry to check for processing results, None if not saving results
 
         Returns: boolean indicating if these strings have already been converted to numpy and saved,
         and all associated files exist.
         """
         results_exist = False
-        if result_save_path is not None:
-            self.vocab_save_path = os.path.join(result_save_path, 'vocabulary.pkl')
-            self.sentences_save_path = os.path.join(result_save_path, 'sentences.pkl')
-            self.numpy_save_path = os.path.join(result_save_path, 'np_sentences.npy')
+        if cache_key is not None:
+            entry_path = self.cache.entry_path(cache_key)
+            self.vocab_save_path = os.path.join(entry_path, 'vocabulary.npz')
+            self.sentences_save_path = os.path.join(entry_path, 'sentences.bin')
+            self.offsets_save_path = os.path.join(entry_path, 'sentence_offsets.npy')
+            self.numpy_save_path = os.path.join(entry_path, 'np_sentence_tokens.npy')
+            self.numpy_offsets_save_path = os.path.join(entry_path, 'np_sentence_offsets.npy')
 
-            results_exist = (os.path.isfile(self.vocab_save_path)
-                             and os.path.isfile(self.sentences_save_path)
-                             and os.path.isfile(self.numpy_save_path))
+            results_exist = self.cache.contains(cache_key, ['vocabulary.npz', 'sentences.bin', 'sentence_offsets.npy',
+                                                            'np_sentence_tokens.npy', 'np_sentence_offsets.npy'])
 
         return results_exist
 
@@ -133,48 +200,124 @@ class TextDataset(arcadian.dataset.Dataset):
             - np_messages: ndarray input
 
         Returns: a list of strings."""
-        messages = convert_numpy_array_to_strings(np_messages, self.id_to_token,
-                                                  self.stop_token,
-                                                  keep_stop_token=False)
+        messages = self.token_to_id.decode(np_messages, self.stop_token, keep_stop_token=False)
         return messages
 
-    def convert_strings_to_numpy(self, strings):
-        """Complete the entire process of tokenizing strings, removing strings exceeding max length, and
-        constructing numpy arrays.
+    def _build_from_strings(self, strings, token_to_id, update_vocab, max_vocab_len, write_message):
+        """Build the vocabulary and numpy array of strings in two streaming passes, so that
+        memory is bounded by the output array rather than by the input text.
+
+        The first pass reads strings once, counting vocabulary and tokenizing. Tokens of strings within length
+        limits are spooled to a temporary file. The second pass reads the spooled tokens back, and encodes them
+        into a ragged array.
 
         Arguments:
-            - strings: a list of strings of text to be converted
+            - strings: iterable of strings
+            - token_to_id, update_vocab, max_vocab_len: see constructor
+            - write_message: called with each formatted string that was kept
+
+        Returns: a RaggedArray of converted strings. Sets self.token_to_id and self.id_to_token."""
+        dictionary = gensim.corpora.Dictionary() if update_vocab else None
+
+        def counted_chunks():
+            for chunk in chunk_iterable(strings, self.chunk_size):
+                if dictionary is not None:
+                    dictionary.add_documents([each_string.split() for each_string in chunk])
+                yield chunk
+
+        with tempfile.TemporaryFile() as spool:
+            for tk_chunk in tokenize_chunks(counted_chunks(), self.nlp.tokenizer, num_workers=self.num_workers):
+                tk_chunk = [tk_tokens for tk_tokens in tk_chunk if self.within_length_limits(tk_tokens)]
+                pickle.dump(tk_chunk, spool)
+
+            self.build_vocabulary(dictionary, token_to_id, max_vocab_len)
+
+            spool.seek(0)
+            return self.encode_token_chunks(read_spool(spool), write_message)
+
+    def build_vocabulary(self, dictionary, token_to_id, max_vocab_len):
+        """Set self.token_to_id and self.id_to_token from the provided token_to_id and the counted gensim
+        dictionary (None if not updating vocabulary). A new vocabulary starts with '' at index 0 followed by the
+        stop and unknown tokens. New words found in strings are added to the end, so existing indices
+        never change. A provided Vocabulary is copied first unless self.extend_vocab is set."""
+        if token_to_id is not None:
+            # Use user-defined token_to_id as base vocabulary
+            if isinstance(token_to_id, Vocabulary):
+                self.token_to_id = token_to_id if self.extend_vocab else token_to_id.copy()
+            else:
+                self.token_to_id = Vocabulary.from_dict(token_to_id)
+        else:
+            self.token_to_id = Vocabulary([''])
 
-        Returns: an array of converted strings, where rows are strings and columns are words/tokens in each string.
-        Also returns a list of tokenized strings, representing the pruned/tokenized final strings that were converted.
-        This list of strings is good for debugging, viewing and comparison purposes."""
+        # Add stop and unknown tokens to vocabulary
+        self.token_to_id.add(self.stop_token)
+        if self.unknown_token is not None:
+            self.token_to_id.add(self.unknown_token)
+
+        if dictionary is not None:
+            # Generate vocabulary ourselves, and add newly found words onto it
+            new_token_to_id, new_id_to_token = vocabulary_from_dictionary(dictionary, no_below=self.vocab_min_freq,
+                                                                          max_len=max_vocab_len)
+            self.token_to_id.extend(new_id_to_token[index] for index in range(len(new_id_to_token)))
+
+        self.id_to_token = self.token_to_id.id_to_token
 
-        tk_token_strings = []
-        for each_string in strings:
-            tk_string = self.nlp.tokenizer(each_string.lower())
+    def within_length_limits(self, tk_tokens):
+        """Check that tokens plus the stop token are within the min and max message lengths."""
+        return within_length_limits(tk_tokens, self.max_message_length, self.min_message_length)
 
-            tk_tokens = []
-            no_unk = True
-            for token in tk_string:
-                if str(token) != ' ':
-                    if str(token) in self.token_to_id:
-                        tk_tokens.append(str(token))
+    def encode_token_chunks(self, tk_chunks, write_message):
+        """Replace out-of-vocabulary tokens, remove strings containing them if keep_unk_sentences is False,
+        and encode each chunk of token lists into ragged rows, without padding.
+
+        Arguments:
+            - tk_chunks: iterable of lists of token lists, all within length limits
+            - write_message: called with each formatted string that was kept
+
+        Returns: a RaggedArray of converted strings, with the narrowest dtype that holds the vocabulary."""
+        dtype = token_dtype(len(self.token_to_id))
+        encoded_chunks = []
+        for tk_chunk in tk_chunks:
+            tk_token_strings = []
+            for tk_string in tk_chunk:
+                tk_tokens = []
+                no_unk = True
+                for token in tk_string:
+                    if token in self.token_to_id:
+                        tk_tokens.append(token)
                     else:
                         tk_tokens.append(self.unknown_token)
                         no_unk = False
 
-            tk_tokens.append(self.stop_token)
+                if self.keep_unk_sentences is True or no_unk is True:
+                    write_message(' '.join(tk_tokens))
+                    tk_tokens.append(self.stop_token)
+                    tk_token_strings.append(tk_tokens)
+
+            encoded_chunks.append(construct_ragged_from_messages(tk_token_strings, self.token_to_id,
+                                                                 self.max_message_length, unk_token=self.unknown_token,
+                                                                 dtype=dtype))
+
+        return RaggedArray.concatenate(encoded_chunks, self.max_message_length, dtype=dtype)
 
-            if len(tk_tokens) <= self.max_message_length \
-                    and (self.min_message_length is None or len(tk_tokens) >= self.min_message_length)\
-                    and (self.keep_unk_sentences is True or no_unk is True):
+    def convert_strings_to_numpy(self, strings):
+        """Complete the entire process of tokenizing strings, removing strings exceeding max length, and
+        constructing numpy arrays.
 
-                tk_token_strings.append(tk_tokens)
+        Arguments:
+            - strings: a list of strings of text to be converted
+
+        Returns: an array of converted strings, where rows are strings and columns are words/tokens in each string.
+        Also returns a list of tokenized strings, representing the pruned/tokenized final strings that were converted.
+        This list of strings is good for debugging, viewing and comparison purposes."""
+        tk_strings = [tk_tokens for tk_tokens in tokenize_strings(strings, self.nlp.tokenizer,
+                                                                   num_workers=self.num_workers,
+                                                                   chunk_size=self.chunk_size)
+                      if self.within_length_limits(tk_tokens)]
 
-        np_messages = construct_numpy_from_messages(tk_token_strings, self.token_to_id, self.max_message_length,
-                                                    unk_token=self.unknown_token)
-        formatted_and_filtered_strings = [' '.join(tk_token_string[:-1]) for tk_token_string in tk_token_strings]
-        return np_messages, formatted_and_filtered_strings
+        formatted_and_filtered_strings = []
+        np_messages = self.encode_token_chunks([tk_strings], formatted_and_filtered_strings.append)
+        return np_messages.to_padded(), formatted_and_filtered_strings
 
     def get_vocabulary(self):
         """Returns the internal vocabulary used by this StringDataset object."""
@@ -186,29 +329,150 @@ class TextDataset(arcadian.dataset.Dataset):
         return self.stop_token
 
     def __getitem__(self, index):
-        return {'message': self.np_messages[index]}
+        return {'message': widen_tokens(self.np_messages[index])}
 
     def __len__(self):
         return len(self.np_messages)
 
 
+def tokenize_string(string, tokenizer):
+    """Lowercase and tokenize a single string with a spacy tokenizer, dropping whitespace tokens.
+
+    Returns: a list of token strings."""
+    return [str(token) for token in tokenizer(string.lower()) if str(token) != ' ']
+
+
+def within_length_limits(tk_tokens, max_length, min_length=None):
+    """Check that tokens plus the stop token are within max_length and min_length (None for no minimum)."""
+    num_tokens = len(tk_tokens) + 1
+    return num_tokens <= max_length and (min_length is None or num_tokens >= min_length)
+
+
+# Tokenizer used by each worker process of tokenize_strings(). Set once per worker by the pool initializer.
+_worker_tokenizer = None
+
+
+def _init_tokenizer_worker(tokenizer):
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+
+def _tokenize_chunk(strings):
+    return [tokenize_string(each_string, _worker_tokenizer) for each_string in strings]
+
+
+def chunk_iterable(iterable, chunk_size):
+    """Yield successive lists of at most chunk_size elements from iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+def tokenize_chunks(chunks, tokenizer, num_workers=1):
+    """Tokenize each chunk of strings with tokenize_string(). If num_workers > 1, chunks are tokenized by
+    a pool of worker processes. At most a few chunks per worker are in flight at once, so chunks may
+    come from a generator of any length. Chunks are returned in input order, so the output is identical
+    to tokenizing in a single process.
+
+    Arguments:
+        - chunks: iterable of lists of strings to tokenize
+        - tokenizer: spacy tokenizer (nlp.tokenizer), copied to each worker process
+        - num_workers: number of worker processes (1 tokenizes in this process)
+
+    Returns: a generator of lists of token lists, one list per chunk."""
+    if num_workers is None or num_workers <= 1:
+        for chunk in chunks:
+            yield [tokenize_string(each_string, tokenizer) for each_string in chunk]
+        return
+
+    with multiprocessing.Pool(num_workers, initializer=_init_tokenizer_worker, initargs=(tokenizer,)) as pool:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(_tokenize_chunk, (chunk,)))
+            if len(pending) >= 2 * num_workers:
+                yield pending.popleft().get()
+        while len(pending) > 0:
+            yield pending.popleft().get()
+
+
+def tokenize_strings(strings, tokenizer, num_workers=1, chunk_size=1000):
+    """Tokenize each string with tokenize_string(). If num_workers > 1, strings are split into
+    chunks of chunk_size and tokenized by a pool of worker processes (see tokenize_chunks).
+
+    Arguments:
+        - strings: iterable of strings to tokenize
+        - tokenizer: spacy tokenizer (nlp.tokenizer), copied to each worker process
+        - num_workers: number of worker processes (1 tokenizes in this process)
+        - chunk_size: number of strings sent to a worker at a time
+
+    Returns: a generator of token lists, one per input string."""
+    for tk_chunk in tokenize_chunks(chunk_iterable(strings, chunk_size), tokenizer, num_workers=num_workers):
+        for tk_tokens in tk_chunk:
+            yield tk_tokens
+
+
+def read_spool(spool):
+    """Yield each chunk pickled into spool, until the end of the file."""
+    while True:
+        try:
+            yield pickle.load(spool)
+        except EOFError:
+            return
+
+
 def create_vocabulary(messages, no_below=2, max_len=None):
     """Splits messages into tokens. When a new token is discovered,
     adds that token to a growing vocabulary. Each token is associated with
     an index.
 
     Arguments:
+        - messages: iterable of message strings
         - no_below: prunes vocab terms which appear in less than no_below messages
-        - token_to_id: previous vocabulary to build off of
         - max_len: maximum length of vocabulary
 
     Returns: A dictionary mapping each token to its corresponding index, and a
     dictionary mapping each index to its corresponding token."""
 
-    message_tokens = [message.split() for message in messages]
+    # Build a vocabulary, splitting one message at a time
+    dictionary = gensim.corpora.Dictionary(documents=(message.split() for message in messages))
+
+    return vocabulary_from_dictionary(dictionary, no_below=no_below, max_len=max_len)
+
+
+def merge_dictionaries(dictionaries):
+    """Merge gensim dictionaries of token counts over consecutive parts of a corpus. The result is the
+    dictionary that counting the whole corpus in one pass would give: tokens are numbered in the order
+    they first appear, and all counts are summed.
+
+    Arguments:
+        - dictionaries: gensim dictionaries, in corpus order
+
+    Returns: a gensim dictionary."""
+    merged = gensim.corpora.Dictionary()
+    for dictionary in dictionaries:
+        for token, token_id in sorted(dictionary.token2id.items(), key=lambda item: item[1]):
+            merged_id = merged.token2id.setdefault(token, len(merged.token2id))
+            merged.dfs[merged_id] = merged.dfs.get(merged_id, 0) + dictionary.dfs.get(token_id, 0)
+            merged.cfs[merged_id] = merged.cfs.get(merged_id, 0) + dictionary.cfs.get(token_id, 0)
+        merged.num_docs += dictionary.num_docs
+        merged.num_pos += dictionary.num_pos
+        merged.num_nnz += dictionary.num_nnz
+    return merged
 
-    # Build a vocabulary
-    dictionary = gensim.corpora.Dictionary(documents=message_tokens)
+
+def vocabulary_from_dictionary(dictionary, no_below=2, max_len=None):
+    """Prune a gensim dictionary of token counts and convert it to a vocabulary, with '' as index 0.
+
+    Arguments:
+        - dictionary: gensim dictionary containing counts of all tokens
+        - no_below: prunes vocab terms which appear in less than no_below messages
+        - max_len: maximum length of vocabulary
+
+    Returns: A dictionary mapping each token to its corresponding index, and a
+    dictionary mapping each index to its corresponding token."""
     dictionary.filter_extremes(no_below=no_below, no_above=1.0, keep_n=max_len)
 
     token_to_id = dictionary.token2id
@@ -221,63 +485,3 @@ def create_vocabulary(messages, no_below=2, max_len=None):
     id_to_token[0] = ''
 
     return token_to_id, id_to_token
-
-def add_new_vocabulary(old, new):
-    """Updates the old vocabulary to have new words
-    from the new vocabulary."""
-    old = old.copy()
-    for word in new:
-        if word not in old:
-            old[word] = len(old)
-
-    return old
-
-
-def construct_numpy_from_messages(messages, vocab_dict, max_length, unk_token=None):
-    """Construct a numpy array from messages using vocab_dict as a mapping
-    from each word to an integer index."""
-    m = len(messages)
-    np_messages = np.zeros([m, max_length], dtype=int)
-    for i in range(np_messages.shape[0]):
-        message = messages[i]
-        for j, each_token in enumerate(message):
-            if j < max_length:
-                if each_token in vocab_dict:
-                    np_messages[i, j] = vocab_dict[each_token]
-                elif unk_token is not None:
-                    np_messages[i, j] = vocab_dict[unk_token]
-                else:
-                    raise ValueError('Out-of-vocabulary token %s found in string: %s' % (each_token, message))
-    return np_messages
-
-
-def convert_numpy_array_to_strings(np_examples, vocabulary, stop_token=None, keep_stop_token=False):
-    """Converts a numpy array of indices into a list of strings.
-
-    np_examples - m x n numpy array of ints, where m is the number of
-    strings encoded by indices, and n is the max length of each string
-    vocab_dict - where vocab_dict[index] gives a word in the vocabulary
-    with that index
-
-    Returns: a list of strings, where each string is constructed from
-    indices in the array as they appear in the vocabulary."""
-    assert stop_token is not None or not keep_stop_token
-    m = np_examples.shape[0]
-    n = np_examples.shape[1]
-    examples = []
-    for i in range(m):
-        each_example = ''
-        for j in range(n):
-            word_index = np_examples[i][j]
-            word = vocabulary[word_index]
-            if stop_token is not None and word == stop_token:
-                if keep_stop_token:
-                    if j > 0:
-                        each_example += ' '
-                    each_example += stop_token
-                break
-            if j > 0 and word != '':
-                each_example += ' '
-            each_example += word
-        examples.append(each_example)
-    return examples
\ No newline at end of file
@@ -1,12 +1,14 @@
 """UK WAC dataset."""
 from cic.datasets import text_dataset
+from cic.datasets.preprocessing_cache import file_source_id
+from cic.datasets.sentence_filters import Rule, SentenceFilter, forbid_pattern
 
 
 class UKWacDataset(text_dataset.TextDataset):
 
     def __init__(self, ukwac_path, result_save_path=None, token_to_id=None,
                  max_length=30, regenerate=False, max_num_s=None,
-                 min_length=0):
+                 min_length=0, num_workers=1):
         """Instantiate UK Wac dataset from raw ukwac_path file (slow). Store and load
         resulting training examples to and from result_path (fast). Separates dataset
         into training and testing sets and builds vocabulary. Must specify whether to
@@ -15,43 +17,49 @@ class UKWacDataset(text_dataset.TextDataset):
         Arguments:
             - ukwac_path: absolute or relative location of dataset
             - result_save_path: path to save intermediate results for faster reloading (recommended)
-            - token_to_id: provided vocabulary used to convert strings to numpy (regenerates intermediate results)
+            - token_to_id: provided vocabulary used to convert strings to numpy
             - max_length: maximum length of string to be converted to numpy
             - regenerate: ignore intermediate results, regenerate all data
+            - num_workers: number of worker processes used to tokenize sentences
             """
         self.ukwac_path = ukwac_path
 
-        def contains_numbers(s):
-            return any(c.isdigit() for c in s)
-
-        # Read all sentences from file, and keep them if they follow the correct formatting.
-        results_exist = self._numpy_string_formatting_results_exist(result_save_path)
-
-        # Extract sentences that meet hard-coded criteria
-        filtered_sentences = []
-        if not results_exist or regenerate or token_to_id is not None:
-            for index, line in enumerate(open(self.ukwac_path, 'r', encoding='utf-8', errors='ignore')):
-                sentences = line.split('. ')
-                for each_sentence in sentences:
-                    each_sentence = each_sentence.lower()
-                    #print(each_sentence)
-                    if not each_sentence.isspace() \
-                            and '(' not in each_sentence \
-                            and ')' not in each_sentence \
-                            and not each_sentence.startswith('current url') \
-                            and not contains_numbers(each_sentence) \
-                            and '"' not in each_sentence \
-                            and ':' not in each_sentence:
-                        each_sentence += '.'
-                        each_sentence = each_sentence.strip()
-                        if max_length is None or len(each_sentence.split()) < max_length:
-                            filtered_sentences.append(each_sentence)
+        # Sentences are only read from the file if results for this file and these settings
+        # are not already saved. The file is identified by path, size and modification time.
+        source_id = 'ukwac:%s:max_length=%s' % (file_source_id(ukwac_path), max_length)
 
         # Use StringDataset class to automatically tokenize and convert strings to numpy format.
-        super().__init__(filtered_sentences,
+        super().__init__(self._read_filtered_sentences(max_length),
                          max_length,
                          min_length=min_length,
                          result_save_path=result_save_path,
                          token_to_id=token_to_id,
                          regenerate=regenerate,
-                         max_num_s=max_num_s)
\ No newline at end of file
+                         max_num_s=max_num_s,
+                         num_workers=num_workers,
+                         source_id=source_id)
+
+    def _read_filtered_sentences(self, max_length):
+        """Read all sentences from file, and yield them if they follow the correct formatting."""
+        self.sentence_filter = ukwac_filter(max_length)
+
+        # Extract sentences that meet hard-coded criteria
+        with open(self.ukwac_path, 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                for each_sentence in self.sentence_filter.filter(line.split('. ')):
+                    yield (each_sentence + '.').strip()
+
+        if self.sentence_filter.num_seen > 0:
+            print(self.sentence_filter.report())
+
+
+def ukwac_filter(max_length=None):
+    """Returns: a SentenceFilter which lowercases sentences of the corpus (split on '. '), and rejects
+    whitespace, urls, numbers, brackets, quotes and colons, and sentences of max_length words or more
+    once their period is added."""
+    return SentenceFilter([Rule('whitespace', lambda s: not s.isspace()),
+                           forbid_pattern('url header', r'^current url'),
+                           forbid_pattern('numbers', r'\d'),
+                           forbid_pattern('brackets, quotes and colons', r'[()":]'),
+                           Rule('length', lambda s: max_length is None or len((s + '.').split()) < max_length)],
+                          normalize=str.lower)
@@ -0,0 +1,180 @@
+"""Vocabulary of tokens stored as a list indexed by id plus a token -> id dictionary, with binary persistence."""
+import collections.abc
+import pickle
+
+import numpy as np
+
+from cic.utils.token_tools import construct_numpy_from_messages, convert_numpy_array_to_strings
+
+
+class Vocabulary(collections.abc.Mapping):
+    def __init__(self, tokens=()):
+        """Mapping from each token to its index, where index i is the position of its token in the
+        list id_to_token. Replaces a token_to_id dictionary plus its inverted dictionary:
+        vocab[token] gives an index and vocab.id_to_token[index] gives a token.
+
+        Vocabularies are append-only: tokens are only ever added to the end and are never removed
+        or reassigned, so an index stays valid for as long as the vocabulary grows. len(vocab) is the
+        number of indices, which is also the number of tokens unless the vocabulary was created from
+        a legacy dictionary (see from_dict).
+
+        Arguments:
+            - tokens: tokens in index order, which must be unique
+        """
+        self.id_to_token = []
+        self._token_to_id = {}
+        self._token_array = None  # object array of id_to_token for decoding, built on demand
+        self.extend(tokens, allow_existing=False)
+
+    @classmethod
+    def from_dict(cls, token_to_id):
+        """Create a vocabulary from a dictionary mapping each token to its index, keeping every index.
+        Dictionaries pickled by older versions may skip indices or give several tokens the same index.
+        Skipped indices decode as '', and an index shared by several tokens decodes as the last of them
+        in dictionary order, as it did with the inverted dictionary."""
+        vocab = cls()
+        vocab.id_to_token = [''] * (max(token_to_id.values(), default=-1) + 1)
+        for token, index in token_to_id.items():
+            if index < 0:
+                raise ValueError('Token indices must not be negative (token %r has index %s)' % (token, index))
+            vocab.id_to_token[index] = token
+            vocab._token_to_id[token] = int(index)
+        return vocab
+
+    def __getitem__(self, token):
+        return self._token_to_id[token]
+
+    def get(self, token, default=None):
+        return self._token_to_id.get(token, default)
+
+    def __contains__(self, token):
+        return token in self._token_to_id
+
+    def __iter__(self):
+        return iter(self._token_to_id)
+
+    def __len__(self):
+        return len(self.id_to_token)
+
+    def __repr__(self):
+        return 'Vocabulary(%s tokens)' % len(self)
+
+    def copy(self):
+        vocab = Vocabulary()
+        vocab.id_to_token = list(self.id_to_token)
+        vocab._token_to_id = dict(self._token_to_id)
+        return vocab
+
+    def __getstate__(self):
+        # The token array is rebuilt on demand, so it is not pickled
+        state = dict(self.__dict__)
+        state['_token_array'] = None
+        return state
+
+    def add(self, token):
+        """Add token to the end of the vocabulary if it is not present.
+
+        Returns: index of token."""
+        index = self._token_to_id.get(token)
+        if index is None:
+            index = len(self.id_to_token)
+            self.id_to_token.append(token)
+            self._token_to_id[token] = index
+            self._token_array = None
+        return index
+
+    def extend(self, tokens, allow_existing=True):
+        """Add each new token in tokens to the end of the vocabulary, in order.
+
+        Arguments:
+            - tokens: iterable of tokens
+            - allow_existing: if False, raise a ValueError for tokens already in the vocabulary
+        """
+        for token in tokens:
+            if not allow_existing and token in self._token_to_id:
+                raise ValueError('Duplicate token in vocabulary: %r' % token)
+            self.add(token)
+
+    def token_array(self):
+        """Returns: object numpy array where array[index] is the token with that index."""
+        if self._token_array is None or len(self._token_array) != len(self.id_to_token):
+            self._token_array = np.array(self.id_to_token, dtype=object)
+        return self._token_array
+
+    def encode(self, messages, max_length, unk_token=None, dtype=np.int32):
+        """Convert a list of token lists into a max_length-wide numpy array of indices, padded with 0.
+        See cic.utils.token_tools.construct_numpy_from_messages."""
+        return construct_numpy_from_messages(messages, self, max_length, unk_token=unk_token, dtype=dtype)
+
+    def decode(self, np_examples, stop_token=None, keep_stop_token=False, as_tokens=False):
+        """Convert a numpy array of indices back into strings (or token lists if as_tokens).
+        See cic.utils.token_tools.convert_numpy_array_to_strings."""
+        return convert_numpy_array_to_strings(np_examples, self.token_array(), stop_token=stop_token,
+                                              keep_stop_token=keep_stop_token, as_tokens=as_tokens)
+
+    def save(self, path):
+        """Save vocabulary to a binary .npz file: id_to_token as one utf-8 blob plus the character offset
+        where each token starts, so loading slices one decoded string instead of decoding every token.
+        Tokens of legacy vocabularies which share an index, and indices without a token, are saved
+        separately. Loading does not unpickle anything."""
+        aliases = [(token, index) for token, index in self._token_to_id.items() if self.id_to_token[index] != token]
+        gaps = [index for index, token in enumerate(self.id_to_token) if self._token_to_id.get(token) != index]
+        alias_text, alias_offsets = _join_tokens([token for token, index in aliases])
+        text, offsets = _join_tokens(self.id_to_token)
+        with open(path, 'wb') as f:
+            np.savez(f, text=text, offsets=offsets, alias_text=alias_text, alias_offsets=alias_offsets,
+                     alias_ids=np.array([index for token, index in aliases], dtype=np.int64),
+                     gaps=np.array(gaps, dtype=np.int64))
+
+    @classmethod
+    def load(cls, path):
+        """Load a vocabulary saved with save()."""
+        with np.load(path, allow_pickle=False) as data:
+            if 'text' not in data:
+                return cls._load_byte_offsets(data)
+            vocab = cls()
+            vocab.id_to_token = _split_tokens(data['text'], data['offsets'])
+            gaps = data['gaps']
+            if len(gaps) == 0:
+                vocab._token_to_id = dict(zip(vocab.id_to_token, range(len(vocab.id_to_token))))
+            else:
+                is_token = np.ones(len(vocab.id_to_token), dtype=bool)
+                is_token[gaps] = False
+                token_ids = np.flatnonzero(is_token).tolist()
+                vocab._token_to_id = dict(zip([vocab.id_to_token[index] for index in token_ids], token_ids))
+            vocab._token_to_id.update(zip(_split_tokens(data['alias_text'], data['alias_offsets']),
+                                          data['alias_ids'].tolist()))
+        return vocab
+
+    @classmethod
+    def _load_byte_offsets(cls, data):
+        """Load a vocabulary saved by earlier versions, as a utf-8 blob with byte offsets."""
+        offsets = data['offsets']
+        blob = data['blob'].tobytes()
+        tokens = [blob[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+        if 'ids' not in data:
+            # Saved before indices were stored, when tokens were saved in index order
+            return cls(tokens)
+        return cls.from_dict(dict(zip(tokens, data['ids'].tolist())))
+
+
+def _join_tokens(tokens):
+    """Returns: uint8 array of the utf-8 encoding of all tokens joined, and int64 array of the character
+    offset of each token in the joined string, followed by its length."""
+    offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+    np.cumsum([len(token) for token in tokens], out=offsets[1:])
+    return np.frombuffer(''.join(tokens).encode('utf-8'), dtype=np.uint8), offsets
+
+
+def _split_tokens(text, offsets):
+    """Returns: list of the tokens joined by _join_tokens()."""
+    joined = text.tobytes().decode('utf-8')
+    offsets = offsets.tolist()
+    return [joined[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def load_legacy_vocabulary(path):
+    """Load a token -> index dictionary pickled by older versions (such as vocab.pkl of a TorontoBookCorpus)
+    as a Vocabulary with the same indices, so models trained with it still decode correctly."""
+    with open(path, 'rb') as f:
+        return Vocabulary.from_dict(pickle.load(f))
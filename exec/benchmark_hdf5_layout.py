@@ -0,0 +1,45 @@
+"""Compare file size and batch read throughput of the old Book Corpus HDF5 layout (default chunks, resized for
+every partition) with the chunked and compressed layouts of GrowableDataset."""
+import os
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from cic.datasets.storage import GrowableDataset
+
+num_rows = 200000
+max_s_len = 20
+num_partitions = 20
+batch_size = 1000
+
+random = np.random.RandomState(0)
+lengths = random.randint(1, max_s_len, size=num_rows)
+np_messages = np.where(np.arange(max_s_len) < lengths[:, np.newaxis],
+                       random.randint(3, 20000, size=[num_rows, max_s_len]), 0).astype(np.int32)
+partitions = np.array_split(np_messages, num_partitions)
+
+with tempfile.TemporaryDirectory() as save_dir:
+    for layout in ['old', None, 'lzf', 'gzip']:
+        path = os.path.join(save_dir, '%s.hdf5' % layout)
+        with h5py.File(path, 'w') as f:
+            if layout == 'old':
+                data = f.create_dataset('messages', (1, max_s_len), maxshape=(num_rows, max_s_len), dtype='i')
+                num_written = 0
+                for partition in partitions:
+                    data.resize(num_written + len(partition), axis=0)
+                    data[num_written:] = partition
+                    num_written += len(partition)
+            else:
+                growable = GrowableDataset(f, 'messages', (max_s_len,), compression=layout)
+                for partition in partitions:
+                    growable.append(partition)
+                growable.trim()
+
+        with h5py.File(path, 'r') as f:
+            start_time = time.time()
+            for start in range(0, num_rows, batch_size):
+                assert np.array_equal(f['messages'][start:start + batch_size], np_messages[start:start + batch_size])
+            elapsed = time.time() - start_time
+        print('%s layout: %.1f MB, %.0f rows/sec' % (layout, os.path.getsize(path) / 1e6, num_rows / elapsed))
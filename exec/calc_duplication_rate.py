@@ -1,14 +1,52 @@
+"""Calculate how many sentences generated by the VAE, GAN and NLM models are copied from the Book Corpus.
+Sentences are looked up in an index of the hashes of all Book Corpus sentences, which is built from the
+raw text once, or comes from a TorontoBookCorpus built with deduplicate=True."""
 import pickle
 import os
 import cic.paths
+from cic.datasets.book_corpus import book_corpus_filter
+from cic.datasets.sentence_index import SentenceHashIndex
 
 num_examples_per_model = 100
 
+index_path = os.path.join(cic.paths.BOOK_CORPUS_RESULT, 'sentence_index.npy')
+
 vae_sentences = pickle.load(open(os.path.join(cic.paths.DATA_DIR, 'vae_messages.pkl'), 'rb'))[:num_examples_per_model]
 gan_sentences = pickle.load(open(os.path.join(cic.paths.DATA_DIR, 'gan_messages.pkl'), 'rb'))[:num_examples_per_model]
 nlm_sentences = pickle.load(open(os.path.join(cic.paths.DATA_DIR, 'nlm_messages.pkl'), 'rb'))[:num_examples_per_model]
 
-def count_duplicates(sentences):
-    with open(cic.paths.BOOK_CORPUS_P1) as f:
-        for line in f:
-            print(line)
+
+def read_corpus_sentences():
+    sentence_filter = book_corpus_filter()
+    for filename in [cic.paths.BOOK_CORPUS_P1, cic.paths.BOOK_CORPUS_P2]:
+        with open(filename) as f:
+            for line in sentence_filter.filter(f):
+                yield line
+
+
+def load_corpus_index():
+    if os.path.isfile(index_path):
+        print('Loading sentence index...')
+        return SentenceHashIndex.load(index_path)
+
+    print('Building sentence index from Book Corpus...')
+    index = SentenceHashIndex.from_sentences(read_corpus_sentences())
+    if not os.path.exists(cic.paths.BOOK_CORPUS_RESULT):
+        os.makedirs(cic.paths.BOOK_CORPUS_RESULT)
+    index.save(index_path)
+    return index
+
+
+def count_duplicates(sentences, index):
+    """Returns: number of sentences (with stop tokens removed) found in the index."""
+    sentences = [' '.join(sentence.replace('<STOP>', '').split()) for sentence in sentences]
+    return int(index.contains_sentences(sentences).sum())
+
+
+corpus_index = load_corpus_index()
+print('Number of unique Book Corpus sentences: %s' % len(corpus_index))
+
+for model_name, model_sentences in [('VAE', vae_sentences), ('GAN', gan_sentences), ('NLM', nlm_sentences)]:
+    num_duplicates = count_duplicates(model_sentences, corpus_index)
+    print('%s duplication rate: %s / %s = %.3f' % (model_name, num_duplicates, len(model_sentences),
+                                                   num_duplicates / max(len(model_sentences), 1)))
@@ -5,12 +5,14 @@ import os
 from cic.datasets.book_corpus import TorontoBookCorpus
 import numpy as np
 from cic.datasets.text_dataset import convert_numpy_array_to_strings
+from cic.utils.squad_tools import invert_dictionary
 from nltk.translate.bleu_score import sentence_bleu
 import tqdm
 
 num_examples_per_model = 1000
 max_number_of_sentences = 10000
-regenerate=True
+reference_split = 0.99  # the smaller split of the validation corpus holds the reference sentences
+split_seed = 'seed'
 result_path = os.path.join(cic.paths.DATA_DIR, 'validation_book_corpus/')
 
 vae_sentences = pickle.load(open(os.path.join(cic.paths.DATA_DIR, 'vae_messages.pkl'), 'rb'))[:num_examples_per_model]
@@ -24,22 +26,25 @@ for index in range(len(vae_sentences)):
     if index < 10:
         print(vae_sentences[index])
 
-# Create validation set
+# Create validation set from the second corpus file, which no model trains on. The corpus and its split
+# are saved, so every run compares against the same reference sentences
 ds = TorontoBookCorpus(20, result_path=result_path,
                        min_length=5, max_num_s=2000000, keep_unk_sentences=False,
-                       vocab_min_freq=5, vocab=None, regenerate=regenerate, second_file_first=True)
+                       vocab_min_freq=5, vocab=None, second_file_first=True)
+_, val_ds = ds.split(reference_split, seed=split_seed)
+if len(val_ds) < max_number_of_sentences:
+    raise ValueError('Validation split holds %s sentences, but %s reference sentences are needed'
+                     % (len(val_ds), max_number_of_sentences))
 
-indices = np.arange(len(ds))
-np.random.shuffle(indices)
+# Sentences are shuffled on disk, so the first sentences of the split are a random sample
+indices = np.arange(max_number_of_sentences)
 
 print('Converting from numpy to strings')
-real_sentences = []
-inverse_vocab = {ds.vocab[k]:k for k in ds.vocab}
-for i in range(max_number_of_sentences):
-    np_real_sent = np.reshape(ds[indices[i]]['message'], [1, -1])
-    real_sent = convert_numpy_array_to_strings(np_real_sent, inverse_vocab, ds.stop_token, keep_stop_token=False)[0]
-    # We split sentence into tokens before adding - required for bleu
-    real_sentences.append(real_sent.split())
+inverse_vocab = invert_dictionary(ds.vocab)
+np_real_sents = val_ds.read_batch(indices)['message']
+# Sentences are returned as lists of tokens - required for bleu
+real_sentences = convert_numpy_array_to_strings(np_real_sents, inverse_vocab, ds.stop_token,
+                                                keep_stop_token=False, as_tokens=True)
 
 # now we have vae sentences, gan sentences, nlm sentences, and real_sentences
 print(len(vae_sentences))
@@ -3,6 +3,7 @@ Volunteers edit this file to perform evaluation."""
 from cic.datasets.book_corpus import TorontoBookCorpus
 from cic.datasets.text_dataset import convert_numpy_array_to_strings
 import cic.paths
+from cic.utils.squad_tools import invert_dictionary
 import os
 import pickle
 import random
@@ -42,11 +43,9 @@ np.random.shuffle(indices)
 # Create text file for all pairs (left, right)
 # Create pickle file holding answers (model, left/right)
 
-inverse_vocab = {ds.vocab[k]:k for k in ds.vocab}
-for i in range(num_examples_per_model * 3):
-    np_real_sent = np.reshape(ds[indices[i]]['message'], [1, -1])
-    real_sent = convert_numpy_array_to_strings(np_real_sent, inverse_vocab, ds.stop_token, keep_stop_token=False)[0]
-    all_real_sents.append(real_sent)
+inverse_vocab = invert_dictionary(ds.vocab)
+np_real_sents = np.stack([ds[indices[i]]['message'] for i in range(num_examples_per_model * 3)])
+all_real_sents = convert_numpy_array_to_strings(np_real_sents, inverse_vocab, ds.stop_token, keep_stop_token=False)
 
 num_vae_sentences = 0
 for sentence in vae_sentences:
@@ -3,17 +3,17 @@ import matplotlib.pyplot
 import numpy as np
 from sklearn.manifold import TSNE
 import cic.paths
+from cic.datasets.book_corpus import load_vocabulary
+from cic.utils.squad_tools import invert_dictionary
 import os
-import pickle
 
 num_words = 500
 embs_path = os.path.join(cic.paths.DATA_DIR, 'nlm_embs.npy')
-vocab_path = os.path.join(cic.paths.BOOK_CORPUS_RESULT, 'vocab.pkl')
 
 embs = np.load(open(embs_path, 'rb'))
-tk2id = pickle.load(open(vocab_path, 'rb'))
+tk2id = load_vocabulary(cic.paths.BOOK_CORPUS_RESULT)
 
-id2tk = {tk2id[k]: k for k in tk2id}
+id2tk = invert_dictionary(tk2id)
 
 embs = embs[:num_words, :]
 
@@ -5,10 +5,11 @@ import os
 import cic.paths
 from cic.models.autoencoder import AutoEncoder
 from cic.datasets.book_corpus import TorontoBookCorpus
+from cic.datasets.length_bucketing import LengthBucketedDataset
 from cic.datasets.text_dataset import convert_numpy_array_to_strings
+from cic.utils.squad_tools import invert_dictionary
 from sacred import Experiment
 import numpy as np
-import pickle
 import tqdm
 ex = Experiment('ukwac')
 
@@ -28,9 +29,10 @@ def config():
     train_test_split=0.999
     split_seed = 'seed'
     keep_prob = .5
+    bucket_by_length = False  # batch sentences of similar length together (not iid, and lengths are measured
+                              # over the whole dataset before training), and report tokens/sec
 
-    i_erased_vocab = False  # if you accidently regenerated the dataset, then control-C'd quickly,
-                            # but data file was destroyed, run this
+    resume_dataset = True  # if regenerating the dataset was interrupted, continue from its last partition
 
 @ex.automain
 def main(max_s_len, save_dir,
@@ -38,21 +40,14 @@ def main(max_s_len, save_dir,
          regen_dataset, dec_size, learning_rate,
          num_s, train_test_split,
          split_seed, min_s_len,
-         i_erased_vocab, enc_size, keep_prob):
+         resume_dataset, enc_size, keep_prob, bucket_by_length):
 
     # Load UKWac dataset
     print('Loading dataset...')
 
-    vocab = None
-    if i_erased_vocab:
-        print('Loading vocabulary from save...')
-        vocab_path = os.path.join(cic.paths.BOOK_CORPUS_RESULT, 'vocab.pkl')
-        with open(vocab_path, 'rb') as vocab_file:
-            vocab = pickle.load(vocab_file)
-
     tbc = TorontoBookCorpus(20, result_path=cic.paths.BOOK_CORPUS_RESULT,
                             min_length=min_s_len, max_num_s=num_s, keep_unk_sentences=False,
-                            vocab_min_freq=5, vocab=vocab, regenerate=regen_dataset)
+                            vocab_min_freq=5, regenerate=regen_dataset, resume=resume_dataset)
 
     # num_batches = 0
     # for batch in tqdm.tqdm(tbc.generate_batches(32, shuffle=True)):
@@ -70,7 +65,7 @@ def main(max_s_len, save_dir,
     print('Len validation set: %s' % len(val_tbc))
 
     tk2id = tbc.vocab  # mapping from every token to unique index
-    id2tk = {tbc.vocab[k]:k for k in tbc.vocab}  # reverse mapping
+    id2tk = invert_dictionary(tbc.vocab)  # reverse mapping
 
     print('Len vocabulary: %s' % len(tk2id))
 
@@ -84,7 +79,11 @@ def main(max_s_len, save_dir,
     if num_epochs > 0:
         print('Training autoencoder...')
 
-        autoencoder.train(train_tbc,
+        train_batches = train_tbc
+        if bucket_by_length:
+            train_batches = LengthBucketedDataset(train_tbc, 'message', stop_id=tk2id[tbc.stop_token])
+
+        autoencoder.train(train_batches,
                           params={'keep prob': keep_prob, 'learning rate': learning_rate},
                           num_epochs=num_epochs, batch_size=20, verbose=True,
                           validation=val_tbc)
@@ -105,15 +104,17 @@ def main(max_s_len, save_dir,
 
     print('Len predictions: %s' % len(predictions))
 
+    np_originals = np.stack([tbc[index]['message'] for index in train_sample.indices[:len(predictions)]])
+    originals = convert_numpy_array_to_strings(np_originals, id2tk,
+                                               tbc.stop_token,
+                                               keep_stop_token=False)
+
     for index in range(len(predictions)):
         each_prediction = predictions[index]
         each_np_prediction = np_predictions[index,:]
 
-        each_np_original = np.reshape(tbc[train_sample.indices[index]]['message'], newshape=[1, -1])
-
-        each_original = convert_numpy_array_to_strings(each_np_original, id2tk,
-                                                       tbc.stop_token,
-                                                       keep_stop_token=False)[0]
+        each_np_original = np_originals[index:index+1, :]
+        each_original = originals[index]
 
         if index < 10:
 
@@ -140,13 +141,14 @@ def main(max_s_len, save_dir,
     total_reconstructions = len(pred)
     correct_reconstructions = 0
 
+    np_originals = np.stack([tbc[index]['message'] for index in val_tbc.indices[:len(pred)]])
+    originals = convert_numpy_array_to_strings(np_originals, id2tk,
+                                               tbc.stop_token,
+                                               keep_stop_token=False)
+
     for index in range(len(pred)):
         each_prediction = pred[index]
-        each_np_original = np.reshape(tbc[val_tbc.indices[index]]['message'], newshape=[1,-1])
-
-        each_original = convert_numpy_array_to_strings(each_np_original, id2tk,
-                                                    tbc.stop_token,
-                                                    keep_stop_token=False)[0]
+        each_original = originals[index]
 
         if index < 10:
             print('Reconstruction: %s' % each_prediction)
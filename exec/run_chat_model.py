@@ -1,10 +1,13 @@
 """Train and evaluate chat model trained on Cornell Movie Dialogues."""
 import sacred
 from cic.datasets.cmd_one_turn import CornellMovieConversationDataset
-from cic.datasets.text_dataset import convert_numpy_array_to_strings, construct_numpy_from_messages
+from cic.datasets.text_dataset import convert_numpy_array_to_strings
+from cic.utils.token_tools import construct_numpy_from_messages
 from arcadian.dataset import DictionaryDataset
+from cic.datasets.length_bucketing import LengthBucketedDataset
 from cic.models.seq_to_seq import Seq2Seq
 import cic.paths
+from cic.utils.squad_tools import invert_dictionary
 import os
 import numpy as np
 
@@ -66,10 +69,12 @@ if __name__ == '__main__':
         cornell_dir = os.path.join(cic.paths.DATA_DIR, 'cornell_convos/')
 
         talk_to_bot = False
+        bucket_by_length = False  # batch messages of similar length together (not iid, and lengths are measured
+                                  # over the whole dataset before training), and report tokens/sec
 
     @ex.automain
     def main(max_s_len, emb_size, rnn_size, num_epochs, split_frac, num_val_print, regen, n, attention,
-             split_seed, save_dir, restore, cornell_dir, talk_to_bot, max_vocab_len, keep_prob):
+             split_seed, save_dir, restore, cornell_dir, talk_to_bot, max_vocab_len, keep_prob, bucket_by_length):
         print('Starting program')
 
         ds = CornellMovieConversationDataset(max_s_len, reverse_inputs=False, seed='seed',
@@ -85,11 +90,14 @@ if __name__ == '__main__':
                         attention=attention, save_dir=save_dir, restore=restore, tensorboard_name='chat')
 
         if num_epochs > 0:
-            model.train(train_ds, num_epochs=num_epochs, params={'keep_prob': keep_prob})
+            train_batches = train_ds
+            if bucket_by_length:
+                train_batches = LengthBucketedDataset(train_ds, 'message', stop_id=ds.vocab[ds.stop_token])
+            model.train(train_batches, num_epochs=num_epochs, params={'keep_prob': keep_prob})
 
         np_responses = model.generate_responses(val_ds, n=n)
 
-        reverse_vocab = {ds.vocab[k]: k for k in ds.vocab}
+        reverse_vocab = invert_dictionary(ds.vocab)
 
         responses = convert_numpy_array_to_strings(np_responses, reverse_vocab,
                                                 ds.stop_token,
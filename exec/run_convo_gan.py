@@ -7,6 +7,7 @@ from cic.datasets.text_dataset import convert_numpy_array_to_strings
 from cic.models.rnet_gan import ResNetGAN
 from cic.models.tanh_gan import TanhResNetGAN
 from cic.models.seq_to_seq import Seq2Seq
+from cic.utils.token_tools import widen_tokens
 import numpy as np
 import cic.paths as paths
 from arcadian.dataset import DictionaryDataset, MergeDataset, RenameDataset
@@ -85,20 +86,22 @@ def main(max_s_len, emb_size, rnn_size, cornell_dir, max_vocab_len, regen_cmd, n
 
         cmd_contexts = DictionaryDataset({'context': np.load(save_codes_path)})
 
-        sent_ds = DictionaryDataset({'message': cmd.np_targets, 'response': cmd.np_targets})
+        # Token arrays are stored with a narrow dtype, widen them for the model placeholders
+        np_targets = widen_tokens(cmd.np_targets)
+        sent_ds = DictionaryDataset({'message': np_targets, 'response': np_targets})
 
-        messages = DictionaryDataset({'message': cmd.np_contexts})
+        messages = DictionaryDataset({'message': widen_tokens(cmd.np_contexts)})
 
     else:
         cmd = CornellMovieConversationDataset(max_s_len, reverse_inputs=False, seed='seed',
                                              save_dir=cornell_dir, max_vocab_len=max_vocab_len,
                                              regenerate=regen_cmd)
 
-        messages = DictionaryDataset({'message': cmd.messages})
-        responses = DictionaryDataset({'message': cmd.responses})
+        messages = DictionaryDataset({'message': widen_tokens(cmd.messages)})
+        responses = DictionaryDataset({'message': widen_tokens(cmd.responses)})
 
         # Train autoencoder on all messages and responses
-        sents = np.concatenate([cmd.messages, cmd.responses], axis=0)
+        sents = widen_tokens(np.concatenate([cmd.messages, cmd.responses], axis=0))
         sent_ds = DictionaryDataset({'message': sents, 'response': sents.copy()})  # autoencoder has same input and output
 
     t_sent, v_sent = sent_ds.split(t_v_split, seed='seed')
@@ -119,7 +122,7 @@ def main(max_s_len, emb_size, rnn_size, cornell_dir, max_vocab_len, regen_cmd, n
         # If we are using context history, we will insert context representations instead of
         # a sentence vector for the previous utterance.
         l_messages = cmd_contexts
-        responses = DictionaryDataset({'message': cmd.np_targets})
+        responses = DictionaryDataset({'message': widen_tokens(cmd.np_targets)})
     else:
         l_messages = LatentDataset(save_dir=l_message_save_dir, latent_size=rnn_size, data=messages, autoencoder=ae,
                                    regenerate=regen_l_cmd, feature_name='context')
@@ -6,6 +6,7 @@ from cic.datasets.text_dataset import convert_numpy_array_to_strings
 from cic.models.rnet_gan import GaussianRandomDataset
 from cic.models.ext_emb_gan import ExtEmbGAN
 import cic.paths
+from cic.utils.squad_tools import invert_dictionary
 import numpy as np
 import os
 
@@ -35,7 +36,7 @@ def main(max_num_s, max_s_len, save_dir, rnn_size, num_dsc_trains, num_epochs, n
     ds = TorontoBookCorpus(max_s_len, result_path=cic.paths.BOOK_CORPUS_RESULT,
                            min_length=5, max_num_s=max_num_s, keep_unk_sentences=False,
                            vocab_min_freq=5, vocab=None, regenerate=False)
-    inverted_vocab = {ds.vocab[k]: k for k in ds.vocab}
+    inverted_vocab = invert_dictionary(ds.vocab)
 
     sentences = convert_numpy_array_to_strings(ds.data[:num_generate, :], inverted_vocab, stop_token=ds.stop_token,
                                                keep_stop_token=False)
@@ -1,9 +1,11 @@
 """Train and evaluate neural language model on Toronto Book Corpus."""
 
 from cic.datasets.book_corpus import TorontoBookCorpus
+from cic.datasets.length_bucketing import LengthBucketedDataset
 from cic.datasets.text_dataset import convert_numpy_array_to_strings
 from cic.models.nlm import NeuralLanguageModelTraining, NeuralLanguageModelPrediction
 import cic.paths
+from cic.utils.squad_tools import invert_dictionary
 from sacred import Experiment
 import numpy as np
 import os
@@ -28,10 +30,13 @@ def config():
     book_corpus_path = os.path.join(cic.paths.DATA_DIR, 'full_book_corpus/')
     shuffle = True  # shuffle during training
     load_to_mem = False  # load book corpus dataset entirely into memory (don't do for large max_num_s)
+    bucket_by_length = False  # batch sentences of similar length together (not iid, and lengths are measured
+                              # over the whole dataset before training), and report tokens/sec
 
 @ex.automain
 def main(max_num_s, max_len, emb_size, rnn_size, restore, save_dir, regen, shuffle, load_to_mem,
-         num_epochs, num_samples, embs_save_dir, result_save_dir, book_corpus_path, max_vocab_len):
+         num_epochs, num_samples, embs_save_dir, result_save_dir, book_corpus_path, max_vocab_len,
+         bucket_by_length):
 
     ds = TorontoBookCorpus(20, result_path=book_corpus_path,
                            min_length=5, max_num_s=max_num_s, keep_unk_sentences=False,
@@ -48,7 +53,10 @@ def main(max_num_s, max_len, emb_size, rnn_size, restore, save_dir, regen, shuff
     nlm_train.shuffle = shuffle
 
     if num_epochs > 0:
-        nlm_train.train(ds, num_epochs=num_epochs)
+        train_ds = ds
+        if bucket_by_length:
+            train_ds = LengthBucketedDataset(ds, 'message', stop_id=ds.vocab[ds.stop_token])
+        nlm_train.train(train_ds, num_epochs=num_epochs)
 
     print('Generating sentences')
 
@@ -86,7 +94,7 @@ def main(max_num_s, max_len, emb_size, rnn_size, restore, save_dir, regen, shuff
 
     np_messages = np.stack(sampled_sentence_words, axis=1)
 
-    reversed_vocab = {ds.vocab[k]:k for k in ds.vocab}
+    reversed_vocab = invert_dictionary(ds.vocab)
 
     messages = convert_numpy_array_to_strings(np_messages, reversed_vocab,
                                             ds.stop_token,
@@ -9,6 +9,7 @@ import random
 import spacy
 import tensorflow as tf
 from cic.utils import squad_tools as sdt, mdd_tools as mddt
+from cic.datasets.cornell_lines import load_cornell_lines
 
 from cic import paths
 from cic.models import old_autoencoder, old_chat_model, match_lstm
@@ -59,7 +60,7 @@ print('Loading nlp...')
 nlp = spacy.load('en')
 
 print('Loading messages...')
-messages = mddt.load_messages_from_cornell_movie_lines(paths.CORNELL_MOVIE_LINES_FILE, nlp,
+messages = mddt.load_messages_from_cornell_movie_lines(load_cornell_lines(paths.CORNELL_MOVIE_LINES_FILE, nlp),
                                                        max_number_of_messages=MAX_NUMBER_OF_MESSAGES,
                                                        max_message_length=MAX_MSG_LEN,
                                                        stop_token=STOP_TOKEN)
@@ -4,6 +4,7 @@ Model takes as input a history of previous utterances and produces the next utte
 from sacred import Experiment
 from cic.datasets.cmd_history import CornellMovieHistoryDataset
 from cic.datasets.cmd_one_turn import CornellMovieConversationDataset
+from cic.datasets.length_bucketing import LengthBucketedDataset
 from cic.datasets.text_dataset import convert_numpy_array_to_strings
 from cic.models.seq_to_seq import Seq2Seq
 import cic.paths
@@ -27,6 +28,8 @@ def config():
     cmd_save_dir = os.path.join(cic.paths.DATA_DIR, 'cornell_history_convos/')
     save_dir = os.path.join(cic.paths.DATA_DIR, 'cmd_s2sa/')
     attention=False
+    bucket_by_length = False  # batch contexts of similar length together (not iid, and lengths are measured
+                              # over the whole dataset before training), and report tokens/sec
 
     gen_codes_and_save = True  # generate codes for all examples in dataset, save to disk
     save_codes_path = os.path.join(cic.paths.DATA_DIR, 'cmd_context_codes.npy')
@@ -49,7 +52,7 @@ def generate_codes_and_save_to_dir(dataset, model, save_path):
 
 @ex.automain
 def main(max_s_len, max_c_len, vocab_len, word_size, rnn_size, num_epochs, num_s_print, restore, lr,
-         keep_prob, save_dir, attention, gen_codes_and_save, save_codes_path):
+         keep_prob, save_dir, attention, gen_codes_and_save, save_codes_path, bucket_by_length):
 
     ds = CornellMovieHistoryDataset(max_vocab=vocab_len, max_c_len=max_c_len, max_s_len=max_s_len)
 
@@ -72,7 +75,12 @@ def main(max_s_len, max_c_len, vocab_len, word_size, rnn_size, num_epochs, num_s
     s2sa = Seq2Seq(max_c_len, max_s_len, len(ds.vocab), word_size, rnn_size, attention=attention, restore=restore,
                    save_dir=save_dir)
 
-    s2sa.train(train, params={'learning rate': lr, 'keep_prob': keep_prob}, num_epochs=num_epochs)
+    train_batches = train
+    if bucket_by_length:
+        # Contexts are several messages, each ending with a stop token, so every non-zero id is counted
+        train_batches = LengthBucketedDataset(train, 'message', stop_id=None)
+
+    s2sa.train(train_batches, params={'learning rate': lr, 'keep_prob': keep_prob}, num_epochs=num_epochs)
 
     np_val_responses = s2sa.generate_responses(val, n=10)
     val_contexts = convert_numpy_array_to_strings(val.to_numpy('message'), inv_vocab, stop_token='<STOP>')
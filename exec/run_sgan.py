@@ -11,6 +11,7 @@ from cic.datasets.text_dataset import convert_numpy_array_to_strings
 from cic.models.autoencoder import AutoEncoder
 from arcadian.dataset import MergeDataset
 import cic.paths
+from cic.utils.squad_tools import invert_dictionary
 import pickle
 
 ex = Experiment('sentence_gan')
@@ -118,7 +119,7 @@ def main(code_size, regen_latent_ae, max_number_of_sentences, num_gen_layers, nu
 
     assert generated_np_sentences.shape == (len(generated_codes['code']), decoder.max_len)
 
-    reversed_vocab = {ds.vocab[k]:k for k in ds.vocab}
+    reversed_vocab = invert_dictionary(ds.vocab)
 
     generated_sentences = convert_numpy_array_to_strings(generated_np_sentences, reversed_vocab,
                                             ds.stop_token,
@@ -4,6 +4,7 @@ from cic.datasets.cmd_one_turn import CornellMovieConversationDataset
 from cic.models.seq_to_seq import Seq2Seq
 from cic.exec.run_chat_model import generate_response_from_model
 import cic.paths
+from cic.utils.squad_tools import invert_dictionary
 import os
 
 max_s_len = 10
@@ -21,7 +22,7 @@ ds = CornellMovieConversationDataset(max_s_len, reverse_inputs=False, seed='seed
 model = Seq2Seq(max_s_len, len(ds.vocab), emb_size, rnn_size,
                 save_dir=save_dir, restore=True, tensorboard_name='chat')
 
-reverse_vocab = {ds.vocab[k]: k for k in ds.vocab}
+reverse_vocab = invert_dictionary(ds.vocab)
 
 
 def generate_response(msg):
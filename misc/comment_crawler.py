@@ -8,6 +8,7 @@ import praw
 import re
 
 from cic import paths
+from cic.datasets.sentence_filters import Rule, SentenceFilter, forbid_pattern
 
 MAX_COMMENT_LENGTH = 20
 MAX_RAW_COMMENTS = 100000
@@ -58,22 +59,13 @@ for j in range(REPEAT_CRAWL_N_TIMES):
     print('Size of vocabulary: %s' % len(vocab_dict))
 
     # Remove comments with uncommon vocabulary
-    pruned_comments = []
-    for each_comment in raw_comments:
-        comment_in_vocabulary = True
-        each_comment_join = ' '.join(each_comment)
-        clean_comment = re.sub('[^A-Za-z0-9\.\,\!\?\']+', ' ', each_comment_join)
-        for each_token in clean_comment.split():
-            if each_token not in vocab_dict\
-                    or 'sub' in each_token\
-                    or 'reddit' in each_token\
-                    or 'vote' in each_token\
-                    or 'link' in each_token\
-                    or 'account' in each_token\
-                    or '/' in each_token:
-                comment_in_vocabulary = False
-        if comment_in_vocabulary:
-            pruned_comments.append(clean_comment)
+    clean_pattern = re.compile('[^A-Za-z0-9\.\,\!\?\']+')
+    comment_filter = SentenceFilter(
+        [Rule('uncommon vocabulary', lambda comment: all(token in vocab_dict for token in comment.split())),
+         forbid_pattern('reddit terms', 'sub|reddit|vote|link|account|/')],
+        normalize=lambda comment: clean_pattern.sub(' ', ' '.join(comment)))
+    pruned_comments = list(comment_filter.filter(raw_comments))
+    print(comment_filter.report())
 
     num_examples_print = 10
     for each_comment in pruned_comments[:num_examples_print]:
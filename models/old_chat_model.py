@@ -4,7 +4,9 @@ import random
 import unittest2
 import pickle
 import os
-from cic.utils import squad_tools as sdt, mdd_tools as mddt
+from cic.utils import squad_tools as sdt, mdd_tools as mddt, token_tools
+from cic.datasets.cornell_lines import load_cornell_lines
+from cic.datasets.vocabulary import Vocabulary
 
 from cic import paths
 
@@ -44,7 +46,9 @@ class BatchGenerator:
             if real_batch_size == 0:
                 break
 
-            batch = [np_data[self.batch_size*batch_index:self.batch_size*batch_index+real_batch_size] for np_data in self.datas]
+            # Token arrays stored with a narrow dtype are widened for the placeholders a batch at a time
+            batch = [token_tools.widen_tokens(np_data[self.batch_size*batch_index:self.batch_size*batch_index+real_batch_size])
+                     for np_data in self.datas]
             if len(batch) > 1:
                 yield batch
             else:
@@ -54,9 +58,11 @@ class BatchGenerator:
 def preprocess_all_cornell_conversations(nlp, vocab_dict=None, reverse_inputs=True, verbose=True,
                                          keep_duplicates=False, seed='hello world', stop_token='<STOP>',
                                          max_message_length=MAX_MESSAGE_LENGTH, save_dir=None,
-                                         max_vocab_len=None, regen=False):
+                                         max_vocab_len=None, regen=False, near_duplicates=False):
     """All preprocessing of conversational data for run_old_chat_model.py. This function is also
-    intended to be used by run_latent_chat.py"""
+    intended to be used by run_latent_chat.py. If keep_duplicates is False, examples whose message
+    repeats an earlier message are removed, and with near_duplicates also messages which only differ
+    from an earlier one in punctuation (see remove_duplicate_examples)."""
     # seed so that train and validation examples don't get blended together.
     if save_dir is not None and not os.path.exists(save_dir):
         os.makedirs(save_dir)
@@ -71,7 +77,8 @@ def preprocess_all_cornell_conversations(nlp, vocab_dict=None, reverse_inputs=Tr
             print('Number of valid conversations: %s' % len(conversations))
 
             print('Finding messages...')
-        mddt.load_messages_from_cornell_movie_lines_by_id(id_to_message, paths.CORNELL_MOVIE_LINES_FILE, stop_token, nlp)
+        line_store = load_cornell_lines(paths.CORNELL_MOVIE_LINES_FILE, nlp)
+        mddt.load_messages_from_cornell_movie_lines_by_id(id_to_message, line_store, stop_token)
 
         num_messages = len(id_to_message)
         if verbose:
@@ -92,7 +99,8 @@ def preprocess_all_cornell_conversations(nlp, vocab_dict=None, reverse_inputs=Tr
             print('Message max length: %s' % np.max(np_message_lengths))
 
         if vocab_dict is None:
-            vocab_dict = mddt.build_vocabulary_from_messages(id_to_message, max_vocab_len=max_vocab_len)
+            vocab_dict = Vocabulary.from_dict(mddt.build_vocabulary_from_messages(id_to_message,
+                                                                                   max_vocab_len=max_vocab_len))
         vocabulary = sdt.invert_dictionary(vocab_dict)
         vocabulary_length = len(vocab_dict)
         if verbose:
@@ -109,22 +117,11 @@ def preprocess_all_cornell_conversations(nlp, vocab_dict=None, reverse_inputs=Tr
             print('Example example: %s' % str(examples[0]))
             print('Number of examples: %s' % num_examples)
 
-        non_duplicate_messages = []
-        non_duplicate_responses = []
-        num_duplicates = 0
-        for each_example in examples:
-            each_message = each_example[0]
-            each_response = each_example[1]
-            if each_message not in non_duplicate_messages:
-                non_duplicate_messages.append(each_message)
-                non_duplicate_responses.append(each_response)
-            else:
-                num_duplicates += 1
+        non_duplicate_examples, num_duplicates, num_near_duplicates \
+            = remove_duplicate_examples(examples, near_duplicates=near_duplicates, stop_token=stop_token)
         print('Number of duplicate examples: %s' % num_duplicates)
-
-        non_duplicate_examples = [(non_duplicate_message, non_duplicate_response)
-                                  for non_duplicate_message, non_duplicate_response
-                                  in zip(non_duplicate_messages, non_duplicate_responses)]
+        if near_duplicates:
+            print('Number of near-duplicate examples: %s' % num_near_duplicates)
 
         if not keep_duplicates:
             print('Removing duplicate examples')
@@ -136,7 +133,8 @@ def preprocess_all_cornell_conversations(nlp, vocab_dict=None, reverse_inputs=Tr
 
         if verbose:
             print('Constructing input numpy arrays...')
-        np_message, np_response = construct_numpy_from_examples(examples, vocab_dict, max_message_length)
+        np_message, np_response = construct_numpy_from_examples(examples, vocab_dict, max_message_length,
+                                                                dtype=token_tools.token_dtype(len(vocab_dict)))
         # if verbose:
         #     print('Validating inputs...')
         # message_reconstruct = sdt.convert_numpy_array_to_strings(np_message, vocabulary)
@@ -167,31 +165,56 @@ def preprocess_all_cornell_conversations(nlp, vocab_dict=None, reverse_inputs=Tr
     return results
 
 
-def construct_numpy_from_examples(examples, vocab_dict, max_length):
+def remove_duplicate_examples(examples, near_duplicates=False, stop_token=STOP_TOKEN):
+    """Keep the first example of each message. Messages are looked up in a set of token tuples,
+    so this takes linear time.
+
+    Arguments:
+        - examples: list of (message, response) pairs of token lists
+        - near_duplicates: if True, also remove examples whose message equals an earlier one once
+        the stop token and tokens without letters or digits (punctuation) are left out
+        - stop_token: stop token, ignored when comparing near-duplicates
+
+    Returns: list of the (message, response) pairs kept, number of exact duplicates removed and
+    number of near-duplicates removed."""
+    seen_messages = set()
+    seen_normalized = set()
+    non_duplicate_examples = []
+    num_duplicates = 0
+    num_near_duplicates = 0
+    for each_message, each_response in examples:
+        key = tuple(each_message)
+        if key in seen_messages:
+            num_duplicates += 1
+            continue
+        seen_messages.add(key)
+        if near_duplicates:
+            normalized_key = tuple(token for token in each_message
+                                   if token != stop_token and any(c.isalnum() for c in token))
+            if normalized_key in seen_normalized:
+                num_near_duplicates += 1
+                continue
+            seen_normalized.add(normalized_key)
+        non_duplicate_examples.append((each_message, each_response))
+    return non_duplicate_examples, num_duplicates, num_near_duplicates
+
+
+def construct_numpy_from_examples(examples, vocab_dict, max_length, dtype=np.int32):
     """Convert Movie corpus message pairs into numpy arrays by token index
     in vocab_dict."""
     first_messages = [example[0] for example in examples]
     second_messages = [example[1] for example in examples]
-    np_first = construct_numpy_from_messages(first_messages, vocab_dict, max_length)
-    np_second = construct_numpy_from_messages(second_messages, vocab_dict, max_length)
+    np_first = construct_numpy_from_messages(first_messages, vocab_dict, max_length, dtype=dtype)
+    np_second = construct_numpy_from_messages(second_messages, vocab_dict, max_length, dtype=dtype)
     return np_first, np_second
 
 
-def construct_numpy_from_messages(messages, vocab_dict, max_length):
+def construct_numpy_from_messages(messages, vocab_dict, max_length, dtype=np.int32):
     """Construct a numpy array from messages using vocab_dict as a mapping
     from each word to an integer index. If out-of-vocabulary word, it
     uses the <UNK> token!"""
-    m = len(messages)
-    np_messages = np.zeros([m, max_length])
-    for i in range(np_messages.shape[0]):
-        message = messages[i]
-        for j, each_token in enumerate(message):
-            if j < max_length:
-                if each_token in vocab_dict:
-                    np_messages[i, j] = vocab_dict[each_token]
-                else:
-                    np_messages[i, j] = vocab_dict['<UNK>']
-    return np_messages
+    return token_tools.construct_numpy_from_messages(messages, vocab_dict, max_length, unk_token='<UNK>',
+                                                     dtype=dtype)
 
 
 class ChatModelFuncTest(unittest2.TestCase):
@@ -216,6 +239,24 @@ class ChatModelFuncTest(unittest2.TestCase):
         assert np.array_equal(np_first[0, :], np_messages[0, :])
         assert np.array_equal(np_second[0, :], np_messages[1, :])
 
+    def test_construct_numpy_from_messages_unk(self):
+        vocab_dict = {'': 0, '<UNK>': 1, 'i': 2, 'like': 3, 'the': 4, 'park': 5}
+        messages = [['i', 'like', 'walking', 'to', 'the', 'park'], [], ['park']]
+        np_messages = construct_numpy_from_messages(messages, vocab_dict, 4)
+        assert np_messages.dtype == np.int32
+        assert np.array_equal(np_messages, np.array([[2, 3, 1, 1], [0, 0, 0, 0], [5, 0, 0, 0]]))
+
+    def test_remove_duplicate_examples(self):
+        examples = [(['hi', '.', '<STOP>'], ['a']), (['hi', '!', '<STOP>'], ['b']), (['hi', '.', '<STOP>'], ['c']),
+                    (['bye', '<STOP>'], ['d'])]
+        kept, num_duplicates, num_near_duplicates = remove_duplicate_examples(examples)
+        assert [example[1] for example in kept] == [['a'], ['b'], ['d']]
+        assert (num_duplicates, num_near_duplicates) == (1, 0)
+
+        kept, num_duplicates, num_near_duplicates = remove_duplicate_examples(examples, near_duplicates=True)
+        assert [example[1] for example in kept] == [['a'], ['d']]
+        assert (num_duplicates, num_near_duplicates) == (1, 1)
+
     def test_batch_generator(self):
         np_values = np.random.uniform(size=(10, 5))
         gen = BatchGenerator(np_values, 20)
@@ -3,6 +3,7 @@ from arcadian.gm import GenericModel
 from arcadian.dataset import DictionaryDataset
 import tensorflow as tf
 from cic.models.rnet_gan import build_linear_layer
+from cic.utils.token_tools import widen_tokens
 import numpy as np
 
 class Seq2Seq(GenericModel):
@@ -195,7 +196,7 @@ class Seq2Seq(GenericModel):
 
         # Allow Datasets and numpy arrays as input
         if isinstance(msgs, np.ndarray):
-            msgs = DictionaryDataset({'message': msgs})
+            msgs = DictionaryDataset({'message': widen_tokens(msgs)})
 
         codes = self.predict(msgs, outputs=['code'])
 
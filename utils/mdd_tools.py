@@ -4,6 +4,7 @@ import gensim
 import numpy as np
 
 import cic.utils.squad_tools as sdt
+from cic.utils.token_tools import construct_ragged_from_messages, pad_ragged_rows, token_dtype
 
 DELIMITER = ' +++$+++ '
 
@@ -23,31 +24,17 @@ def construct_examples_from_conversations_and_messages(conversations, id_to_mess
     return examples
 
 
-def load_messages_from_cornell_movie_lines(movie_lines_filename, nlp, max_number_of_messages=None,
-                                           max_message_length=None, stop_token=None):
-    movie_lines_file = open(movie_lines_filename, 'rb')
+def load_messages_from_cornell_movie_lines(line_store, max_number_of_messages=None, max_message_length=None,
+                                           stop_token=None):
+    """Returns: list of the tokens of each message in line_store, the pre-parsed store of a movie lines file
+    (see cic.datasets.cornell_lines.load_cornell_lines), followed by stop_token if given."""
     messages = []
-    line_index = 0
-    for message_line in movie_lines_file:
-        if max_number_of_messages is None or line_index < max_number_of_messages:
-            try:
-                message_data = message_line.decode('utf-8').split(DELIMITER)
-                message_id = message_data[0]
-                character_id = message_data[1]
-                movie_id = message_data[2]
-                character_name = message_data[3]
-                message = message_data[4][:-1]
-                tk_message = nlp.tokenizer(message.lower())
-                tk_tokens = [str(token) for token in tk_message if str(token) != ' ']
-                if stop_token is not None:
-                    tk_tokens += [stop_token]
-                if max_message_length is None or len(tk_tokens) <= max_message_length:
-                    messages.append(tk_tokens)
-                    line_index += 1
-            except UnicodeDecodeError:
-                pass
-        else:
+    for row in range(len(line_store)):
+        if max_number_of_messages is not None and len(messages) >= max_number_of_messages:
             break
+        tk_tokens = line_store.tokens(row, stop_token)
+        if max_message_length is None or len(tk_tokens) <= max_message_length:
+            messages.append(tk_tokens)
     return messages
 
 
@@ -76,32 +63,21 @@ def load_cornell_movie_dialogues_dataset(movie_conversations_filename, max_conve
     return conversations, id_to_message
 
 
-def load_messages_from_cornell_movie_lines_by_id(id_to_message, movie_lines_filename, stop_token, nlp):
+def load_messages_from_cornell_movie_lines_by_id(id_to_message, line_store, stop_token):
     """Given a mapping from message ids to none (id_to_message[3] == None), find each message id
-    in the file movie_lines_filename and store in id_to_message in place of None. Add a stop_token character at the
-    end of each message. Pre-process each message by tokenizing with nlp, a spacy tokenizer. Returns nothing."""
-    movie_lines_file = open(movie_lines_filename, 'rb')
-    for message_line in movie_lines_file:
-        try:
-            message_data = message_line.decode('utf-8').split(DELIMITER)
-            message_id = message_data[0]
-            if message_id in id_to_message:
-                character_id = message_data[1]
-                movie_id = message_data[2]
-                character_name = message_data[3]
-                message = message_data[4][:-1]
-                tk_message = nlp.tokenizer(message.lower())
-                tk_tokens = [str(token) for token in tk_message if str(token) != ' '] + [stop_token]
-                id_to_message[message_id] = [character_id, movie_id, character_name, message, tk_tokens]
-        except UnicodeDecodeError:
-            pass
+    in line_store, the pre-parsed store of a movie lines file (see cic.datasets.cornell_lines.load_cornell_lines),
+    and store in id_to_message in place of None. Add a stop_token character at the end of each message.
+    Returns nothing."""
+    for message_id in id_to_message:
+        if message_id in line_store:
+            id_to_message[message_id] = line_store.message_info(message_id, stop_token)
 
 
 def build_vocabulary_from_messages(id_to_message, max_vocab_len=None, unk='<UNK>', stop='<STOP>'):
     """Given dictionary mapping from message ids to
     message strings, produce a vocabulary of all words
-    and return as mapping from each word to its corresponding
-    index in the vocabulary."""
+    and return as a dictionary mapping from each word to its
+    corresponding index."""
 
     print('Pruning at %s words' % max_vocab_len)
     documents = []
@@ -132,31 +108,34 @@ def build_vocabulary_from_messages(id_to_message, max_vocab_len=None, unk='<UNK>
 def conversations_to_numpy(convos, id_to_message, vocab, N, max_s_len, stop='<STOP>', unk='<UNK>',
                            add_stop=True):
     """Convert conversations to a numpy representation using
-    a provided vocabulary."""
+    a provided vocabulary, with the narrowest dtype that holds it.
 
-    np_conversations = np.zeros([len(convos), N, max_s_len], dtype=int)
-    for i in range(len(convos)):
-        msg_ids = convos[i][3]
-        msg_infos = [id_to_message[msg_id] for msg_id in msg_ids]
-        msgs = [msg_info[4] for msg_info in msg_infos if msg_info is not None]
+    The first N messages of all conversations are encoded in one pass over their flattened tokens
+    (see construct_ragged_from_messages), and scattered into their rows at once. Conversations with a
+    message missing from id_to_message are left as zeros. Messages are not modified: with add_stop,
+    the stop token is written after each message in the array, if it fits in max_s_len.
 
-        if len(msg_infos) != len(msgs):
+    Returns: len(convos) x N x max_s_len numpy array of token indices."""
+    dtype = token_dtype(len(vocab))
+    messages = []
+    rows = []  # row of each message in the flattened [len(convos) * N, max_s_len] array
+    for i in range(len(convos)):
+        msg_infos = [id_to_message[msg_id] for msg_id in convos[i][3]]
+        if None in msg_infos:
             # info was not provided for some message in this conversation
             # skip this convo
             continue
-
-        for j in range(len(msgs)):
-            msg_tokens = msgs[j]
-
-            if add_stop:
-                msg_tokens += [stop]
-
-            for k in range(len(msg_tokens)):
-                token = msg_tokens[k]
-                if j < N and k < max_s_len:
-                    if token in vocab:
-                        np_conversations[i, j, k] = vocab[token]
-                    else:
-                        np_conversations[i, j, k] = vocab[unk]
-
+        for j, msg_info in enumerate(msg_infos[:N]):
+            messages.append(msg_info[4])
+            rows.append(i * N + j)
+
+    flat_ids, offsets = construct_ragged_from_messages(messages, vocab, max_s_len, unk_token=unk, dtype=dtype)
+    np_messages = pad_ragged_rows(flat_ids, offsets[:-1], np.diff(offsets), max_s_len)
+    if add_stop:
+        lengths = np.fromiter(map(len, messages), dtype=np.int64, count=len(messages))
+        has_room = lengths < max_s_len
+        np_messages[has_room, lengths[has_room]] = vocab[stop] if stop in vocab else vocab[unk]
+
+    np_conversations = np.zeros([len(convos), N, max_s_len], dtype=dtype)
+    np_conversations.reshape(-1, max_s_len)[np.array(rows, dtype=np.int64)] = np_messages
     return np_conversations
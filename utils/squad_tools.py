@@ -10,6 +10,7 @@ import spacy
 import unittest2
 
 from cic import paths
+from cic.utils.token_tools import convert_numpy_array_to_strings
 
 nlp = None
 
@@ -108,38 +109,6 @@ def remove_excess_spaces_from_paragraphs(paragraphs):
     return clean_paragraphs
 
 
-def convert_numpy_array_to_strings(np_examples, vocabulary, stop_token=None, keep_stop_token=False):
-    """Converts a numpy array of indices into a list of strings.
-
-    np_examples - m x n numpy array of ints, where m is the number of
-    strings encoded by indices, and n is the max length of each string
-    vocab_dict - where vocab_dict[index] gives a word in the vocabulary
-    with that index
-
-    Returns: a list of strings, where each string is constructed from
-    indices in the array as they appear in the vocabulary."""
-    assert stop_token is not None or not keep_stop_token
-    m = np_examples.shape[0]
-    n = np_examples.shape[1]
-    examples = []
-    for i in range(m):
-        each_example = ''
-        for j in range(n):
-            word_index = np_examples[i][j]
-            word = vocabulary[word_index]
-            if stop_token is not None and word == stop_token:
-                if keep_stop_token:
-                    if j > 0:
-                        each_example += ' '
-                    each_example += stop_token
-                break
-            if j > 0 and word != '':
-                each_example += ' '
-            each_example += word
-        examples.append(each_example)
-    return examples
-
-
 def convert_numpy_array_answers_to_strings(np_answers, contexts, answer_is_span=False, zero_stop_token=False):
     """Converts a numpy array of answer indices into a list of strings.
     Indices are taken from the context of each answer.
@@ -183,6 +152,9 @@ def convert_numpy_array_answers_to_strings(np_answers, contexts, answer_is_span=
 
 
 def invert_dictionary(dictionary):
+    # A Vocabulary already stores its tokens in index order, and caches them as an array for decoding
+    if hasattr(dictionary, 'token_array'):
+        return dictionary.token_array()
     inv_dictionary = {v: k for k, v in dictionary.items()}
     return inv_dictionary
 
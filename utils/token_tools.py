@@ -0,0 +1,167 @@
+"""Bulk conversion between tokenized messages and numpy arrays of token indices. Shared by all
+datasets and models that encode text."""
+import itertools
+
+import numpy as np
+
+
+def construct_numpy_from_messages(messages, vocab_dict, max_length, unk_token=None, dtype=np.int32):
+    """Construct a numpy array from messages using vocab_dict as a mapping
+    from each word to an integer index. Messages longer than max_length are cut off,
+    shorter messages are padded with index 0.
+
+    All messages are flattened into a single stream of token indices, with offsets[i] marking
+    where message i starts in the stream. The stream is then written into a preallocated
+    matrix with a single scatter, instead of filling each cell in a Python loop.
+
+    Arguments:
+        - messages: list of messages, where each message is a list of tokens
+        - vocab_dict: mapping from each token to its index
+        - max_length: number of columns of the resulting array
+        - unk_token: out-of-vocabulary tokens are replaced with this token. If None, raise a ValueError instead
+        - dtype: integer type of the resulting array
+
+    Returns: m x max_length numpy array of token indices, where m is the number of messages."""
+    flat_ids, offsets = construct_ragged_from_messages(messages, vocab_dict, max_length, unk_token=unk_token,
+                                                       dtype=dtype)
+    return pad_ragged_rows(flat_ids, offsets[:-1], np.diff(offsets), max_length)
+
+
+def construct_ragged_from_messages(messages, vocab_dict, max_length, unk_token=None, dtype=np.int32):
+    """Like construct_numpy_from_messages, but returns messages in ragged form without padding.
+
+    Returns: (flat_ids, offsets) where flat_ids holds the token indices of all messages back to back,
+    and message i is flat_ids[offsets[i]:offsets[i+1]]."""
+    m = len(messages)
+    lengths = np.fromiter((min(len(message), max_length) for message in messages), dtype=np.int64, count=m)
+    offsets = np.zeros(m + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    num_tokens = int(offsets[-1])
+
+    unk_id = -1
+    if unk_token is not None and unk_token in vocab_dict:
+        unk_id = vocab_dict[unk_token]
+
+    flat_tokens = itertools.chain.from_iterable(message[:max_length] for message in messages)
+    flat_ids = np.fromiter(map(vocab_dict.get, flat_tokens, itertools.repeat(unk_id)), dtype=np.int64,
+                           count=num_tokens)
+
+    if unk_id < 0 and num_tokens > 0:
+        oov_positions = np.flatnonzero(flat_ids < 0)
+        if len(oov_positions) > 0:
+            row = int(np.searchsorted(offsets, oov_positions[0], side='right')) - 1
+            message = messages[row]
+            raise ValueError('Out-of-vocabulary token %s found in string: %s'
+                             % (message[oov_positions[0] - offsets[row]], message))
+
+    return flat_ids.astype(dtype), offsets
+
+
+def pad_ragged_rows(flat_ids, starts, lengths, max_length, dtype=None):
+    """Gather rows of a ragged array into a padded matrix with a single scatter. Row i is
+    flat_ids[starts[i]:starts[i] + lengths[i]], cut off at max_length and padded with index 0.
+
+    Returns: len(starts) x max_length numpy array of token indices."""
+    m = len(starts)
+    lengths = np.minimum(np.asarray(lengths, dtype=np.int64), max_length)
+    row_offsets = np.zeros(m + 1, dtype=np.int64)
+    np.cumsum(lengths, out=row_offsets[1:])
+    num_tokens = int(row_offsets[-1])
+
+    # Position of each token in the flattened output matrix: row * max_length + column
+    columns = np.arange(num_tokens, dtype=np.int64) - np.repeat(row_offsets[:-1], lengths)
+    positions = np.repeat(np.arange(m, dtype=np.int64) * max_length, lengths) + columns
+    sources = np.repeat(np.asarray(starts, dtype=np.int64), lengths) + columns
+
+    np_messages = np.zeros([m, max_length], dtype=flat_ids.dtype if dtype is None else dtype)
+    np_messages.reshape(-1)[positions] = flat_ids[sources]
+    return np_messages
+
+
+def token_dtype(vocab_size):
+    """Returns: the narrowest unsigned integer numpy dtype which holds every index of a vocabulary of
+    vocab_size tokens. Token arrays are stored with this dtype, and widened to FEED_DTYPE a batch at a time
+    (see widen_tokens)."""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if vocab_size - 1 <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+# Integer type of the token placeholders of models
+FEED_DTYPE = np.int32
+
+
+def widen_tokens(np_tokens):
+    """Returns: np_tokens as FEED_DTYPE if it is an array of unsigned token indices stored with a narrow dtype
+    (see token_dtype), otherwise np_tokens unchanged."""
+    if isinstance(np_tokens, np.ndarray) and np_tokens.dtype.kind == 'u':
+        return np_tokens.astype(FEED_DTYPE)
+    return np_tokens
+
+
+def id_to_token_array(vocabulary):
+    """Convert a mapping from index to token into an array, where array[index] gives the token
+    with that index. Indices missing from the mapping are decoded as ''. Arrays and lists are
+    returned as object arrays unchanged, and a Vocabulary returns its cached array."""
+    if hasattr(vocabulary, 'token_array'):
+        return vocabulary.token_array()
+    if isinstance(vocabulary, dict):
+        table = np.full(max(vocabulary.keys(), default=-1) + 1, '', dtype=object)
+        table[np.fromiter(vocabulary.keys(), dtype=np.int64, count=len(vocabulary))] = list(vocabulary.values())
+        return table
+    return np.asarray(vocabulary, dtype=object)
+
+
+def convert_numpy_array_to_strings(np_examples, vocabulary, stop_token=None, keep_stop_token=False,
+                                   as_tokens=False):
+    """Converts a numpy array of indices into a list of strings.
+
+    np_examples - m x n numpy array of ints, where m is the number of
+    strings encoded by indices, and n is the max length of each string
+    vocabulary - where vocabulary[index] gives a word in the vocabulary
+    with that index. Can be a dictionary or an array (see id_to_token_array)
+    as_tokens - if True, return each string as a list of its tokens
+    instead of joining them (saves splitting strings again for scoring)
+
+    All indices are looked up in a single array gather, and the position of the
+    stop token in each row is found in one vectorized pass. Only the final join
+    is done per row.
+
+    Returns: a list of strings, where each string is constructed from
+    indices in the array as they appear in the vocabulary."""
+    assert stop_token is not None or not keep_stop_token
+    np_examples = np.asarray(np_examples).astype(np.int64, copy=False)
+    table = id_to_token_array(vocabulary)
+    m = np_examples.shape[0]
+    n = np_examples.shape[1]
+    np_tokens = table[np_examples]
+
+    # Column of the first stop token in each row, or n if the row has none
+    has_stop = np.zeros(m, dtype=bool)
+    stop_positions = np.full(m, n, dtype=np.int64)
+    if stop_token is not None and m > 0 and n > 0:
+        is_stop = np.isin(np_examples, np.flatnonzero(table == stop_token))
+        has_stop = is_stop.any(axis=1)
+        stop_positions[has_stop] = is_stop.argmax(axis=1)[has_stop]
+
+    examples = []
+    for tokens, stop_position, each_has_stop in zip(np_tokens, stop_positions, has_stop):
+        words = [word for word in tokens[:stop_position] if word != '']
+        keep_stop = keep_stop_token and each_has_stop
+        if as_tokens:
+            if keep_stop:
+                words.append(stop_token)
+            examples.append(words)
+            continue
+
+        each_example = ' '.join(words)
+        # Words after the first column are always preceded by a space, even after empty words
+        if len(words) > 0 and tokens[0] == '':
+            each_example = ' ' + each_example
+        if keep_stop:
+            if stop_position > 0:
+                each_example += ' '
+            each_example += stop_token
+        examples.append(each_example)
+    return examples